@@ -10,6 +10,7 @@ import os
 from drive.types import register, registry
 from ..keys import *
 from ._boot_sector import boot_sector_template
+from stream import as_bytes_stream
 
 
 @register(k_ExtendedPartition)
@@ -32,7 +33,9 @@ def _get_ext_partition_obj(entry, stream, f):
     first_byte_addr = entry[k_first_byte_address]
     while True:
         stream.seek(first_byte_addr, os.SEEK_SET)
-        ebr = boot_sector_template(first_byte_addr).parse_stream(stream)
+        ebr = boot_sector_template(first_byte_addr).parse_stream(
+            as_bytes_stream(stream)
+        )
 
         real_entry, next_ebr_entry = ebr[k_PartitionEntries][:2]
 
@@ -10,6 +10,7 @@
 from .keys import *
 from .boot_sector import ClassicalMBR
 from .types import registry
+from stream import as_bytes_stream
 
 
 def get_drive_obj(stream):
@@ -18,7 +19,7 @@ def get_drive_obj(stream):
     :param stream: the stream containing the bytes of the hard drive.
     """
 
-    mbr = ClassicalMBR.parse_stream(stream)
+    mbr = ClassicalMBR.parse_stream(as_bytes_stream(stream))
 
     def get_partition_obj(partition_entry, stream):
         return registry[partition_entry[k_partition_type]](partition_entry,
@@ -34,3 +35,34 @@ def get_drive_obj(stream):
                 yield partition
         else:
             yield p
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from stream import ImageStream, InstrumentedStream
+
+    parser = argparse.ArgumentParser(
+        description='Read the entries of every partition of an image and '
+                    'print the I/O statistics.'
+    )
+    parser.add_argument('image')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='threads reading FAT32 directories, or '
+                             'processes decoding the NTFS MFT')
+    args = parser.parse_args()
+
+    with InstrumentedStream(ImageStream(args.image)) as stream:
+        for partition in get_drive_obj(stream):
+            partition.ui_handler = lambda *_: _
+            if hasattr(partition, 'workers'):
+                partition.workers = args.workers
+            stream.reset()
+
+            t = time.time()
+            entries = partition.get_entries()
+            print('%s partition: %s entries in %.3fs' % (partition.type,
+                                                          entries.shape[0],
+                                                          time.time() - t))
+            print(partition.io_report())
@@ -8,6 +8,7 @@
 import logging
 
 from misc import SimpleCounter
+from stream import InstrumentedStream
 
 
 counters = {
@@ -58,6 +59,36 @@ class Partition:
     def get_entries(self):
         raise NotImplementedError
 
+    def iter_entry_batches(self, batch_size=64 * 1024):
+        """Iterate over the entries of :meth:`get_entries` in
+        :class:`DataFrame` batches with the same columns, yielded while the
+        partition is being parsed, so that consumers can start early and only
+        a batch is held at a time.
+
+        :param batch_size: optional, number of rows of the batches, the last
+                           one may be shorter.
+        """
+
+        raise NotImplementedError
+
+    def io_stats(self):
+        """Get the I/O statistics of the stream of this partition, see
+        :meth:`InstrumentedStream.stats`. `None` is returned if the stream is
+        not instrumented."""
+
+        if not isinstance(self.stream, InstrumentedStream):
+            return None
+
+        return self.stream.stats()
+
+    def io_report(self):
+        """Same as :meth:`io_stats`, but formatted as text."""
+
+        if not isinstance(self.stream, InstrumentedStream):
+            return None
+
+        return self.stream.report()
+
 
 class EntryMixin:
     def setup_attrs(self, attrs):
@@ -0,0 +1,156 @@
+# encoding: utf-8
+"""
+    drive.fs.cluster_index
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :class:`ClusterIndex`, which maps clusters back to
+    the entries owning them, for FAT32 cluster lists and NTFS data runs alike.
+
+    The runs of all the entries are cut at every run boundary into disjoint
+    segments, each listing the entries covering it. Looking a cluster up is
+    then a binary search over the segment boundaries, and many clusters are
+    looked up at once with a single `numpy.searchsorted`. Runs shared by
+    several entries, e.g. cross-linked FAT32 clusters or clusters of a deleted
+    NTFS file taken over by another one, give segments with several owners.
+
+    An owner is listed once for every segment its run spans, so the index
+    takes space in the number of runs times the number of run boundaries
+    they overlap. Runs rarely overlap, so this is about the number of runs,
+    but a long run across many short ones, e.g. the stale runs of a large
+    deleted file whose clusters were taken over by many small files, takes
+    an item for every short run it covers.
+"""
+import numpy as np
+
+
+class ClusterIndex:
+    """
+    Sorted interval index of the runs of entries: segment `i` spans the
+    clusters from `bounds[i]` up to `bounds[i + 1]` exclusive and is owned by
+    the entries `owner_ids[offsets[i]:offsets[i + 1]]`, in ascending order.
+    """
+    def __init__(self, ids, starts, ends):
+        """
+        :param ids: id of the entry of every run.
+        :param starts: first clusters of the runs.
+        :param ends: last clusters of the runs, inclusive.
+        """
+
+        ids = np.asarray(ids, dtype=np.int64)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        self.bounds = np.unique(np.concatenate([starts, ends + 1]))
+
+        # every run is split into the segments it spans
+        first = np.searchsorted(self.bounds, starts)
+        counts = np.searchsorted(self.bounds, ends + 1) - first
+        total = int(counts.sum())
+        segments = (np.repeat(first, counts) + np.arange(total) -
+                    np.repeat(np.cumsum(counts) - counts, counts))
+        owners = np.repeat(ids, counts)
+
+        order = np.lexsort((owners, segments))
+        segments, owners = segments[order], owners[order]
+
+        # an entry listing the same clusters twice owns them once
+        unique = np.ones(total, dtype=bool)
+        unique[1:] = ((segments[1:] != segments[:-1]) |
+                      (owners[1:] != owners[:-1]))
+
+        self.owner_ids = owners[unique]
+        self.offsets = np.searchsorted(segments[unique],
+                                       np.arange(max(len(self.bounds), 1)))
+
+    @classmethod
+    def from_extents(cls, extents):
+        """Create the index of the entries of a FAT32 partition.
+
+        :param extents: the :class:`ExtentTable` of the entries.
+        """
+
+        return cls(np.repeat(extents.ids, extents.fragment_counts()),
+                   extents.starts, extents.ends)
+
+    @classmethod
+    def from_cluster_lists(cls, ids, cluster_lists):
+        """Create the index of entries from their cluster lists, e.g. the
+        `cluster_list` column of the entries of an NTFS partition.
+
+        :param ids: ids of the entries.
+        :param cluster_lists: cluster list of every entry, as lists of
+                              [start, end] runs.
+        """
+
+        run_ids, starts, ends = [], [], []
+        for id_, cluster_list in zip(ids, cluster_lists):
+            for start, end in cluster_list or ():
+                run_ids.append(id_)
+                starts.append(start)
+                ends.append(end)
+
+        return cls(run_ids, starts, ends)
+
+    def __len__(self):
+        """Number of segments."""
+
+        return max(0, len(self.bounds) - 1)
+
+    def _segments(self, clusters):
+        """Get the segment of every cluster, -1 for the ones outside of all
+        the segments.
+
+        :param clusters: array of clusters.
+        """
+
+        i = np.searchsorted(self.bounds, clusters, side='right') - 1
+        i[i >= len(self)] = -1
+
+        return i
+
+    def lookup(self, clusters):
+        """Get the owner of every cluster, -1 for the clusters no entry owns.
+        For clusters owned by more than one entry, the smallest id is given,
+        see :meth:`owners` for all of them.
+
+        :param clusters: the clusters, a scalar or an array.
+        """
+
+        clusters = np.asarray(clusters, dtype=np.int64)
+        i = self._segments(np.atleast_1d(clusters))
+
+        lo = self.offsets[i]
+        owned = (i >= 0) & (self.offsets[i + 1] > lo)
+
+        out = np.full(len(i), -1, dtype=np.int64)
+        out[owned] = self.owner_ids[lo[owned]]
+
+        return out.reshape(clusters.shape)
+
+    def owners(self, cluster):
+        """Get the ids of all the entries owning a cluster.
+
+        :param cluster: the cluster.
+        """
+
+        i = int(self._segments(np.array([cluster], dtype=np.int64))[0])
+        if i < 0:
+            return []
+
+        return self.owner_ids[self.offsets[i]:self.offsets[i + 1]].tolist()
+
+    def lookup_range(self, start, end):
+        """Get the sorted ids of the entries owning any cluster of a range.
+
+        :param start: first cluster of the range.
+        :param end: last cluster of the range, inclusive.
+        """
+
+        lo, hi = np.searchsorted(self.bounds, [start, end], side='right') - 1
+        lo, hi = max(lo, 0), min(hi, len(self) - 1)
+        if lo > hi:
+            return []
+
+        return np.unique(
+            self.owner_ids[self.offsets[lo]:self.offsets[hi + 1]]
+        ).tolist()
@@ -38,21 +38,23 @@ def get_fat32_partition(stream):
     return FAT32(stream, preceding_bytes=0)
 
 
-def first_clusters_of_fat32(entries):
+def first_clusters_of_fat32(entries, extents):
     """Get the first cluster numbers of the entries representing an FAT32
     partition.
 
     :param entries: entries to get first clusters from.
+    :param extents: the :class:`ExtentTable` of the partition.
     """
 
-    return entries['first_cluster'].tolist()
+    return extents.take(entries.id).first_clusters().tolist()
 
 
-def last_clusters_of_fat32(entries):
+def last_clusters_of_fat32(entries, extents):
     """Get the last cluster numbers of the entries representing an FAT32
     partition.
 
     :param entries: entries to get last clusters from.
+    :param extents: the :class:`ExtentTable` of the partition.
     """
 
-    return map(lambda l: l[-1][-1], entries['cluster_list'].tolist())
+    return extents.take(entries.id).last_clusters().tolist()
@@ -0,0 +1,293 @@
+# encoding: utf-8
+"""
+    drive.fs.fat32.chains
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :func:`resolve_chains`, which resolves the cluster
+    chains of a FAT with NumPy, and :class:`FATChains` holding the result.
+
+    The FAT is taken as a next-pointer array. Clusters pointing to the next
+    cluster are first merged into runs, then every run gets the head of its
+    chain and its distance from the head by pointer jumping. That is a few
+    linear passes over the FAT plus O(r log r) work for r runs, regardless of
+    how the chains are laid out. Clusters pointed to by more than one cluster
+    (cross-links) are treated as the heads of shared segments, and the few
+    chains running into them are stitched together segment by segment
+    afterwards.
+"""
+import numpy as np
+
+
+FREE_CLUSTER = 0
+BAD_CLUSTER = 0x0ffffff7
+EOC_MIN = 0x0ffffff8
+
+
+def _jump(pred, weight, rounds):
+    """Find the root of every node of a forest by pointer jumping.
+
+    :param pred: predecessor of every node, roots point to themselves.
+    :param weight: distance of every node from its predecessor.
+    :param rounds: maximum number of rounds.
+
+    returns (root, distance from the root), nodes on cycles end up anywhere
+    on their cycles.
+    """
+
+    p = pred.copy()
+    d = np.where(p != np.arange(len(p)), weight, 0)
+
+    for _ in range(rounds):
+        pp = p[p]
+        if np.array_equal(pp, p):
+            break
+        d += d[p]
+        p = pp
+
+    return p, d
+
+
+class FATChains:
+    """
+    Cluster chains of a FAT, stored as runs of consecutive clusters in
+    compressed sparse row layout: the runs of the i-th chain are
+    `run_starts[offsets[i]:offsets[i + 1]]` and
+    `run_ends[offsets[i]:offsets[i + 1]]`, both inclusive.
+    """
+    def __init__(self, heads, offsets, run_starts, run_ends,
+                 loops, cross_links, invalid, bad):
+        """
+        :param heads: sorted first clusters of the chains.
+        :param offsets: offsets of the runs of every chain.
+        :param run_starts: first clusters of the runs.
+        :param run_ends: last clusters of the runs.
+        :param loops: heads of the chains which run into a loop.
+        :param cross_links: dict mapping clusters claimed by more than one
+                            chain to the heads of these chains.
+        :param invalid: clusters pointing out of the FAT or to free or bad
+                        clusters, their chains end there.
+        :param bad: clusters marked bad.
+        """
+
+        self.heads = heads
+        self.offsets = offsets
+        self.run_starts = run_starts
+        self.run_ends = run_ends
+
+        self.loops = loops
+        self.cross_links = cross_links
+        self.invalid = invalid
+        self.bad = bad
+
+    def __len__(self):
+        return len(self.heads)
+
+    def __contains__(self, head):
+        i = np.searchsorted(self.heads, head)
+        return i < len(self.heads) and self.heads[i] == head
+
+    def __getitem__(self, head):
+        return self.runs(head)
+
+    def runs(self, head):
+        """Get the runs of the chain starting at the given cluster as a list of
+        [start, end] pairs, like the values of :meth:`to_dict`.
+
+        :param head: first cluster of the chain.
+        """
+
+        if head not in self:
+            raise KeyError(head)
+
+        i = np.searchsorted(self.heads, head)
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+
+        return [[int(s), int(e)] for s, e in zip(self.run_starts[lo:hi],
+                                                 self.run_ends[lo:hi])]
+
+    def to_dict(self):
+        """Get the chains as a dict mapping first clusters to lists of [start,
+        end] runs."""
+
+        starts = self.run_starts.tolist()
+        ends = self.run_ends.tolist()
+        offsets = self.offsets.tolist()
+
+        return {head: [[starts[k], ends[k]]
+                       for k in range(offsets[i], offsets[i + 1])]
+                for i, head in enumerate(self.heads.tolist())}
+
+    def orphan_heads(self, first_clusters):
+        """Get the heads of the chains which no entry starts at, i.e. the
+        chains allocated but not referenced by any directory entry.
+
+        :param first_clusters: first clusters of the known entries.
+        """
+
+        return np.setdiff1d(self.heads,
+                            np.asarray(list(first_clusters), dtype=np.int64))
+
+
+def resolve_chains(fat):
+    """Resolve the cluster chains of a FAT.
+
+    :param fat: the FAT as an array of FAT items with the reserved high 4 bits
+                masked out, e.g. given by :meth:`FAT32.load_fat`.
+    """
+
+    fat = np.asarray(fat, dtype=np.int64)
+    n = len(fat)
+
+    bad = fat == BAD_CLUSTER
+    members = (fat != FREE_CLUSTER) & ~bad
+    members[:2] = False
+
+    pointers = members & (fat < EOC_MIN)
+    target = np.where(pointers & (fat >= 2) & (fat < n), fat, 0)
+    valid = pointers & members[target]
+    invalid = np.flatnonzero(pointers & ~valid)
+
+    src = np.flatnonzero(valid)
+    dst = target[src]
+    indegree = np.bincount(dst, minlength=n)
+
+    # most clusters just point to the next one, the work below is done over
+    # runs of such clusters rather than over the clusters themselves, a
+    # cluster continues the run of the previous one if it's pointed to by it
+    # and nothing else
+    single = indegree[dst] == 1
+    follow = single & (dst == src + 1)
+    follows = np.zeros(n + 1, dtype=bool)
+    follows[dst[follow]] = True
+
+    is_start = members & ~follows[:-1]
+    run_starts = np.flatnonzero(is_start)
+    run_ends = np.flatnonzero(members & ~follows[1:])
+    run_len = run_ends - run_starts + 1
+    runs = np.arange(len(run_starts))
+    run_of = np.cumsum(is_start) - 1
+
+    # every other pointer leaves a run from its end and enters another one at
+    # its start, runs entered by exactly one pointer are chained after the
+    # pointing run, the others (chain heads and cross-linked clusters) start
+    # segments
+    jump = ~follow
+    jump_src = run_of[src[jump]]
+    jump_dst = run_of[dst[jump]]
+
+    run_succ = np.full(len(runs), -1, dtype=np.int64)
+    run_succ[jump_src] = jump_dst
+
+    run_pred = runs.copy()
+    run_pred[jump_dst[single[jump]]] = jump_src[single[jump]]
+    is_root = np.ones(len(runs), dtype=bool)
+    is_root[jump_dst[single[jump]]] = False
+
+    rounds = max(1, n.bit_length()) + 1
+    run_root, run_dist = _jump(run_pred, run_len[run_pred], rounds)
+
+    # runs never reaching a root lie on loops no chain runs into, each of these
+    # loops is cut at its smallest cluster, which always starts a run and then
+    # heads the loop
+    loop_heads = []
+    on_loop = np.flatnonzero(~is_root[run_root])
+    if len(on_loop):
+        seen = np.zeros(len(runs), dtype=bool)
+        for r in on_loop.tolist():
+            if seen[r]:
+                continue
+            loop_heads.append(int(run_starts[r]))
+            run_pred[r] = r
+            is_root[r] = True
+
+            x = r
+            while not seen[x]:
+                seen[x] = True
+                x = run_succ[x]
+
+        run_root, run_dist = _jump(run_pred, run_len[run_pred], rounds)
+
+    # runs of every segment in chain order, every run is put where the
+    # clusters of its segment start plus its distance from the segment root,
+    # which saves sorting them
+    seg_size = np.bincount(run_root, weights=run_len,
+                           minlength=len(runs)).astype(np.int64)
+    slots = np.full(int(seg_size.sum()), -1, dtype=np.int64)
+    slots[(np.cumsum(seg_size) - seg_size)[run_root] + run_dist] = runs
+    order = slots[slots >= 0]
+
+    seg_roots = np.flatnonzero(seg_size)
+    seg_len = np.bincount(run_root, minlength=len(runs))[seg_roots]
+    seg_first = np.cumsum(seg_len) - seg_len
+    seg_of = np.full(len(runs), -1, dtype=np.int64)
+    seg_of[seg_roots] = np.arange(len(seg_roots))
+
+    # where the segment continues after its last run, if anywhere
+    tails = run_succ[order[seg_first + seg_len - 1]]
+    seg_next = np.where(tails >= 0, seg_of[tails], -1)
+
+    heads = np.flatnonzero(members & (indegree == 0))
+    if loop_heads:
+        heads = np.union1d(heads, loop_heads)
+
+    # the segments of the chains, as (chain, segment) pairs, only the chains
+    # running into cross-links or loops need more than one segment
+    chain_ids = np.arange(len(heads))
+    seg_ids = seg_of[run_of[heads]]
+
+    loops = []
+    more = np.flatnonzero(seg_next[seg_ids] >= 0)
+    if len(more):
+        extra_chains, extra_segs = [], []
+        for i in more.tolist():
+            s = int(seg_ids[i])
+            seen = {s}
+            s = int(seg_next[s])
+            while s >= 0:
+                if s in seen:
+                    loops.append(int(heads[i]))
+                    break
+                seen.add(s)
+                extra_chains.append(i)
+                extra_segs.append(s)
+                s = int(seg_next[s])
+
+        chain_ids = np.concatenate([chain_ids, extra_chains]).astype(np.int64)
+        seg_ids = np.concatenate([seg_ids, extra_segs]).astype(np.int64)
+        # stable, so the segments stay in chain order
+        order_ = np.argsort(chain_ids, kind='stable')
+        chain_ids, seg_ids = chain_ids[order_], seg_ids[order_]
+
+    cross_links = {}
+    shared = indegree[run_starts[seg_roots[seg_ids]]] > 1
+    for i, s in zip(chain_ids[shared].tolist(), seg_ids[shared].tolist()):
+        c = int(run_starts[seg_roots[s]])
+        cross_links.setdefault(c, []).append(int(heads[i]))
+    # a loop running back into its own chain isn't a cross-link
+    cross_links = {c: h for c, h in cross_links.items() if len(set(h)) > 1}
+
+    # lay the runs of the chains out one after another and merge the runs
+    # which happen to be consecutive
+    lengths = seg_len[seg_ids]
+    total = int(lengths.sum())
+    chain_of = np.repeat(chain_ids, lengths)
+    pos = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    laid = order[np.repeat(seg_first[seg_ids], lengths) + pos]
+    starts, ends = run_starts[laid], run_ends[laid]
+
+    breaks = np.ones(total, dtype=bool)
+    breaks[1:] = ((starts[1:] != ends[:-1] + 1) |
+                  (chain_of[1:] != chain_of[:-1]))
+    last = np.ones(total, dtype=bool)
+    last[:-1] = breaks[1:]
+
+    offsets = np.searchsorted(chain_of[breaks], np.arange(len(heads) + 1))
+
+    return FATChains(heads.astype(np.uint32),
+                     offsets.astype(np.int64),
+                     starts[breaks].astype(np.uint32),
+                     ends[last].astype(np.uint32),
+                     sorted(loops),
+                     cross_links,
+                     invalid.astype(np.uint32),
+                     np.flatnonzero(bad).astype(np.uint32))
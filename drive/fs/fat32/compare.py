@@ -0,0 +1,132 @@
+# encoding: utf-8
+"""
+    drive.fs.fat32.compare
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :func:`compare_fats`, which compares the two copies
+    of the FAT of a FAT32 partition with NumPy, and :class:`FATComparison`
+    holding the result.
+
+    The copies are compared item by item in a single pass. Only if they
+    differ are the cluster chains of both resolved and compared run by run, so
+    the usual case of identical copies costs no more than reading them.
+"""
+import numpy as np
+
+from .chains import resolve_chains
+
+
+def _positions(lengths):
+    """Get the positions of the items of consecutive groups within their
+    groups, e.g. [0, 1, 2, 0, 1] for the lengths [3, 2].
+
+    :param lengths: the lengths of the groups.
+    """
+
+    total = int(lengths.sum())
+    return np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+
+def differing_chains(chains1, chains2):
+    """Get the sorted first clusters of the chains which differ between two
+    FATs, i.e. the chains starting in only one of them and the ones with
+    different runs in each.
+
+    :param chains1: the chains of the first FAT, see :class:`FATChains`.
+    :param chains2: the chains of the second FAT.
+    """
+
+    heads1, heads2 = chains1.heads, chains2.heads
+    only = np.setxor1d(heads1, heads2, assume_unique=True)
+
+    common, i1, i2 = np.intersect1d(heads1, heads2, assume_unique=True,
+                                    return_indices=True)
+    counts1 = np.diff(chains1.offsets)[i1]
+    counts2 = np.diff(chains2.offsets)[i2]
+    differ = counts1 != counts2
+
+    # the chains with as many runs in each FAT are compared run by run
+    same = np.flatnonzero(~differ)
+    lengths = counts1[same]
+    pos = _positions(lengths)
+    runs1 = np.repeat(chains1.offsets[i1[same]], lengths) + pos
+    runs2 = np.repeat(chains2.offsets[i2[same]], lengths) + pos
+
+    mismatch = ((chains1.run_starts[runs1] != chains2.run_starts[runs2]) |
+                (chains1.run_ends[runs1] != chains2.run_ends[runs2]))
+    chain_of = np.repeat(np.arange(len(same)), lengths)
+    differ[same[np.bincount(chain_of[mismatch],
+                            minlength=len(same)) > 0]] = True
+
+    return np.union1d(only, common[differ]).astype(np.uint32)
+
+
+class FATComparison:
+    """
+    Differences between the two FATs of a partition, see :func:`compare_fats`.
+    """
+    def __init__(self, clusters, items1, items2, chains):
+        """
+        :param clusters: the clusters whose items differ.
+        :param items1: the items of these clusters in the first FAT.
+        :param items2: the items of these clusters in the second FAT.
+        :param chains: the first clusters of the chains which differ, see
+                       :func:`differing_chains`.
+        """
+
+        self.clusters = clusters
+        self.items1 = items1
+        self.items2 = items2
+        self.chains = chains
+
+    def __len__(self):
+        return len(self.clusters)
+
+    def __bool__(self):
+        return len(self.clusters) > 0
+
+    def files(self, entries):
+        """Get the entries whose cluster chains differ between the FATs.
+
+        :param entries: entries of the partition, see
+                        :meth:`FAT32.get_entries`.
+        """
+
+        return entries[entries['first_cluster'].isin(self.chains.tolist())]
+
+
+def compare_fats(fat1, fat2, chains1=None, chains2=None):
+    """Compare the two FATs of a partition.
+
+    :param fat1: the first FAT as an array of FAT items with the reserved
+                 high 4 bits masked out, e.g. given by :meth:`FAT32.load_fat`.
+    :param fat2: the second FAT, the same way.
+    :param chains1: optional, the chains of the first FAT if already
+                    resolved, see :func:`resolve_chains`.
+    :param chains2: optional, the chains of the second FAT if already
+                    resolved.
+    """
+
+    n = min(len(fat1), len(fat2))
+    clusters = np.flatnonzero(fat1[:n] != fat2[:n])
+    # the items beyond the shorter of them, e.g. of a truncated image, are
+    # taken as differing
+    extra = np.arange(n, max(len(fat1), len(fat2)))
+    clusters = np.concatenate([clusters, extra]).astype(np.uint32)
+
+    def items(fat):
+        out = np.zeros(len(clusters), dtype=np.uint32)
+        found = clusters < len(fat)
+        out[found] = fat[clusters[found]]
+        return out
+
+    if not len(clusters):
+        chains = np.zeros(0, dtype=np.uint32)
+    else:
+        if chains1 is None:
+            chains1 = resolve_chains(fat1)
+        if chains2 is None:
+            chains2 = resolve_chains(fat2)
+        chains = differing_chains(chains1, chains2)
+
+    return FATComparison(clusters, items(fat1), items(fat2), chains)
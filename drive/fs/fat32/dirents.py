@@ -0,0 +1,203 @@
+# encoding: utf-8
+"""
+    drive.fs.fat32.dirents
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :class:`DirectoryRecords`, which decodes the 32-byte
+    entries of a whole FAT32 directory at once with NumPy, and
+    :func:`assemble_names`, which names them.
+
+    Everything but the names is taken out of the records column by column, so
+    a directory decodes at memory speed however many entries it holds. The
+    long filename state machine runs in the directory walker of
+    :mod:`drive.fs.fat32.speedup`, only the decoding of the names is left to
+    Python.
+"""
+import numpy as np
+
+from drive.keys import *
+from .speedup import walk_directory
+from .timestamps import decode_timestamps
+
+
+ENTRY_SIZE = 32
+
+ATTR_LFN = 0x0f
+ATTR_LABEL = 0x0b
+ATTR_DIRECTORY = 0x10
+
+MARK_BLANK = 0x00
+MARK_DELETED = 0xe5
+
+DIRECTORY_ENTRY = np.dtype([(k_short_file_name, 'V8'),
+                            (k_short_extension, 'V3'),
+                            (k_attribute, 'u1'),
+                            ('reserved', 'u1'),
+                            (k_create_time_10ms, 'u1'),
+                            (k_create_time, '<u2'),
+                            (k_create_date, '<u2'),
+                            (k_access_date, '<u2'),
+                            (k_higher_cluster, '<u2'),
+                            (k_modify_time, '<u2'),
+                            (k_modify_date, '<u2'),
+                            (k_lower_cluster, '<u2'),
+                            (k_file_length, '<u4')])
+
+LONG_FILENAME_ENTRY = np.dtype([(k_sequence_number, 'u1'),
+                                (k_name_1, 'V10'),
+                                (k_attribute, 'u1'),
+                                (k_type, 'u1'),
+                                (k_checksum, 'u1'),
+                                (k_name_2, 'V12'),
+                                ('first_cluster', '<u2'),
+                                (k_name_3, 'V4')])
+
+class DirectoryRecords:
+    """
+    The entries of a directory, decoded from its raw clusters. Every column is
+    an array with one item per 32-byte record, blank, long filename and
+    deleted entries included, which are told apart with the masks.
+    """
+    def __init__(self, buf):
+        """
+        :param buf: the content of the directory, a trailing partial record is
+                    ignored.
+        """
+
+        count = len(buf) // ENTRY_SIZE
+
+        self.raw = np.frombuffer(buf, dtype=np.uint8,
+                                 count=count * ENTRY_SIZE).reshape(count,
+                                                                   ENTRY_SIZE)
+        self.entries = self.raw.view(DIRECTORY_ENTRY).reshape(count)
+        self.lfn_entries = self.raw.view(LONG_FILENAME_ENTRY).reshape(count)
+
+        marks = self.raw[:, 0]
+        self.attribute = self.entries[k_attribute]
+
+        self.blank = marks == MARK_BLANK
+        self.deleted = marks == MARK_DELETED
+        self.lfn = ~self.blank & (self.attribute == ATTR_LFN)
+        self.short = ~self.blank & ~self.lfn
+
+        self.is_directory = (self.attribute & ATTR_DIRECTORY) != 0
+        self.first_cluster = (
+            self.entries[k_higher_cluster].astype(np.uint32) << 16 |
+            self.entries[k_lower_cluster]
+        )
+        self.file_length = self.entries[k_file_length]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def timestamps(self, tz_offset=None):
+        """Decode the timestamps of the records, see
+        :func:`decode_timestamps`. Returns a dict mapping `create_time`,
+        `modify_time` and `access_date` to (timestamps, invalid mask).
+
+        :param tz_offset: optional, offset added to the timestamps.
+        """
+
+        e = self.entries
+
+        return {
+            k_create_time: decode_timestamps(e[k_create_date],
+                                             e[k_create_time],
+                                             e[k_create_time_10ms],
+                                             tz_offset=tz_offset),
+            k_modify_time: decode_timestamps(e[k_modify_date],
+                                             e[k_modify_time],
+                                             tz_offset=tz_offset),
+            k_access_date: decode_timestamps(e[k_access_date],
+                                             tz_offset=tz_offset)
+        }
+
+    def short_name(self, i):
+        """Get the raw 8.3 name of a record as (name, extension).
+
+        :param i: index of the record.
+        """
+
+        row = self.raw[i]
+
+        return row[:8].tobytes(), row[8:11].tobytes()
+
+
+def _short_file_name(records, i):
+    """Get the name of a short entry from its 8.3 name, lowered as Windows
+    shows them, raises :class:`UnicodeDecodeError`.
+
+    :param records: the :class:`DirectoryRecords`.
+    :param i: index of the entry.
+    """
+
+    name, ext = records.short_name(i)
+    name = name.strip()
+
+    if records.deleted[i]:
+        # TODO add a function which tries both gbk and unicode to decode
+        # TODO the file names
+        name = '(deleted) ' + str(name[1:], encoding='gbk')
+    else:
+        name = str(name, encoding='gbk')
+
+    if not records.is_directory[i]:
+        ext = str(ext.strip(), encoding='gbk')
+        name = '.'.join((name, ext)).strip('.')
+
+    return name.lower()
+
+
+def assemble_names(records, logger):
+    """Get the names of the short entries of a directory, joining the long
+    filename entries preceding them, see :func:`walk_directory`.
+
+    Returns (indices, names, undecodable), `indices` being the records of the
+    short entries named. A long filename entry with a wrong checksum means the
+    directory is corrupted, the entries after it are dropped. Undecodable 8.3
+    names are kept as raw escapes, their indices are in `undecodable`.
+
+    :param records: the :class:`DirectoryRecords` of the directory.
+    :param logger: logger of the partition.
+    """
+
+    indices, has_lfn, offsets, chars, counters = walk_directory(records.raw)
+
+    if counters['overwritten']:
+        logger.warning('detected %d overwritten LFN(s)',
+                       counters['overwritten'])
+    if counters['orphaned']:
+        logger.warning('found %d invalid LFN non-starting entries',
+                       counters['orphaned'])
+    if counters['checksum']:
+        logger.warning('dropped %d LFN(s) not matching the checksum of their '
+                       '8.3 names', counters['checksum'])
+
+    indices = indices.tolist()
+    deleted = records.deleted[indices].tolist()
+    offsets = (offsets * 2).tolist()
+    chars = chars.astype('<u2').tobytes()
+
+    names, undecodable = [], []
+
+    for k, (i, lfn) in enumerate(zip(indices, has_lfn.tolist())):
+        if lfn:
+            try:
+                name = str(chars[offsets[k]:offsets[k + 1]],
+                           encoding='utf-16-le')
+            except UnicodeDecodeError:
+                name = 'unicode decode error'
+            if deleted[k]:
+                name = '(deleted) ' + name
+        else:
+            try:
+                name = _short_file_name(records, i)
+            except UnicodeDecodeError:
+                short_name, _ = records.short_name(i)
+                name = str(short_name[1 if deleted[k] else 0:],
+                           encoding='raw_unicode_escape')
+                undecodable.append(i)
+
+        names.append(name)
+
+    return indices, names, undecodable
@@ -0,0 +1,197 @@
+# encoding: utf-8
+"""
+    drive.fs.fat32.extents
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :class:`ExtentTable`, which stores the cluster lists
+    of the entries of a FAT32 partition in compressed sparse row layout.
+"""
+import numpy as np
+
+
+class ExtentTable:
+    """
+    Cluster lists of entries, as runs of consecutive clusters: the runs of the
+    i-th row are `starts[offsets[i]:offsets[i + 1]]` and
+    `ends[offsets[i]:offsets[i + 1]]`, both inclusive. Rows are identified by
+    the ids of the entries.
+    """
+    def __init__(self, ids, offsets, starts, ends):
+        """
+        :param ids: ids of the entries of the rows.
+        :param offsets: offsets of the runs of every row.
+        :param starts: first clusters of the runs.
+        :param ends: last clusters of the runs.
+        """
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.starts = np.asarray(starts, dtype=np.uint32)
+        self.ends = np.asarray(ends, dtype=np.uint32)
+
+        # rows can be in any order, ids are looked up through their sort order
+        self._order = np.argsort(self.ids, kind='stable')
+        self._sorted_ids = self.ids[self._order]
+
+    @classmethod
+    def from_chains(cls, chains, ids, first_clusters):
+        """Create the table of entries from the cluster chains of the FAT.
+        Entries not starting at the head of a chain get empty rows.
+
+        :param chains: the :class:`FATChains` of the FAT.
+        :param ids: ids of the entries.
+        :param first_clusters: first clusters of the entries.
+        """
+
+        first_clusters = np.asarray(first_clusters, dtype=np.int64)
+
+        i = np.searchsorted(chains.heads, first_clusters)
+        found = i < len(chains.heads)
+        found[found] = chains.heads[i[found]] == first_clusters[found]
+        i[~found] = 0
+
+        counts = np.where(found, chains.offsets[i + 1] - chains.offsets[i], 0)
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        # index of every run of every row into the runs of the chains
+        runs = (np.repeat(chains.offsets[i] - offsets[:-1], counts) +
+                np.arange(offsets[-1]))
+
+        return cls(ids, offsets, chains.run_starts[runs],
+                   chains.run_ends[runs])
+
+    @classmethod
+    def concat(cls, tables):
+        """Join tables one after another.
+
+        :param tables: the tables, ids have to be distinct across them.
+        """
+
+        if not tables:
+            return cls([], [0], [], [])
+
+        ends = np.cumsum([t.offsets[-1] for t in tables]) - \
+            [t.offsets[-1] for t in tables]
+        offsets = [t.offsets[:-1] + end for t, end in zip(tables, ends)]
+        offsets.append([ends[-1] + tables[-1].offsets[-1]])
+
+        return cls(np.concatenate([t.ids for t in tables]),
+                   np.concatenate(offsets),
+                   np.concatenate([t.starts for t in tables]),
+                   np.concatenate([t.ends for t in tables]))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _rows(self, ids):
+        """Get the rows of the given ids.
+
+        :param ids: ids of entries.
+        """
+
+        ids = np.asarray(ids, dtype=np.int64)
+
+        i = np.searchsorted(self._sorted_ids, ids)
+        if (i >= len(self.ids)).any() or (self._sorted_ids[i] != ids).any():
+            raise KeyError('Unknown entry ids')
+
+        return self._order[i]
+
+    def take(self, ids):
+        """Get the table of the given entries, in the given order.
+
+        :param ids: ids of the entries, e.g. `entries.id`.
+        """
+
+        rows = self._rows(ids)
+
+        counts = self.offsets[rows + 1] - self.offsets[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        runs = (np.repeat(self.offsets[rows] - offsets[:-1], counts) +
+                np.arange(offsets[-1]))
+
+        return ExtentTable(self.ids[rows], offsets,
+                           self.starts[runs], self.ends[runs])
+
+    def runs(self, id_):
+        """Get the cluster list of an entry as a list of [start, end] runs.
+
+        :param id_: id of the entry.
+        """
+
+        row = self._rows([id_])[0]
+        lo, hi = self.offsets[row], self.offsets[row + 1]
+
+        return [[int(s), int(e)] for s, e in zip(self.starts[lo:hi],
+                                                 self.ends[lo:hi])]
+
+    def _reduce(self, ufunc, values, empty):
+        """Reduce the values of the runs of every row.
+
+        :param ufunc: the ufunc to reduce with, e.g. `numpy.add`.
+        :param values: a value per run.
+        :param empty: value of rows without runs.
+        """
+
+        non_empty = self.offsets[1:] > self.offsets[:-1]
+        out = np.full(len(self), empty, dtype=values.dtype)
+        if len(values):
+            out[non_empty] = ufunc.reduceat(values,
+                                            self.offsets[:-1][non_empty])
+
+        return out
+
+    def cluster_counts(self):
+        """Number of clusters of every row."""
+
+        return self._reduce(np.add,
+                            self.ends.astype(np.int64) - self.starts + 1, 0)
+
+    def fragment_counts(self):
+        """Number of runs of every row."""
+
+        return np.diff(self.offsets)
+
+    def first_clusters(self):
+        """First cluster of every row, 0 for empty rows."""
+
+        non_empty = self.offsets[1:] > self.offsets[:-1]
+        out = np.zeros(len(self), dtype=np.uint32)
+        out[non_empty] = self.starts[self.offsets[:-1][non_empty]]
+
+        return out
+
+    def last_clusters(self):
+        """Last cluster of every row, 0 for empty rows."""
+
+        non_empty = self.offsets[1:] > self.offsets[:-1]
+        out = np.zeros(len(self), dtype=np.uint32)
+        out[non_empty] = self.ends[self.offsets[1:][non_empty] - 1]
+
+        return out
+
+    def min_clusters(self):
+        """Smallest cluster of every row, 0 for empty rows."""
+
+        return self._reduce(np.minimum, self.starts, 0)
+
+    def max_clusters(self):
+        """Largest cluster of every row, 0 for empty rows."""
+
+        return self._reduce(np.maximum, self.ends, 0)
+
+    def avg_clusters(self):
+        """Average cluster of every row, 0 for empty rows."""
+
+        starts = self.starts.astype(np.float64)
+        ends = self.ends.astype(np.float64)
+
+        sums = self._reduce(np.add, (ends - starts + 1) * (ends + starts) / 2,
+                            0.)
+        counts = self.cluster_counts()
+
+        return np.divide(sums, counts, out=np.zeros(len(self)),
+                         where=counts > 0)
@@ -2,7 +2,7 @@
 import matplotlib.pyplot as plt
 
 
-def plot_fat32(entries,
+def plot_fat32(entries, extents,
                figure=None, subplot_n=111,
                log_info=True, logger=None,
                plot_average_cluster=True,
@@ -12,6 +12,7 @@ def plot_fat32(entries,
     the entries according to your will before call this function.
 
     :param entries: entries to plot against.
+    :param extents: the :class:`ExtentTable` of the partition.
     :param figure: optional, a figure object to plot on.
     :param subplot_n: optional, subplot number.
     :param log_info: optional, whether to log file information during preparing
@@ -21,37 +22,27 @@ def plot_fat32(entries,
     :param show: whether showing the graph after plotting.
     """
 
-    x, y, y_prime, y_err = [], [], [], [[], []],
+    extents = extents.take(entries.id)
 
-    _p = logger.info if logger else print
-
-    for _i, (_, obj) in enumerate(entries.iterrows()):
-        i = _i
-
-        x.append(i)
-
-        if plot_first_cluster:
-            y_prime.append(obj.first_cluster)
+    x = range(len(entries))
+    y_prime = extents.first_clusters()
+    y = extents.avg_clusters()
+    y_err = [y - extents.min_clusters(), extents.max_clusters() - y]
 
-        if plot_average_cluster:
-            y.append(obj.avg_cluster)
-
-            min_cluster = min(map(lambda x: min(*x), obj.cluster_list))
-            max_cluster = max(map(lambda x: max(*x), obj.cluster_list))
-
-            y_err[0].append(y[-1] - min_cluster)
-            y_err[1].append(max_cluster - y[-1])
+    _p = logger.info if logger else print
 
-        if log_info:
+    if log_info:
+        for i, obj, count in zip(x, entries.itertuples(),
+                                 extents.cluster_counts()):
             _p('found FDT entry %s:\n'
                '\tfp: %s\n'
                '\tfc: %s\tac: %s\toc: %s\n'
                '\tcr: %s\n'
                '\tmd: %s\n' % (i,
                                obj.full_path,
-                               obj.first_cluster,
-                               obj.avg_cluster,
-                               sum(e - s + 1 for s, e in obj.cluster_list),
+                               y_prime[i],
+                               y[i],
+                               count,
                                obj.create_time,
                                obj.modify_time))
 
@@ -1 +1,11 @@
 # encoding: utf-8
+try:
+    from ._walker import walk_directory
+except ImportError:
+    # not built, see README.md
+    from .walker import walk_directory
+
+from .walker import lfn_checksum
+
+
+__all__ = ['walk_directory', 'lfn_checksum']
@@ -0,0 +1,113 @@
+# encoding: utf-8
+# cython: boundscheck=False, wraparound=False
+"""
+    drive.fs.fat32.speedup._walker
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This is a cython module, which implements the directory walker of
+    :mod:`drive.fs.fat32.speedup.walker` in C, see :func:`walk_directory`
+    there.
+"""
+import numpy as np
+cimport numpy as np
+
+DEF ATTR_LFN = 0x0f
+DEF MARK_BLANK = 0x00
+DEF MARK_DELETED = 0xe5
+DEF LFN_FIRST = 0x40
+
+cdef int *LFN_CHAR_OFFSETS = [1, 3, 5, 7, 9, 14, 16, 18, 20, 22, 24, 28, 30]
+
+
+cdef inline unsigned char lfn_checksum(const unsigned char[:, ::1] raw,
+                                       Py_ssize_t i):
+    cdef unsigned char sum_ = 0
+    cdef int k
+    for k in range(11):
+        sum_ = (((sum_ & 1) << 7) + (sum_ >> 1) + raw[i, k]) & 0xff
+
+    return sum_
+
+
+def walk_directory(const unsigned char[:, ::1] raw):
+    """Run the long filename state machine over the records of a directory,
+    see :func:`drive.fs.fat32.speedup.walker.walk_directory`.
+
+    :param raw: the records, a (n, 32) `numpy.uint8` array.
+    """
+
+    cdef Py_ssize_t n = raw.shape[0]
+
+    cdef np.ndarray[np.int64_t] indices = np.empty(n, dtype=np.int64)
+    cdef np.ndarray[np.uint8_t, cast=True] has_lfn = np.zeros(n, dtype=bool)
+    cdef np.ndarray[np.int64_t] offsets = np.zeros(n + 1, dtype=np.int64)
+    cdef np.ndarray[np.uint16_t] chars = np.empty(n * 13, dtype=np.uint16)
+    cdef np.ndarray[np.int64_t] parts = np.empty(n, dtype=np.int64)
+
+    cdef Py_ssize_t i, k, p, count = 0, n_chars = 0, n_parts = 0
+    cdef int j
+    cdef unsigned char mark
+    cdef unsigned short c
+    cdef bint in_lfn = False, checksum_known = False, named
+    cdef unsigned char checksum = 0
+
+    cdef long overwritten = 0, orphaned = 0, mismatched = 0, aborted = 0
+
+    for i in range(n):
+        mark = raw[i, 0]
+        if mark == MARK_BLANK:
+            continue
+
+        if raw[i, 11] == ATTR_LFN:
+            if mark == MARK_DELETED:
+                in_lfn = True
+            elif mark & LFN_FIRST:
+                if in_lfn:
+                    overwritten += 1
+                    n_parts = 0
+                    checksum = 0
+
+                in_lfn = True
+                checksum, checksum_known = raw[i, 13], True
+            else:
+                if not in_lfn:
+                    orphaned += 1
+
+                if checksum != raw[i, 13]:
+                    aborted = 1
+                    break
+
+            parts[n_parts] = i
+            n_parts += 1
+            continue
+
+        indices[count] = i
+
+        named = in_lfn
+        if (named and checksum_known and mark != MARK_DELETED and
+                lfn_checksum(raw, i) != checksum):
+            mismatched += 1
+            named = False
+
+        if named:
+            for p in range(n_parts - 1, -1, -1):
+                k = parts[p]
+                for j in range(13):
+                    c = (raw[k, LFN_CHAR_OFFSETS[j]] |
+                         raw[k, LFN_CHAR_OFFSETS[j] + 1] << 8)
+                    if c == 0:
+                        break
+                    chars[n_chars] = c
+                    n_chars += 1
+        has_lfn[count] = named
+        count += 1
+        offsets[count] = n_chars
+
+        in_lfn = False
+        checksum_known = False
+        n_parts = 0
+
+    return (indices[:count].copy(), has_lfn[:count].copy(),
+            offsets[:count + 1].copy(), chars[:n_chars].copy(),
+            {'overwritten': overwritten, 'orphaned': orphaned,
+             'checksum': mismatched, 'aborted': aborted})
@@ -0,0 +1,142 @@
+# encoding: utf-8
+"""
+    drive.fs.fat32.speedup.walker
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module is the pure Python version of the directory walker in
+    `_walker.pyx`, used where the compiled one is not built. Both have to
+    give the same results.
+"""
+import numpy as np
+
+
+ENTRY_SIZE = 32
+
+ATTR_LFN = 0x0f
+
+MARK_BLANK = 0x00
+MARK_DELETED = 0xe5
+
+LFN_FIRST = 0x40
+
+# byte offsets of the 13 UTF-16 characters of a long filename entry
+LFN_CHAR_OFFSETS = (1, 3, 5, 7, 9, 14, 16, 18, 20, 22, 24, 28, 30)
+
+
+def lfn_checksum(short_name):
+    """Calculate the checksum of an 8.3 name, which every long filename entry
+    of the name carries.
+
+    :param short_name: the 11 bytes of the 8.3 name.
+    """
+
+    sum_ = 0
+    for c in short_name:
+        sum_ = (((sum_ & 1) << 7) + (sum_ >> 1) + c) & 0xff
+
+    return sum_
+
+
+def _lfn_chars(record):
+    """Get the characters of a long filename entry, up to the first null.
+
+    :param record: the 32 bytes of the entry.
+    """
+
+    chars = []
+    for offset in LFN_CHAR_OFFSETS:
+        c = record[offset] | record[offset + 1] << 8
+        if c == 0:
+            break
+        chars.append(c)
+
+    return chars
+
+
+def walk_directory(raw):
+    """Run the long filename state machine over the records of a directory.
+
+    Returns (indices, has_lfn, offsets, chars, counters):
+
+    - `indices`, the records of the short entries named, in order;
+    - `has_lfn`, whether the name of each of them is a long filename, the
+      others go by their 8.3 names;
+    - `offsets` and `chars`, the long filenames as UTF-16 code units, the
+      i-th being `chars[offsets[i]:offsets[i + 1]]`;
+    - `counters`, a dict counting the `overwritten` long filenames, the
+      `orphaned` long filename entries not following a first one, the
+      long filenames dropped for a `checksum` mismatch, and whether the walk
+      was `aborted` at a corrupted long filename, the records after which
+      are left out.
+
+    A long filename is only taken if its checksum matches the 8.3 name
+    following it, except for deleted entries whose first byte is lost.
+
+    :param raw: the records, a (n, 32) `numpy.uint8` array.
+    """
+
+    n = len(raw)
+
+    indices, has_lfn, offsets, chars = [], [], [0], []
+    counters = {'overwritten': 0, 'orphaned': 0, 'checksum': 0, 'aborted': 0}
+
+    in_lfn = False
+    checksum, checksum_known = 0, False
+    # record indices of the parts of the pending long filename, in the order
+    # they are met, i.e. from the last part to the first
+    parts = []
+
+    for i in range(n):
+        record = raw[i].tobytes()
+        mark = record[0]
+        if mark == MARK_BLANK:
+            continue
+
+        if record[11] == ATTR_LFN:
+            if mark == MARK_DELETED:
+                in_lfn = True
+            elif mark & LFN_FIRST:
+                if in_lfn:
+                    counters['overwritten'] += 1
+                    parts = []
+                    checksum = 0
+
+                in_lfn = True
+                checksum, checksum_known = record[13], True
+            else:
+                if not in_lfn:
+                    counters['orphaned'] += 1
+
+                if checksum != record[13]:
+                    # only the first entry may disagree with the checksum
+                    # kept, any following one disagreeing means the directory
+                    # is corrupted, so abort immediately
+                    counters['aborted'] = 1
+                    break
+
+            parts.append(i)
+            continue
+
+        indices.append(i)
+
+        named = in_lfn
+        if (named and checksum_known and mark != MARK_DELETED and
+                lfn_checksum(record[:11]) != checksum):
+            counters['checksum'] += 1
+            named = False
+
+        if named:
+            for k in reversed(parts):
+                chars.extend(_lfn_chars(raw[k].tobytes()))
+        has_lfn.append(named)
+        offsets.append(len(chars))
+
+        in_lfn = False
+        checksum_known = False
+        parts = []
+
+    return (np.array(indices, dtype=np.int64),
+            np.array(has_lfn, dtype=bool),
+            np.array(offsets, dtype=np.int64),
+            np.array(chars, dtype=np.uint16),
+            counters)
@@ -5,21 +5,22 @@
 
     This module implements certain structs used in constructing FAT32 objects.
 """
-from decimal import Decimal
-from functools import reduce
 import os
-from struct import unpack
-from datetime import datetime
 
 from construct import *
+import numpy as np
 from pandas import DataFrame
 
 from .. import Partition, EntryMixin
-from .speedup._op import find_cluster_lists
+from ..cluster_index import ClusterIndex
+from .chains import resolve_chains, FATChains
+from .compare import compare_fats
+from .dirents import DirectoryRecords, assemble_names, ATTR_LABEL
+from .extents import ExtentTable
+from .tree import DirectoryTree
 from drive.keys import *
-from misc import STATE_LFN_ENTRY, STATE_DOS_ENTRY, MAGIC_END_SECTION, \
-    clear_cur_obj, time_it, StateManager, STATE_START
-from stream.auxiliary import BufferedClusterStream
+from misc import MAGIC_END_SECTION, time_it
+from stream import PrefetchStream, as_bytes_stream
 
 
 FAT32BootSector = Struct(k_FAT32BootSector,
@@ -74,21 +75,7 @@ class FAT32DirectoryTableEntry(EntryMixin):
     This class is a bit ugly due to the __slots__ mechanism, which, however, can
     improve the performance somehow.
     """
-    __struct__ = Struct(k_FAT32DirectoryTableEntry,
-                        String(k_short_file_name, 8),
-                        String(k_short_extension, 3),
-                        ULInt8(k_attribute),
-                        ULInt8(None),
-                        ULInt8(k_create_time_10ms),
-                        ULInt16(k_create_time),
-                        ULInt16(k_create_date),
-                        ULInt16(k_access_date),
-                        ULInt16(k_higher_cluster),
-                        ULInt16(k_modify_time),
-                        ULInt16(k_modify_date),
-                        ULInt16(k_lower_cluster),
-                        ULInt32(k_file_length))
-    __slots__ = ['is_directory', 'cluster_list', 'avg_cluster',
+    __slots__ = ['is_directory',
                  'full_path', 'first_cluster',
                  'create_time',
                  'modify_time',
@@ -99,142 +86,46 @@ class FAT32DirectoryTableEntry(EntryMixin):
     __attr__ = __slots__[:]
     __attr__.remove('skip')
 
-    def __init__(self, raw, dir_name, state_mgr, current_obj, partition,
+    def __init__(self, records, i, name, timestamps, dir_name, partition,
                  order_number):
         """
-        :param raw: raw bytes read from stream.
+        :param records: the :class:`DirectoryRecords` of the directory.
+        :param i: index of the record of this entry.
+        :param name: name of this entry, see :func:`assemble_names`.
+        :param timestamps: the timestamps of the records as lists, see
+                           :meth:`DirectoryRecords.timestamps`.
         :param dir_name: parent path of the current entry.
-        :param state_mgr: the state manager which holds the state of the name
-                          state machine.
-        :param current_obj: the content of the name state machine.
         :param partition: the partition on which this entry resides.
+        :param order_number: id of this entry.
         """
 
-        obj = self.__struct__.parse(raw)
-
         self.id = order_number
 
         self.skip = False
-        self.is_deleted = obj[k_short_file_name].startswith(b'\xe5')
-
-        self.is_directory = bool(obj[k_attribute] & 0x10)
+        self.is_deleted = bool(records.deleted[i])
 
-        self.first_cluster = self._get_first_cluster(obj)
-        self.cluster_list, self.avg_cluster =\
-            partition.resolve_cluster_list(self.first_cluster)
-
-        try:
-            name, ext = self._get_names(obj, state_mgr, current_obj)
-            if name == '.' or name == '..':
-                self.skip = True
-                return
-        except UnicodeDecodeError:
-            partition.logger.warning('%s unicode decode error, '
-                                     'first cluster: %s, '
-                                     'byte address: %s',
-                                     dir_name, hex(self.first_cluster),
-                                     hex(partition.abs_c2b(self.first_cluster)))
-            name, ext = (str((obj[k_short_file_name]
-                                 [1 if self.is_deleted else 0:]),
-                             encoding='raw_unicode_escape'),
-                         str(obj[k_short_extension]))
+        self.is_directory = bool(records.is_directory[i])
 
-        self.full_path = os.path.join(dir_name, name)
+        self.first_cluster = int(records.first_cluster[i])
 
-        h, m, s = self._get_time(obj[k_create_time],
-                                 obj[k_create_time_10ms])
-        y, m_, d = self._get_date(obj[k_create_date])
-        try:
-            self.create_time = datetime(y, m_, d, h, m, int(s),
-                                        int((Decimal(str(s)) - int(s))
-                                            * 1000000))
-            # TODO implement customizable timezone
-        except ValueError:
-            partition.logger.warning('%s\\%s: invalid date %s, %s, %s',
-                                     dir_name, name, y, m_, d)
+        if name == '.' or name == '..':
             self.skip = True
             return
 
-        h, m, s = self._get_time(obj[k_modify_time], 0)
-        y, m_, d = self._get_date(obj[k_modify_date])
-        try:
-            self.modify_time = datetime(y, m_, d, h, m, int(s))
-            # TODO implement customizable timezone
-        except ValueError:
-            partition.logger.warning('%s\\%s: invalid date %s, %s, %s',
-                                     dir_name, name, y, m_, d)
-            self.skip = True
-            return
-
-        y, m_, d = self._get_date(obj[k_access_date])
-        try:
-            self.access_date = datetime(y, m_, d, 0, 0, 0)
-        except ValueError:
-            partition.logger.warning('%s\\%s: invalid date %s, %s, %s',
-                                     dir_name, name, y, m_, d)
-            self.skip = True
-            return
-
-    def _get_names(self, obj, state_mgr, current_obj):
-        """Get the file name of this entry.
-
-        :param obj: the context object.
-        :param state_mgr: the state manager.
-        :param current_obj: the content of the name state machine.
-        """
-
-        ext = ''
-        if state_mgr.is_(STATE_LFN_ENTRY):
-            name = current_obj['name']
-            if self.is_deleted:
-                name = '(deleted) ' + name
-            if not self.is_directory:
-                ext = name.rsplit('.')[-1] if '.' in name else ''
-
-            state_mgr.transit_to(STATE_DOS_ENTRY)
-            current_obj['name'] = ''
-
-        else:
-            name = obj[k_short_file_name].strip()
-            if self.is_deleted:
-                # TODO add a function which tries both gbk and unicode to decode
-                # TODO the file names
-                name = '(deleted) ' + str(name[1:], encoding='gbk')
-            else:
-                name = str(name, encoding='gbk')
-
-            if not self.is_directory:
-                ext = str(obj[k_short_extension].strip(), encoding='gbk')
-                name = '.'.join((name, ext)).strip('.')
-            name = name.lower()
-            ext = ext.lower()
-
-        return name, ext
-
-    @staticmethod
-    def _get_checksum(obj):
-        """Calculate the checksum of this entry.
-
-        :param obj: the context object.
-        """
-        # TODO checksum checking is not yet implemented
-        return reduce(lambda sum_, c: (0x80 if sum_ & 1 else 0 +
-                                       (sum_ >> 1) +
-                                       c) & 0xff,
-                      b''.join((obj[k_short_file_name],
-                                 obj[k_short_extension])),
-                      0)
-
-    @staticmethod
-    def _get_time(word, byte):
-        """Get the timestamp of this entry.
+        self.full_path = os.path.join(dir_name, name)
 
-        :param word, byte: the two arguments in which timestamp is stored.
-        """
+        for key, date_key in ((k_create_time, k_create_date),
+                              (k_modify_time, k_modify_date),
+                              (k_access_date, k_access_date)):
+            values, invalid = timestamps[key]
+            if invalid[i]:
+                y, m_, d = self._get_date(int(records.entries[date_key][i]))
+                partition.logger.warning('%s\\%s: invalid date %s, %s, %s',
+                                         dir_name, name, y, m_, d)
+                self.skip = True
+                return
 
-        return ((word & 0xf800) >> 11,
-                (word & 0x07e0) >> 5,
-                (word & 0x001f) * 2 + byte * .01)
+            setattr(self, key, values[i])
 
     @staticmethod
     def _get_date(word):
@@ -247,89 +138,6 @@ class FAT32DirectoryTableEntry(EntryMixin):
                 (word & 0x01e0) >> 5,
                 word & 0x001f)
 
-    @staticmethod
-    def _get_first_cluster(obj):
-        """Get first cluster of the file represented by this entry.
-
-        :param obj: the context object.
-        """
-
-        return obj[k_higher_cluster] << 16 | obj[k_lower_cluster]
-
-
-class FAT32LongFilenameEntry:
-    """
-    Class represents long filename entry (LFN).
-    """
-    __struct__ = Struct(k_FAT32LongFilenameEntry,
-                        ULInt8(k_sequence_number),
-                        String(k_name_1, 10),
-                        ULInt8(None),
-                        ULInt8(k_type),
-                        ULInt8(k_checksum),
-                        String(k_name_2, 12),
-                        ULInt16(None),
-                        String(k_name_3, 4))
-
-    __slots__ = ['abort', 'is_deleted']
-
-    def __init__(self, raw, state_mgr, current_obj, partition):
-        """Same as the parameters in :class:`FAT32DirectoryTableEntry`. Pass."""
-
-        obj = self.__struct__.parse(raw)
-
-        self.abort = False
-        self.is_deleted = False
-
-        seq_number = obj[k_sequence_number]
-        if seq_number == 0xe5:
-            # deleted entry
-            self.is_deleted = True
-            state_mgr.transit_to(STATE_LFN_ENTRY)
-        elif seq_number & 0x40:
-            # first (logically last) LFN entry
-            if state_mgr.is_(STATE_LFN_ENTRY):
-                partition.logger.warning('detected overwritten LFN')
-                clear_cur_obj(current_obj)
-
-            state_mgr.transit_to(STATE_LFN_ENTRY)
-            current_obj['checksum'] = obj[k_checksum]
-        else:
-            # assert state_mgr.is_(STATE_LFN_ENTRY)
-            if not state_mgr.is_(STATE_LFN_ENTRY):
-                partition.logger.warning('invalid LFN non-starting entry')
-
-            if current_obj['checksum'] != obj[k_checksum]:
-                # it's only possible that the checksum of the first entry and the
-                # checksum of current_obj are not the same, the following entry
-                # has to have the same checksum with the current_obj, there must
-                # be something wrong here in this situation, so we choose to
-                # abort immediately and consider this subdirectory corrupted
-                self.abort = True
-                return
-
-            seq_number &= 0x1f
-            if seq_number == 1:
-                # LFN ends
-                pass
-
-        current_obj['name'] = self._get_entry_name(obj) + current_obj['name']
-
-    @staticmethod
-    def _get_entry_name(obj):
-        """Get the name represented by this entry.
-
-        :param obj: the context object."""
-
-        try:
-            return str(b''.join((obj[k_name_1],
-                                 obj[k_name_2],
-                                 obj[k_name_3])),
-                       encoding='utf-16').split('\x00')[0]
-        except UnicodeDecodeError:
-            print('Unicode decode error in _get_entry_name')
-            return 'unicode decode error'
-
 
 class FAT32(Partition):
     """
@@ -337,18 +145,35 @@ class FAT32(Partition):
     """
     type = 'FAT32'
 
-    _ul_int32 = ULInt32(None)
+    __entry_columns__ = ['is_directory', 'avg_cluster', 'full_path',
+                         'first_cluster', 'last_cluster', 'cluster_count',
+                         'fragment_count', 'create_time', 'modify_time',
+                         'access_date', 'is_deleted', 'id']
+    # columns of the entries as read from the directories
+    __directory_columns__ = FAT32DirectoryTableEntry.__attr__
 
     def __init__(self, stream, preceding_bytes,
-                 read_fat2=False, ui_handler=None):
+                 read_fat2=False, ui_handler=None, prefetch=False,
+                 tz_offset=None, workers=1):
         """
         :param stream: stream to parse against.
         :param preceding_bytes: absolute position of this partition.
-        :param read_fat2: if false, the second FAT won't be read.
+        :param read_fat2: if false, the second FAT won't be read, else it's
+                          compared to the first one, see
+                          :meth:`compare_fats`.
+        :param prefetch: if true, the FAT is read ahead in background while
+                         being parsed.
+        :param tz_offset: optional, a `datetime.timedelta` added to the
+                          timestamps of the entries, which FAT stores in local
+                          time.
+        :param workers: optional, number of threads reading directories, see
+                        :meth:`get_fdt`.
         """
 
         super(FAT32, self).__init__(FAT32.type, stream, preceding_bytes,
-                                    lambda s: FAT32BootSector.parse_stream(s),
+                                    lambda s: FAT32BootSector.parse_stream(
+                                        as_bytes_stream(s)
+                                    ),
                                     ui_handler=ui_handler)
 
         self.bytes_per_sector = self.boot_sector[k_bytes_per_sector]
@@ -362,13 +187,18 @@ class FAT32(Partition):
         self.bytes_per_fat = self.s2b(self.boot_sector[k_sectors_per_FAT])
 
         self.logger.info('reading fs info sector')
-        FAT32FSInformationSector.parse_stream(stream)
+        FAT32FSInformationSector.parse_stream(as_bytes_stream(stream))
 
         self.read_fat2 = read_fat2
+        self.prefetch = prefetch
+        self.tz_offset = tz_offset
+        self.workers = workers
 
         self.fat1, self.number_of_eoc_1, self.fat2, self.number_of_eoc_2 = (
             {}, 0, {}, 0
         )
+        # differences between the FATs, see compare_fats
+        self.fat_comparison = None
 
         self.fat_abs_pos = self.s2b(
             self.boot_sector[k_number_of_reserved_sectors]
@@ -378,6 +208,8 @@ class FAT32(Partition):
         self.data_section_offset = self.fat_abs_pos + 2 * self.bytes_per_fat
 
         self.fdt = {}
+        # cluster lists of the entries, see get_fdt
+        self.extents = None
 
         self.items_count = 0
 
@@ -411,11 +243,8 @@ class FAT32(Partition):
 
         return self.bytes_per_cluster * n
 
-    def _next_ul_int32(self):
-        """Read the next 4 bytes as an 32-bit unsigned integer."""
-
-        return unpack('<I', self.stream.read(4))[0]
-
+    # the high 4 bits of FAT items are reserved
+    _fat_item_mask = 0x0fffffff
     _eoc_magic = 0x0ffffff8
     def _is_eoc(self, n):
         """Determine if it reaches the end of cluster (EOC).
@@ -425,73 +254,143 @@ class FAT32(Partition):
 
         return n & self._eoc_magic == self._eoc_magic
 
+    def load_fat(self, read_size=4 * 1024 * 1024):
+        """Read a whole FAT from current stream position into a `numpy.uint32`
+        array with the reserved high 4 bits masked out.
+
+        :param read_size: optional, the FAT is read in reads of this size.
+        """
+
+        buf = bytearray(self.bytes_per_fat)
+        view = memoryview(buf)
+
+        n = 0
+        while n < self.bytes_per_fat:
+            data = self.stream.read(min(read_size, self.bytes_per_fat - n))
+            if not data:
+                self.logger.warning('FAT is truncated at %d of %d bytes',
+                                    n, self.bytes_per_fat)
+                break
+
+            view[n:n + len(data)] = data
+            n += len(data)
+
+        view.release()
+
+        fat = np.frombuffer(buf, dtype='<u4', count=n // 4).astype(np.uint32,
+                                                                   copy=False)
+        fat &= self._fat_item_mask
+
+        return fat
+
     @time_it
-    def get_fat(self):
+    def get_fat(self, fat=None):
         """Get file allocation table from current stream position,
-        returns the table represented in dict and number of EOCs."""
-        _0 = self._next_ul_int32()
-        _1 = self._next_ul_int32()
-        assert _0 & self._eoc_magic == self._eoc_magic
-        # assert _1 == 0xffffffff or _1 == 0xfffffff
+        returns the cluster chains (see :class:`FATChains`, which can be looked
+        up by first cluster like a dict) and number of EOCs.
+
+        :param fat: optional, the FAT if already loaded, see :meth:`load_fat`.
+        """
+        if fat is None:
+            fat = self.load_fat()
+        assert fat[0] & self._eoc_magic == self._eoc_magic
+        # assert fat[1] == 0xffffffff or fat[1] == 0xfffffff
         # due to some un-standard implementations
 
-        number_of_fat_items = self.bytes_per_fat // 4
+        chains = resolve_chains(fat)
 
-        cluster_head = {}
-        obj = {}
+        if chains.loops:
+            self.logger.warning('found %d looping cluster chains, first '
+                                'clusters %s', len(chains.loops),
+                                chains.loops[:10])
+        if chains.cross_links:
+            self.logger.warning('found %d cross-linked clusters, e.g. %s',
+                                len(chains.cross_links),
+                                sorted(chains.cross_links.items())[:10])
+        if len(chains.invalid):
+            self.logger.warning('found %d clusters pointing to free, bad or '
+                                'nonexistent clusters', len(chains.invalid))
 
-        find_cluster_lists(self, cluster_head, obj, number_of_fat_items)
+        number_of_eoc = int(np.count_nonzero(fat[2:] >= self._eoc_magic))
 
-        return obj, 0
+        return chains, number_of_eoc
 
     def get_fdt(self, root_dir_name='/'):
-        """Read the FDT entries in order.
+        """Read the FDT entries in order, see :meth:`DirectoryTree.materialize`.
 
         :param root_dir_name: optional, name of the root directory.
         """
 
-        # task := (directory_name, fdt_abs_start_byte_pos)
-        __tasks__ = [(root_dir_name,
-                      self.resolve_cluster_list(2)[0])]
+        return self.directory_tree(root_dir_name).materialize()
 
-        entries, create_time_indices = [], []
+    def directory_tree(self, root_dir_name='/'):
+        """Get a lazy view over the directory tree, which reads directories
+        only when they are listed, see :class:`DirectoryTree`.
 
-        while __tasks__:
-            dir_name, cluster_list = __tasks__.pop(0)
+        :param root_dir_name: optional, name of the root directory.
+        """
+
+        return DirectoryTree(self, root_dir_name)
 
-            if dir_name.startswith(u'\u00e5'):
-                continue
+    def _to_fdt(self, entries):
+        """Make the FDT out of the rows of the entries, see :meth:`get_fdt`.
+
+        :param entries: the rows, as given by :meth:`_discover`.
+        """
 
-            _e, _ct = self._discover(__tasks__, dir_name, cluster_list)
+        if not entries:
+            self.extents = ExtentTable([], [0], [], [])
+            return DataFrame([(None,) * len(self.__entry_columns__)],
+                             columns=self.__entry_columns__)
 
-            entries.extend(_e)
-            create_time_indices.extend(_ct)
+        df = DataFrame(entries,
+                       index=map(lambda x: x[-1], entries),
+                       columns=self.__directory_columns__)
 
-        self.logger.info('found %s files and dirs in total', len(entries))
+        # the cluster lists are kept in the extent table rather than in the
+        # rows, only the figures derived from them are
+        self.extents = ExtentTable.from_chains(self.fat1,
+                                               df['id'].values,
+                                               df['first_cluster'].values)
+        df['avg_cluster'] = self.extents.avg_clusters()
+        df['last_cluster'] = self.extents.last_clusters()
+        df['cluster_count'] = self.extents.cluster_counts()
+        df['fragment_count'] = self.extents.fragment_counts()
 
-        return DataFrame(entries if entries else
-                         [(None,) * len(FAT32DirectoryTableEntry.__attr__)],
-                         index=map(lambda x: x[-1], entries),
-                         columns=FAT32DirectoryTableEntry.__attr__)
+        return df[self.__entry_columns__]
 
     def resolve_cluster_list(self, first_cluster, fat=None):
-        """Resolve the cluster lists by first_cluster.
+        """Resolve the cluster list by first_cluster, as a list of [start,
+        end] runs, empty if no cluster chain starts there. The figures derived
+        from cluster lists are computed for all the entries at once, see
+        :class:`ExtentTable`.
 
         :param first_cluster: first cluster number.
-        :param fat: optional, the FAT used to be resolved against. If not set,
-                    the first FAT is used.
+        :param fat: optional, the :class:`FATChains` used to be resolved
+                    against. If not set, the first FAT is used.
         """
 
-        fat = fat or self.fat1
+        fat = self.fat1 if fat is None else fat
 
         if first_cluster in fat:
-            cl = fat[first_cluster]
-            total_sum = sum((e - s + 1) * (e + s) / 2 for s, e in cl)
-            total_n = sum(e - s + 1 for s, e, in cl)
+            return fat[first_cluster]
 
-            return cl, total_sum / total_n
-        else:
-            return (), 0
+        return []
+
+    @property
+    def fat_loaded(self):
+        """Whether the FATs have been read, see :meth:`read_fats`."""
+
+        return isinstance(self.fat1, FATChains)
+
+    def orphan_chains(self, entries):
+        """Get the first clusters of the cluster chains of the first FAT which
+        none of the entries starts at, i.e. allocated but unreferenced.
+
+        :param entries: entries of this partition, see :meth:`get_entries`.
+        """
+
+        return self.fat1.orphan_heads(entries['first_cluster'].dropna())
 
     def abs_c2b(self, cluster):
         """Cluster to absolute position in stream.
@@ -501,95 +400,167 @@ class FAT32(Partition):
 
         return self.c2b(cluster - 2) + self.data_section_offset
 
-    def _discover(self, tasks, dir_name, cluster_list):
-        """Discover subdirectories.
+    def abs_b2c(self, offset):
+        """Absolute position in stream to cluster, the reverse of
+        :meth:`abs_c2b`. Positions before the data section give clusters
+        below 2, which no entry owns.
 
-        :param tasks: a stack which stores the following discovery tasks.
-        :param dir_name: the name of the current directory, i.e. parent
-                         directory.
-        :param cluster_list: the cluster list of this task.
+        :param offset: the position, a scalar or an array, e.g. a sector
+                       number times :attr:`bytes_per_sector`.
         """
 
-        if 'System Volume Information' in dir_name:
-            return [], []
+        return ((np.asarray(offset, dtype=np.int64) -
+                 self.data_section_offset) // self.bytes_per_cluster + 2)
+
+    def cluster_index(self, entries):
+        """Get the :class:`ClusterIndex` of the clusters of the entries, to
+        look up which entries own a cluster, see also :meth:`abs_b2c`.
+
+        :param entries: entries of this partition, see :meth:`get_entries`.
+        """
+
+        return ClusterIndex.from_extents(
+            self.extents.take(entries['id'].dropna())
+        )
 
-        __blank__ = b'\x00'
+    def _read_directory(self, dir_name, cluster_list):
+        """Read and decode a directory, with positional reads only, so that
+        directories can be read from multiple threads at once.
 
-        __state__ = StateManager(STATE_START)
-        __cur_obj__ = {'name': '', 'checksum': 0}
+        Returns (entries, count), the ids of the entries count from 0 and
+        `count` is the number of ids taken, skipped entries included.
+
+        :param dir_name: the name of the directory.
+        :param cluster_list: the cluster list of the directory.
+        """
+
+        if 'System Volume Information' in dir_name:
+            return [], 0
+
+        # the whole directory is read and decoded at once, each cluster run is
+        # fetched as a whole, and nearby runs are merged into the same read
+        records = DirectoryRecords(b''.join(self.stream.read_extents(
+            [(self.abs_c2b(start), (end - start + 1) * self.bytes_per_cluster)
+             for start, end in cluster_list]
+        )))
+
+        indices, names, undecodable = assemble_names(records, self.logger)
+        for i in undecodable:
+            first_cluster = int(records.first_cluster[i])
+            self.logger.warning('%s unicode decode error, '
+                                'first cluster: %s, '
+                                'byte address: %s',
+                                dir_name, hex(first_cluster),
+                                hex(self.abs_c2b(first_cluster)))
+
+        # datetime64[ms] items are turned into datetime objects by tolist
+        timestamps = {key: (values.tolist(), invalid.tolist())
+                      for key, (values, invalid)
+                      in records.timestamps(self.tz_offset).items()}
+
+        entries = []
+
+        attributes = records.attribute.tolist()
+        for order_number, (i, name) in enumerate(zip(indices, names)):
+            entry = FAT32DirectoryTableEntry(records, i, name, timestamps,
+                                             dir_name, self, order_number)
+            if attributes[i] == ATTR_LABEL:
+                print('label: %s' % entry.full_path[1:])
+
+            if not entry.skip:
+                entries.append(entry)
+
+        return entries, len(indices)
+
+    def _discover(self, dir_name, directory):
+        """Number the entries of a directory read after the ones discovered
+        before, returns the rows of the entries and their creation times.
+
+        :param dir_name: the name of the directory.
+        :param directory: the directory read, see :meth:`_read_directory`.
+        """
+
+        directory_entries, count = directory
 
         entries, create_time_indices = [], []
 
-        with BufferedClusterStream(self.stream,
-                                   cluster_list,
-                                   self.abs_c2b,
-                                   self.bytes_per_cluster) as stream:
-            while True:
-                try:
-                    raw = stream.read(32)
-                except StopIteration:
-                    # we just ran out of clusters, simply do a break here
-                    break
-
-                if len(raw) < 32:
-                    continue
-                elif raw.startswith(__blank__):
-                    continue
-
-                attribute = raw[0xb]
-                if attribute == 0xf:
-                    entry = FAT32LongFilenameEntry(raw,
-                                                   __state__,
-                                                   __cur_obj__,
-                                                   self)
-                    if entry.abort:
-                        break
-                else:
-                    entry = FAT32DirectoryTableEntry(raw, dir_name,
-                                                     __state__,
-                                                     __cur_obj__,
-                                                     self,
-                                                     self.items_count)
-                    self.items_count += 1
-                    if attribute == 0xb:
-                        print('label: %s' % entry.full_path[1:])
-
-                    if entry.skip:
-                        continue
-
-                    entries.append(entry.to_tuple())
-
-                    self.ui_handler(self.items_count, entry.full_path)
-
-                    create_time_indices.append(entry.create_time)
-
-                    if entry.is_directory:
-                        if entry.is_deleted:
-                            continue
-                        # append new directory task to tasks
-                        if entry.first_cluster in self.fat1:
-                            tasks.append((entry.full_path,
-                                          self.fat1[entry.first_cluster]))
-                        else:
-                            self.logger.warning('found deleted directory at'
-                                                ' %s' % entry.first_cluster)
+        for entry in directory_entries:
+            # entries read keep the ids within their directory, as the same
+            # entries are numbered again by every walk
+            row = entry.to_tuple()[:-1] + (entry.id + self.items_count,)
+            entries.append(row)
+
+            self.ui_handler(row[-1] + 1, entry.full_path)
+
+            create_time_indices.append(entry.create_time)
+
+        self.items_count += count
 
         return entries, create_time_indices
 
     def read_fats(self):
+        stream = self.stream
+        if self.prefetch:
+            self.stream = PrefetchStream(stream)
+
+        try:
+            self._read_fats()
+        finally:
+            if self.prefetch:
+                self.stream.stop()
+                self.stream = stream
+
+    def _read_fats(self):
         self.stream.seek(self.fat_abs_pos, os.SEEK_SET)
         self.logger.info('stream jumped to %d and ready to read FAT',
                          self.fat_abs_pos)
 
         self.logger.info('reading FAT')
-        res1 = self.fat1, self.number_of_eoc_1 = self.get_fat()
-        self.logger.info('read FAT, size of FAT is %d, number of EOCs is %d',
-                         self.bytes_per_fat, self.number_of_eoc_1)
         if not self.read_fat2:
+            res1 = self.fat1, self.number_of_eoc_1 = self.get_fat()
             self._jump(self.bytes_per_fat)
             self.fat2, self.number_of_eoc_2 = res1
         else:
-            self.fat2, self.number_of_eoc_2 = self.get_fat()
+            fat1, fat2 = self.load_fat(), self.load_fat()
+            self.fat1, self.number_of_eoc_1 = self.get_fat(fat1)
+            self.fat2, self.number_of_eoc_2 = self.get_fat(fat2)
+            self.fat_comparison = compare_fats(fat1, fat2,
+                                               self.fat1, self.fat2)
+            self._log_fat_comparison(self.fat_comparison)
+
+        self.logger.info('read FAT, size of FAT is %d, number of EOCs is %d',
+                         self.bytes_per_fat, self.number_of_eoc_1)
+
+    def compare_fats(self):
+        """Compare the two FATs, returns a :class:`FATComparison` of the
+        clusters and the cluster chains which differ, see
+        :meth:`FATComparison.files` for the entries affected.
+
+        Both FATs are read again, the chains are resolved only if they
+        differ, the ones of the first FAT are reused if already read.
+        """
+
+        self.stream.seek(self.fat_abs_pos, os.SEEK_SET)
+        fat1, fat2 = self.load_fat(), self.load_fat()
+
+        chains1 = self.fat1 if self.fat_loaded else None
+        chains2 = self.fat2 if self.fat_loaded and self.read_fat2 else None
+
+        self.fat_comparison = compare_fats(fat1, fat2, chains1, chains2)
+        self._log_fat_comparison(self.fat_comparison)
+
+        return self.fat_comparison
+
+    def _log_fat_comparison(self, comparison):
+        if comparison:
+            self.logger.warning('FATs differ in %d clusters, e.g. %s, and in '
+                                '%d cluster chains, first clusters %s',
+                                len(comparison),
+                                comparison.clusters[:10].tolist(),
+                                len(comparison.chains),
+                                comparison.chains[:10].tolist())
+        else:
+            self.logger.info('FATs are identical')
 
     def get_entries(self):
         self.items_count = 0
@@ -597,3 +568,11 @@ class FAT32(Partition):
         self.read_fats()
 
         return self.get_fdt()
+
+    def iter_entry_batches(self, batch_size=64 * 1024):
+        self.items_count = 0
+
+        self.read_fats()
+
+        for batch in self.directory_tree().iter_batches(batch_size):
+            yield batch
@@ -0,0 +1,105 @@
+# encoding: utf-8
+"""
+    drive.fs.fat32.timestamps
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :func:`decode_timestamps`, which turns arrays of FAT
+    date and time words into `datetime64[ms]` arrays with NumPy.
+
+    A FAT date word holds the year since 1980 in its high 7 bits, then the
+    month in 4 bits and the day in 5 bits. A time word holds the hour in its
+    high 5 bits, then the minute in 6 bits and the seconds divided by 2 in 5
+    bits. The creation time comes along with a byte of 10 milliseconds, which
+    goes up to 199 so that it covers the odd seconds too.
+"""
+import numpy as np
+
+
+def _as_ms(offset):
+    """Convert an offset to `timedelta64[ms]`.
+
+    :param offset: a `datetime.timedelta` or `numpy.timedelta64`.
+    """
+
+    return np.timedelta64(offset).astype('timedelta64[ms]')
+
+
+def decode_dates(dates):
+    """Decode FAT date words, returns (dates as `datetime64[D]`, invalid mask),
+    invalid dates are NaT.
+
+    :param dates: array of date words.
+    """
+
+    dates = np.asarray(dates, dtype=np.int64)
+
+    year = (dates >> 9) + 1980
+    month = (dates >> 5) & 0xf
+    day = dates & 0x1f
+
+    invalid = (month < 1) | (month > 12) | (day < 1)
+
+    months = ((year - 1970) * 12 + np.where(invalid, 1, month) - 1).astype(
+        'datetime64[M]'
+    )
+    days_in_month = ((months + 1).astype('datetime64[D]') -
+                     months.astype('datetime64[D]')).astype(np.int64)
+    invalid |= day > days_in_month
+
+    out = months.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    out[invalid] = np.datetime64('NaT')
+
+    return out, invalid
+
+
+def decode_times(times, tens_of_ms=None):
+    """Decode FAT time words, returns (milliseconds since midnight as
+    `timedelta64[ms]`, invalid mask), invalid times are NaT.
+
+    :param times: array of time words.
+    :param tens_of_ms: optional, array of the bytes of 10 milliseconds.
+    """
+
+    times = np.asarray(times, dtype=np.int64)
+
+    hour = times >> 11
+    minute = (times >> 5) & 0x3f
+    ms = (times & 0x1f) * 2000
+    if tens_of_ms is not None:
+        ms = ms + np.asarray(tens_of_ms, dtype=np.int64) * 10
+
+    invalid = (hour > 23) | (minute > 59) | (ms >= 60000)
+
+    out = ((hour * 60 + minute) * 60000 + ms).astype('timedelta64[ms]')
+    out[invalid] = np.timedelta64('NaT')
+
+    return out, invalid
+
+
+def decode_timestamps(dates, times=None, tens_of_ms=None, tz_offset=None):
+    """Decode FAT timestamps, returns (timestamps as `datetime64[ms]`, invalid
+    mask). Invalid timestamps are NaT, whichever part of them is invalid.
+
+    :param dates: array of date words.
+    :param times: optional, array of time words, midnight if not given.
+    :param tens_of_ms: optional, array of the bytes of 10 milliseconds.
+    :param tz_offset: optional, a `datetime.timedelta` added to the
+                      timestamps. FAT stores local times, so e.g. pass minus
+                      the UTC offset of the machine which wrote the volume to
+                      get UTC.
+    """
+
+    out, invalid = decode_dates(dates)
+    out = out.astype('datetime64[ms]')
+
+    if times is not None:
+        time_of_day, invalid_time = decode_times(times, tens_of_ms)
+        invalid |= invalid_time
+        out += time_of_day
+
+    if tz_offset is not None:
+        out += _as_ms(tz_offset)
+
+    out[invalid] = np.datetime64('NaT')
+
+    return out, invalid
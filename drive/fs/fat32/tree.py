@@ -0,0 +1,410 @@
+# encoding: utf-8
+"""
+    drive.fs.fat32.tree
+    ~~~~~~~~~~~~~~~~~~~
+
+    This module implements :class:`DirectoryTree`, a lazy view over the
+    directory tree of a FAT32 partition, and :class:`DirectoryNode`.
+
+    Directories are read only when they are first listed and kept once read.
+    Until the FAT has been read (see :meth:`FAT32.read_fats`), the cluster
+    chains of the directories are followed item by item through the FAT on
+    disk, so browsing a volume doesn't cost reading its whole FAT.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+import numpy as np
+from pandas import DataFrame
+
+from .chains import FREE_CLUSTER, BAD_CLUSTER, EOC_MIN
+from .extents import ExtentTable
+
+
+class DirectoryNode:
+    """
+    A directory of a :class:`DirectoryTree`. Its entries (see
+    :attr:`entries`) are read on first access, the ids of them count from 0
+    within the directory.
+    """
+    def __init__(self, tree, path, first_cluster):
+        """
+        :param tree: the tree of this directory.
+        :param path: full path of this directory.
+        :param first_cluster: first cluster of this directory.
+        """
+
+        self.tree = tree
+        self.path = path
+        self.first_cluster = first_cluster
+
+        # the FAT the cluster list was resolved against, see
+        # DirectoryTree.fat_token
+        self._token = None
+        self._cluster_list = None
+        self._directory = None
+
+        self._children_token = None
+        self._children = None
+
+    def __repr__(self):
+        return '<DirectoryNode %s>' % self.path
+
+    @property
+    def cluster_list(self):
+        """The cluster list of this directory as a list of [start, end]
+        runs. Resolving it again against a newly read FAT drops what was read
+        if the list turns out different."""
+
+        token = self.tree.fat_token()
+        if self._cluster_list is None or token != self._token:
+            cluster_list = self.tree.cluster_list(self.first_cluster)
+            if cluster_list != self._cluster_list:
+                self._directory = None
+                self._children = None
+
+            self._token, self._cluster_list = token, cluster_list
+
+        return self._cluster_list
+
+    @property
+    def is_read(self):
+        """Whether the entries of this directory have been read."""
+
+        return self._directory is not None and self._token == \
+            self.tree.fat_token()
+
+    def read(self):
+        """Get the directory read, see :meth:`FAT32._read_directory`,
+        reading it if not yet."""
+
+        cluster_list = self.cluster_list
+        if self._directory is None:
+            self._directory = self.tree.partition._read_directory(
+                self.path, cluster_list
+            )
+
+        return self._directory
+
+    @property
+    def entries(self):
+        """The entries of this directory, '.' and '..' left out."""
+
+        return self.read()[0]
+
+    def children(self):
+        """Get the subdirectories, deleted ones left out, in the order of
+        their entries."""
+
+        entries = self.entries
+
+        token = self.tree.fat_token()
+        if self._children is not None and self._children_token == token:
+            return self._children
+
+        # nodes read before are kept as long as they are still there
+        known = {(node.path, node.first_cluster): node
+                 for node in self._children or []}
+
+        children = []
+        for entry in entries:
+            if not entry.is_directory or entry.is_deleted:
+                continue
+
+            if not self.tree.has_chain(entry.first_cluster):
+                self.tree.partition.logger.warning(
+                    'found deleted directory at %s' % entry.first_cluster
+                )
+                continue
+
+            key = entry.full_path, entry.first_cluster
+            children.append(known.get(key) or
+                            DirectoryNode(self.tree, *key))
+
+        self._children_token, self._children = token, children
+
+        return children
+
+    def child(self, name):
+        """Get a subdirectory by name.
+
+        :param name: name of the subdirectory.
+        """
+
+        for node in self.children():
+            if os.path.basename(node.path) == name:
+                return node
+
+        raise KeyError(name)
+
+    def list(self):
+        """Get the entries of this directory as a :class:`DataFrame`, with the
+        columns of :class:`FAT32DirectoryTableEntry`."""
+
+        return DataFrame([entry.to_tuple() for entry in self.entries],
+                         columns=self.tree.partition.__directory_columns__)
+
+
+class DirectoryTree:
+    """
+    Lazy view over the directory tree of a FAT32 partition, see
+    :meth:`FAT32.directory_tree`.
+    """
+    # FAT items are read from disk in blocks of this size
+    fat_block_size = 64 * 1024
+
+    def __init__(self, partition, root_dir_name='/', max_fat_blocks=256):
+        """
+        :param partition: the :class:`FAT32` partition.
+        :param root_dir_name: optional, name of the root directory.
+        :param max_fat_blocks: optional, number of FAT blocks kept, see
+                               :attr:`fat_block_size`.
+        """
+
+        self.partition = partition
+
+        self.max_fat_blocks = max_fat_blocks
+        self._fat_blocks = OrderedDict()
+        # guards _fat_blocks, nodes may be read from multiple threads
+        self._lock = threading.Lock()
+        self.number_of_fat_items = partition.bytes_per_fat // 4
+
+        self.root = DirectoryNode(self, root_dir_name, 2)
+
+    def fat_token(self):
+        """Identifies the FAT the cluster lists are resolved against, it
+        changes once the FAT is read."""
+
+        if self.partition.fat_loaded:
+            return id(self.partition.fat1)
+
+        return None
+
+    def _fat_item(self, cluster):
+        """Read an item of the first FAT from disk.
+
+        :param cluster: the cluster of the item.
+        """
+
+        block, i = divmod(cluster * 4, self.fat_block_size)
+
+        with self._lock:
+            items = self._fat_blocks.get(block)
+            if items is not None:
+                self._fat_blocks.move_to_end(block)
+
+        if items is None:
+            buf = self.partition.stream.read_at(
+                self.partition.fat_abs_pos + block * self.fat_block_size,
+                self.fat_block_size
+            )
+            items = np.frombuffer(buf, dtype='<u4',
+                                  count=len(buf) // 4).astype(np.uint32)
+            items &= self.partition._fat_item_mask
+
+            with self._lock:
+                self._fat_blocks[block] = items
+                if len(self._fat_blocks) > self.max_fat_blocks:
+                    self._fat_blocks.popitem(last=False)
+
+        i //= 4
+        return int(items[i]) if i < len(items) else FREE_CLUSTER
+
+    def _is_allocated(self, cluster):
+        """Tests if a cluster is in use, according to the FAT on disk.
+
+        :param cluster: the cluster.
+        """
+
+        item = self._fat_item(cluster)
+        return item != FREE_CLUSTER and item != BAD_CLUSTER
+
+    def has_chain(self, first_cluster):
+        """Tests if a cluster chain starts at a cluster.
+
+        :param first_cluster: the cluster.
+        """
+
+        if self.partition.fat_loaded:
+            return first_cluster in self.partition.fat1
+
+        return (2 <= first_cluster < self.number_of_fat_items and
+                self._is_allocated(first_cluster))
+
+    def cluster_list(self, first_cluster):
+        """Get the cluster list starting at a cluster as a list of [start,
+        end] runs, empty if there's none.
+
+        :param first_cluster: the cluster.
+        """
+
+        if self.partition.fat_loaded:
+            return self.partition.resolve_cluster_list(first_cluster)
+
+        if not self.has_chain(first_cluster):
+            return []
+
+        # the chain is followed the way resolve_chains does, i.e. it ends at
+        # pointers out of the FAT or to free or bad clusters, and where it
+        # runs into a loop
+        runs, seen = [], set()
+        cluster = first_cluster
+        while cluster not in seen:
+            seen.add(cluster)
+            if runs and runs[-1][1] + 1 == cluster:
+                runs[-1][1] = cluster
+            else:
+                runs.append([cluster, cluster])
+
+            cluster = self._fat_item(cluster)
+            if (cluster >= EOC_MIN or
+                    not 2 <= cluster < self.number_of_fat_items or
+                    not self._is_allocated(cluster)):
+                break
+
+        return runs
+
+    def find(self, path):
+        """Get a directory by its full path.
+
+        :param path: the path, e.g. `/dir/subdir`.
+        """
+
+        node = self.root
+        for name in path[len(self.root.path):].split('/'):
+            if name:
+                node = node.child(name)
+
+        return node
+
+    def walk(self):
+        """Iterate over the directories read so far, breadth first."""
+
+        nodes = [self.root]
+        while nodes:
+            next_nodes = []
+            for node in nodes:
+                yield node
+                if node.is_read and node._children is not None:
+                    next_nodes.extend(node._children)
+
+            nodes = next_nodes
+
+    def _iter_rows(self):
+        """Read every directory not yet read, and iterate over the rows of the
+        entries of every directory, numbered breadth first. The FAT is read
+        first if it isn't yet.
+
+        With more than one worker (see :attr:`FAT32.workers`), the
+        directories of every level of the tree are read and decoded on a pool
+        of threads. Reads are positional and NumPy releases the GIL while
+        decoding, so images on fast storage are walked on several cores. The
+        entries are the same, in the same order and with the same ids,
+        whatever the number of workers.
+
+        The directories read by the walk are dropped once their rows are
+        yielded, so that only the directories of the window being read and
+        the nodes of the next level waiting to be walked are held. Those
+        read before, e.g. while browsing, are kept.
+        """
+
+        p = self.partition
+        if not p.fat_loaded:
+            p.read_fats()
+
+        p.items_count = 0
+
+        # directories read but not yet yielded are bounded by this
+        window = max(1, p.workers) * 4
+
+        executor = None
+        if p.workers > 1:
+            executor = ThreadPoolExecutor(max_workers=p.workers)
+
+        try:
+            # the tree is walked level by level, the directories of a level
+            # are read in parallel but merged in the order of the nodes, which
+            # is the order of a serial breadth-first walk, so the ids of the
+            # entries don't depend on the number of workers
+            nodes = [self.root]
+            while nodes:
+                nodes = [node for node in nodes
+                         if not node.path.startswith(u'\u00e5')]
+
+                next_nodes = []
+                for i in range(0, len(nodes), window):
+                    part = nodes[i:i + window]
+                    was_read = [node.is_read for node in part]
+                    if executor is None:
+                        directories = map(DirectoryNode.read, part)
+                    else:
+                        directories = executor.map(DirectoryNode.read, part)
+
+                    for node, directory, keep in zip(part, directories,
+                                                     was_read):
+                        rows, _ = p._discover(node.path, directory)
+                        del directory
+                        yield rows
+
+                        next_nodes.extend(node.children())
+
+                        # what the walk reads is dropped once taken, only the
+                        # directories browsed before stay in the tree
+                        if not keep:
+                            node._directory = node._children = None
+
+                nodes = next_nodes
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def materialize(self):
+        """Read every directory not yet read and get all the entries as the
+        :class:`DataFrame` of :meth:`FAT32.get_fdt`, see :meth:`_iter_rows`.
+        """
+
+        entries = []
+        for rows in self._iter_rows():
+            entries.extend(rows)
+
+        self.partition.logger.info('found %s files and dirs in total',
+                                   len(entries))
+
+        return self.partition._to_fdt(entries)
+
+    def iter_batches(self, batch_size=64 * 1024):
+        """Same as :meth:`materialize`, but yields the entries in
+        :class:`DataFrame` batches of `batch_size` rows (the last one may be
+        shorter) while the directories are being read. The rows of the
+        current batch and the directories being read are held, not the
+        whole tree, see :meth:`_iter_rows`. Once every batch is consumed,
+        :attr:`FAT32.extents` covers all the entries.
+
+        :param batch_size: optional, number of rows of the batches.
+        """
+
+        p = self.partition
+
+        batch, tables, count = [], [], 0
+        for rows in self._iter_rows():
+            batch.extend(rows)
+            while len(batch) >= batch_size:
+                df = p._to_fdt(batch[:batch_size])
+                tables.append(p.extents)
+                count += len(df)
+                del batch[:batch_size]
+
+                yield df
+
+        if batch:
+            df = p._to_fdt(batch)
+            tables.append(p.extents)
+            count += len(df)
+
+            yield df
+
+        p.logger.info('found %s files and dirs in total', count)
+
+        p.extents = ExtentTable.concat(tables)
@@ -836,7 +836,7 @@ class Block(object):
         """
         try:
             return self._buf[self._offset + offset:self._offset + offset + \
-                             2 * length].tostring().decode("utf16")
+                             2 * length].tobytes().decode("utf16")
         except AttributeError: # already a 'str' ?
             return self._buf[self._offset + offset:self._offset + offset + \
                              2 * length].decode("utf16")
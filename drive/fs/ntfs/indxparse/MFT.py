@@ -959,13 +959,13 @@ class MFTRecord(FixupBlock):
         """
         Returns A binary string containing the MFT record slack.
         """
-        return self._buf[self.offset()+self.bytes_in_use():self.offset() + 1024].tostring()
+        return self._buf[self.offset()+self.bytes_in_use():self.offset() + 1024].tobytes()
 
     def active_data(self):
         """
         Returns A binary string containing the MFT record slack.
         """
-        return self._buf[self.offset():self.offset() + self.bytes_in_use()].tostring()
+        return self._buf[self.offset():self.offset() + self.bytes_in_use()].tobytes()
 
 
 class InvalidAttributeException(INDXException):
@@ -0,0 +1,517 @@
+# encoding: utf-8
+"""
+    drive.fs.ntfs.parallel
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :class:`ParallelRecordEnumerator`, which decodes
+    the $MFT of an NTFS partition on a pool of processes.
+
+    The records are cut into ranges along the data runs of the $MFT. Every
+    worker opens the image on its own, reads its range, applies the fixups
+    and decodes the records (see :func:`decode_range`). It puts the fields
+    used by :meth:`NTFS.__iter__` into columns in a block of shared memory
+    made for the range by the parent process, rather than sending back
+    pickled records, only the names and the data runs, of variable size, are
+    sent back as arrays. The parent process then resolves the paths of all
+    the records at once, see :func:`resolve_paths`.
+"""
+import functools
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .indxparse.BinaryParser import parse_filetime
+from .indxparse.MFT import FixupBlock, MFT_RECORD_FLAGS
+from .paths import resolve_paths
+from .records import MAGIC_FILE, DataAttribute, apply_fixups, \
+    decode_record, mft_extents, read_headers
+
+
+INT64_MAX = 2 ** 63 - 1
+
+# the columns of a fixed size per record decoded by the workers, as (key,
+# dtype, shape of the item of a record)
+RECORD_COLUMNS = [('valid', '|b1', ()),
+                  ('lsn', '<u8', ()),
+                  ('sequence_number', '<u2', ()),
+                  ('flags', '<u2', ()),
+                  ('has_si', '|b1', ()),
+                  ('si_times', '<u8', (4,)),
+                  ('has_fn', '|b1', ()),
+                  ('fn_times', '<u8', (4,)),
+                  ('parent_references', '<u8', ()),
+                  ('name_lengths', '<i8', ()),
+                  ('has_data', '|b1', ()),
+                  ('non_resident', '|u1', ()),
+                  ('run_counts', '<i8', ())]
+
+
+def stream_opener(stream):
+    """Get a callable opening a new stream over the same image as the given
+    stream, which can be sent to other processes, `None` if there's no way to
+    tell. Streams wrapping another one, e.g. :class:`PrefetchStream`, are
+    looked through.
+
+    :param stream: the stream.
+    """
+
+    while not hasattr(stream, 'img_path') and hasattr(stream, '_stream'):
+        stream = stream._stream
+
+    if not hasattr(stream, 'img_path'):
+        return None
+
+    return functools.partial(type(stream), stream.img_path)
+
+
+def _slice_extents(extents, start, end):
+    """Get the extents holding the bytes from `start` up to `end` exclusive
+    of the concatenation of the given extents.
+
+    :param extents: list of (offset, length) tuples.
+    :param start: the first byte.
+    :param end: the end.
+    """
+
+    sliced, pos = [], 0
+    for offset, length in extents:
+        lo, hi = max(start, pos), min(end, pos + length)
+        if lo < hi:
+            sliced.append((offset + lo - pos, hi - lo))
+        pos += length
+
+    return sliced
+
+
+def _filetimes(attr, offset):
+    """Get the four times of a standard information or file name attribute
+    as FILETIME integers.
+
+    :param attr: the attribute, of :mod:`indxparse` or :mod:`records`.
+    :param offset: the offset of the times in the attribute.
+    """
+
+    if hasattr(attr, 'filetimes'):
+        return attr.filetimes()
+
+    return [attr.unpack_qword(offset + 8 * i) for i in range(4)]
+
+
+def _layout(count):
+    """Get the layout of the columns of :data:`RECORD_COLUMNS` of a number of
+    records within a block of shared memory, and the size of the block.
+
+    :param count: the number of records.
+    """
+
+    layout, offset = [], 0
+    for key, dtype, shape in RECORD_COLUMNS:
+        shape = (count,) + shape
+        layout.append((key, dtype, shape, offset))
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        # the columns are kept aligned
+        offset += -offset % 8
+
+    return layout, offset
+
+
+def _allocate(count):
+    """Create a block of shared memory for the columns of a number of
+    records, returns it and the layout of the columns, see :func:`_layout`.
+
+    The block is owned by the process creating it, which keeps it open while
+    the workers fill it (see :func:`_fill`), as on Windows a block is
+    destroyed once no process has it open, and frees it with
+    :func:`_release`.
+
+    :param count: the number of records.
+    """
+
+    layout, size = _layout(count)
+
+    return SharedMemory(create=True, size=max(size, 1)), layout
+
+
+def _fill(name, layout, columns):
+    """Copy columns into a block made by :func:`_allocate`, from a worker.
+
+    :param name: the name of the block.
+    :param layout: the layout of the columns.
+    :param columns: dict of the arrays.
+    """
+
+    shm = SharedMemory(name=name)
+    try:
+        for key, dtype, shape, offset in layout:
+            view = np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
+            view[...] = columns[key]
+            del view
+    finally:
+        shm.close()
+
+
+def _release(shm, layout):
+    """Copy the columns out of a block made by :func:`_allocate`, which is
+    then freed.
+
+    :param shm: the block.
+    :param layout: the layout of the columns.
+    """
+
+    try:
+        return {key: np.ndarray(shape, dtype, buffer=shm.buf,
+                                offset=offset).copy()
+                for key, dtype, shape, offset in layout}
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def decode_range(opener, extents, record_size, sector_size, block_name,
+                 layout):
+    """Decode a range of records of the $MFT into columns, in a worker
+    process. The data runs of all the records are taken, see
+    :attr:`NTFS.data_runs`.
+
+    :param opener: callable opening the image, see :func:`stream_opener`.
+    :param extents: the extents of the range, see :func:`mft_extents`.
+    :param record_size: size of the records.
+    :param sector_size: size of the sectors.
+    :param block_name: the name of the block of shared memory the columns
+                       of :data:`RECORD_COLUMNS` are put into, see
+                       :func:`_allocate`.
+    :param layout: the layout of the columns within the block.
+
+    returns the bad fixups (see :func:`apply_fixups`), the columns of
+    variable size, i.e. the names and the data runs, and a dict of the data
+    runs too large for the columns, by record.
+    """
+
+    FixupBlock.set_sector_size(sector_size)
+
+    stream = opener()
+    try:
+        buf = np.zeros(sum(length for _, length in extents), dtype=np.uint8)
+        stream.read_extents(extents, out=buf)
+    finally:
+        stream.close()
+
+    headers = read_headers(buf, record_size)
+    records = buf.reshape(-1, record_size)
+    valid = headers['magic'] == MAGIC_FILE
+    bad_fixups = apply_fixups(records, sector_size, np.flatnonzero(valid))
+
+    n = len(records)
+    has_si = np.zeros(n, dtype=bool)
+    si_times = np.zeros((n, 4), dtype=np.uint64)
+    has_fn = np.zeros(n, dtype=bool)
+    fn_times = np.zeros((n, 4), dtype=np.uint64)
+    parent_references = np.zeros(n, dtype=np.uint64)
+    name_lengths = np.zeros(n, dtype=np.int64)
+    has_data = np.zeros(n, dtype=bool)
+    non_resident = np.zeros(n, dtype=np.uint8)
+    run_counts = np.zeros(n, dtype=np.int64)
+
+    names, runs, large_runs = [], [], {}
+    for i in np.flatnonzero(valid).tolist():
+        record = decode_record(records[i], fixed=True)
+
+        si = record.standard_information()
+        if si:
+            has_si[i] = True
+            si_times[i] = _filetimes(si, 0x0)
+
+        fn = record.filename_information()
+        if fn:
+            has_fn[i] = True
+            fn_times[i] = _filetimes(fn, 0x8)
+            parent_references[i] = fn.mft_parent_reference()
+            name = fn.filename().encode('utf-16-le', 'surrogatepass')
+            names.append(name)
+            name_lengths[i] = len(name)
+
+        data_attr = record.data_attribute()
+        if data_attr:
+            has_data[i] = True
+            non_resident[i] = data_attr.non_resident()
+            if data_attr.non_resident() > 0:
+                record_runs = list(data_attr.runlist().runs())
+                if any(abs(value) > INT64_MAX
+                       for run in record_runs for value in run):
+                    large_runs[i] = record_runs
+                else:
+                    runs.extend(record_runs)
+                    run_counts[i] = len(record_runs)
+
+    _fill(block_name, layout, {
+        'valid': valid,
+        'lsn': headers['lsn'],
+        'sequence_number': headers['sequence_number'],
+        'flags': headers['flags'],
+        'has_si': has_si,
+        'si_times': si_times,
+        'has_fn': has_fn,
+        'fn_times': fn_times,
+        'parent_references': parent_references,
+        'name_lengths': name_lengths,
+        'has_data': has_data,
+        'non_resident': non_resident,
+        'run_counts': run_counts,
+    })
+
+    variable = {
+        'names': np.frombuffer(b''.join(names), dtype=np.uint8),
+        'runs': np.array(runs, dtype=np.int64).reshape(-1, 2),
+    }
+
+    return bad_fixups, variable, large_runs
+
+
+class _Times:
+    """
+    Times of a standard information or file name attribute, from FILETIME
+    integers.
+    """
+    __slots__ = ['_times']
+
+    def __init__(self, times):
+        self._times = times
+
+    def created_time(self):
+        return parse_filetime(self._times[0])
+
+    def modified_time(self):
+        return parse_filetime(self._times[1])
+
+    def changed_time(self):
+        return parse_filetime(self._times[2])
+
+    def accessed_time(self):
+        return parse_filetime(self._times[3])
+
+
+class _Runlist:
+    """
+    Runs of a data attribute, as decoded by a worker.
+    """
+    __slots__ = ['_runs']
+
+    def __init__(self, runs):
+        self._runs = runs
+
+    def runs(self, length=None):
+        return iter(self._runs)
+
+
+class _RecordView:
+    """
+    A record decoded by a worker, with the methods of :class:`Record` used by
+    :meth:`NTFS.__iter__`.
+    """
+    __slots__ = ['_lsn', '_sequence_number', '_flags', '_si', '_fn', '_data']
+
+    def __init__(self, lsn, sequence_number, flags, si, fn, data):
+        """
+        :param lsn: the LSN of the record.
+        :param sequence_number: the sequence number of the record.
+        :param flags: the flags of the record.
+        :param si: the times of the standard information, `None` if none.
+        :param fn: the times of the file name, `None` if none.
+        :param data: the :class:`DataAttribute`, `None` if none.
+        """
+
+        self._lsn = lsn
+        self._sequence_number = sequence_number
+        self._flags = flags
+        self._si = si
+        self._fn = fn
+        self._data = data
+
+    def lsn(self):
+        return self._lsn
+
+    def sequence_number(self):
+        return self._sequence_number
+
+    def flags(self):
+        return self._flags
+
+    def is_directory(self):
+        return self._flags & MFT_RECORD_FLAGS.MFT_RECORD_IS_DIRECTORY
+
+    def is_active(self):
+        return self._flags & MFT_RECORD_FLAGS.MFT_RECORD_IN_USE
+
+    def standard_information(self):
+        return self._si
+
+    def filename_information(self):
+        return self._fn
+
+    def data_attribute(self):
+        return self._data
+
+
+def _concatenate(parts, csr):
+    """Concatenate the columns of consecutive ranges of records.
+
+    :param parts: the columns of every range.
+    :param csr: dict mapping the columns of variable length items to the
+                column of their lengths, e.g. 'names' to 'name_lengths'.
+    """
+
+    columns = {key: np.concatenate([part[key] for part in parts])
+               for key in parts[0]}
+    for key, lengths in csr.items():
+        columns[key + '_offsets'] = np.concatenate(
+            [[0], np.cumsum(columns[lengths])]
+        )
+
+    return columns
+
+
+class ParallelRecordEnumerator:
+    """
+    Enumerator of the records of the $MFT and their paths, like
+    :meth:`MFTEnumerator.enumerate_paths`, decoding ranges of records on a
+    pool of processes.
+    """
+    # ranges of records per worker, so that they're kept busy
+    ranges_per_worker = 4
+
+    def __init__(self, parent, stream, opener, workers):
+        """
+        :param parent: the :class:`NTFS` partition.
+        :param stream: the stream of the partition, to read the first record
+                       of the $MFT from.
+        :param opener: callable opening the image in the workers, see
+                       :func:`stream_opener`.
+        :param workers: number of processes.
+        """
+
+        self._parent = parent
+        self._stream = stream
+        self._opener = opener
+        self._workers = workers
+
+        self.bad_fixups = None
+
+    def _decode(self):
+        """Decode all the records on the pool, returns their columns."""
+
+        parent = self._parent
+        record_size = parent.bytes_per_mft_record
+
+        extents = mft_extents(parent, self._stream)
+        count = sum(length for _, length in extents) // record_size
+        step = max(1, -(-count // (self._workers * self.ranges_per_worker)))
+        starts = list(range(0, count, step))
+        ends = starts[1:] + [count]
+        ranges = [_slice_extents(extents, start * record_size,
+                                 end * record_size)
+                  for start, end in zip(starts, ends)]
+
+        if os.name == 'posix':
+            # the workers opening the blocks of shared memory use the
+            # tracker of this process, rather than ones of their own which
+            # would complain when the workers exit
+            resource_tracker.ensure_running()
+
+        parts, bad_fixups, large_runs = [], [], {}
+        blocks = []
+        try:
+            for start, end in zip(starts, ends):
+                blocks.append(_allocate(end - start))
+
+            with ProcessPoolExecutor(max_workers=self._workers) as executor:
+                results = executor.map(
+                    decode_range, itertools.repeat(self._opener), ranges,
+                    itertools.repeat(record_size),
+                    itertools.repeat(parent.bytes_per_sector),
+                    [shm.name for shm, _ in blocks],
+                    [layout for _, layout in blocks]
+                )
+                for start, (bad, variable, large) in zip(starts, results):
+                    shm, layout = blocks.pop(0)
+                    part = _release(shm, layout)
+                    part.update(variable)
+                    parts.append(part)
+
+                    bad_fixups.append(bad + start)
+                    large_runs.update((start + i, runs)
+                                      for i, runs in large.items())
+        finally:
+            for shm, _ in blocks:
+                shm.close()
+                shm.unlink()
+
+        self.bad_fixups = np.concatenate(bad_fixups or [[]]).astype(np.int64)
+        if len(self.bad_fixups):
+            parent.logger.warning('%d MFT record(s) with bad fixups, '
+                                  'the first is %d', len(self.bad_fixups),
+                                  self.bad_fixups[0])
+
+        if not parts:
+            return None, large_runs
+
+        return _concatenate(parts, {'names': 'name_lengths',
+                                    'runs': 'run_counts'}), large_runs
+
+    def enumerate_paths(self):
+        """Enumerate the records along with their paths, see
+        :meth:`BulkRecordEnumerator.enumerate_paths`.
+        """
+
+        columns, large_runs = self._decode()
+        if columns is None:
+            return
+
+        valid = columns['valid']
+        names, name_offsets = columns['names'], columns['names_offsets']
+        parent_references = columns['parent_references']
+
+        filenames = {}
+        for i in np.flatnonzero(columns['has_fn']).tolist():
+            name = names[name_offsets[i]:name_offsets[i + 1]].tobytes()
+            filenames[i] = (name.decode('utf-16-le', 'surrogatepass'),
+                            int(parent_references[i]))
+
+        paths = resolve_paths(columns['sequence_number'], valid, filenames)
+
+        valid = valid.copy()
+        # the records reserved after the system files are skipped, as by
+        # MFTEnumerator
+        valid[12:16] = False
+
+        # the columns are taken as lists at once, rather than item by item,
+        # and the times as Python integers, as by indxparse
+        lsns = columns['lsn'].tolist()
+        sequence_numbers = columns['sequence_number'].tolist()
+        flags = columns['flags'].tolist()
+        has_si, si_times = (columns['has_si'].tolist(),
+                            columns['si_times'].tolist())
+        has_fn, fn_times = (columns['has_fn'].tolist(),
+                            columns['fn_times'].tolist())
+        has_data, non_resident = (columns['has_data'].tolist(),
+                                  columns['non_resident'].tolist())
+        runs, run_offsets = (columns['runs'].tolist(),
+                             columns['runs_offsets'].tolist())
+
+        for i in np.flatnonzero(valid).tolist():
+            data = None
+            if has_data[i]:
+                record_runs = large_runs.get(i)
+                if record_runs is None:
+                    record_runs = runs[run_offsets[i]:run_offsets[i + 1]]
+                data = DataAttribute(non_resident[i], _Runlist(record_runs))
+
+            record = _RecordView(lsns[i], sequence_numbers[i], flags[i],
+                                 _Times(si_times[i]) if has_si[i] else None,
+                                 _Times(fn_times[i]) if has_fn[i] else None,
+                                 data)
+
+            yield record, paths[i]
@@ -0,0 +1,111 @@
+# encoding: utf-8
+"""
+    drive.fs.ntfs.paths
+    ~~~~~~~~~~~~~~~~~~~
+
+    This module implements :func:`resolve_paths`, which computes the full
+    paths of all the records of an MFT at once.
+
+    :meth:`MFTEnumerator.get_path` resolves a path by fetching the parents of
+    the record one by one, with a cache of limited size, so the same parents
+    are fetched and decoded over and over on large MFTs. Here the file name
+    and the parent reference of every record are taken into a table first,
+    then every path is computed exactly once, from the root down, in time
+    linear in the number of records.
+"""
+import os
+
+import numpy as np
+
+from .indxparse.MFT import MFTEnumerator
+
+
+ROOT = 5
+
+# state of the records while resolving
+UNRESOLVED, ON_CHAIN, RESOLVED = 0, 1, 2
+
+
+def resolve_paths(sequence_numbers, valid, filenames):
+    """Compute the paths of the records of an MFT, the same way as
+    :meth:`MFTEnumerator.get_path` does: the root record gives an empty path,
+    records without a file name give :attr:`MFTEnumerator.UNKNOWN_ENTRY`, and
+    records whose parent is invalid or of another sequence number are put
+    under :attr:`MFTEnumerator.ORPHAN_ENTRY`. The path of a record whose
+    parents lead back to itself starts with
+    :attr:`MFTEnumerator.CYCLE_ENTRY`, followed by the names of the cycle as
+    seen from that record.
+
+    :param sequence_numbers: the sequence number of every record, e.g. the
+                             column of :func:`read_headers`.
+    :param valid: mask of the records which can be read, i.e. whose magic is
+                  FILE.
+    :param filenames: dict of the records with a file name, mapping their
+                      number to a (file name, parent reference) tuple.
+
+    returns a list of the paths, `None` for the records not in `filenames`
+    other than the root.
+    """
+
+    n = len(sequence_numbers)
+    paths = [None] * n
+    state = np.zeros(n, dtype=np.uint8)
+
+    numbers = np.fromiter(filenames, dtype=np.int64, count=len(filenames))
+    references = np.fromiter((ref for _, ref in filenames.values()),
+                             dtype=np.uint64, count=len(filenames))
+    parents = (references & 0xffffffffffff).astype(np.int64)
+    parent_sequence_numbers = (references >> 48).astype(np.int64)
+
+    # records whose parent can't be followed are orphans, the others are
+    # linked to their parent
+    parent = np.full(n, -1, dtype=np.int64)
+    known = parents < n
+    linked = np.zeros(len(numbers), dtype=bool)
+    linked[known] = (valid[parents[known]] &
+                     (sequence_numbers[parents[known]] ==
+                      parent_sequence_numbers[known]))
+    parent[numbers[linked]] = parents[linked]
+
+    for num in numbers[~linked].tolist():
+        paths[num] = os.path.join(MFTEnumerator.ORPHAN_ENTRY,
+                                  filenames[num][0])
+        state[num] = RESOLVED
+
+    # the root and the records without a file name end the chains
+    for num in np.flatnonzero(valid).tolist():
+        if num == ROOT:
+            paths[num] = ''
+            state[num] = RESOLVED
+        elif num not in filenames:
+            paths[num] = MFTEnumerator.UNKNOWN_ENTRY
+            state[num] = RESOLVED
+
+    for num in numbers.tolist():
+        if state[num] == RESOLVED:
+            continue
+
+        # follow the parents up to a resolved record, or a record of the
+        # chain itself, i.e. a cycle
+        chain = []
+        while state[num] == UNRESOLVED:
+            state[num] = ON_CHAIN
+            chain.append(num)
+            num = parent[num]
+
+        if state[num] == ON_CHAIN:
+            cycle = chain[chain.index(num):]
+            del chain[len(chain) - len(cycle):]
+            for i, member in enumerate(cycle):
+                # the cycle is walked up from the member, back to it
+                names = [filenames[cycle[(i - j) % len(cycle)]][0]
+                         for j in range(1, len(cycle) + 1)]
+                paths[member] = os.path.join(MFTEnumerator.CYCLE_ENTRY,
+                                             *names)
+                state[member] = RESOLVED
+
+        for num in reversed(chain):
+            paths[num] = os.path.join(paths[parent[num]], filenames[num][0])
+            state[num] = RESOLVED
+
+    return paths
@@ -0,0 +1,676 @@
+# encoding: utf-8
+"""
+    drive.fs.ntfs.records
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :func:`decode_record`, a fast decoder of MFT
+    records, and :class:`RecordEnumerator`, which enumerates MFT records with
+    it.
+
+    The records of :mod:`indxparse` declare their fields one by one on every
+    instance, creating a closure and formatting a debug message per field.
+    The decoder here unpacks the header, the attribute headers, the standard
+    information and the file names with precompiled :class:`struct.Struct`
+    layouts in one pass, into light objects with `__slots__`. They have the
+    methods of the :mod:`indxparse` ones used by :class:`NTFS` and
+    :class:`MFTEnumerator`, and give the same values.
+
+    :class:`BulkRecordEnumerator` reads the whole $MFT along its data runs
+    instead, and takes the headers of all the records as columns of a NumPy
+    structured array at once, see :func:`read_headers`, so that only the
+    records with a valid header are decoded. Their fixups are applied all at
+    once beforehand as well, see :func:`apply_fixups`.
+"""
+import array
+import logging
+import struct
+
+import numpy as np
+
+from misc import InvalidRecordException
+from .indxparse.BinaryParser import parse_filetime, OverrunBufferException
+from .indxparse.MFT import MFTEnumerator, MFTRecord, FixupBlock, ATTR_TYPE, \
+    MFT_RECORD_FLAGS
+from .paths import resolve_paths
+
+
+MAGIC_FILE = 0x454c4946
+
+# magic, usa_offset, usa_count, lsn, sequence_number, link_count,
+# attrs_offset, flags, bytes_in_use, bytes_allocated, base_mft_record,
+# next_attr_instance, reserved, mft_record_number
+RECORD_HEADER = struct.Struct('<IHHQHHHHIIQHHI')
+# type, size, non_resident, name_length, name_offset, flags, instance
+ATTRIBUTE_HEADER = struct.Struct('<IIBBHHH')
+# value_length, value_offset
+RESIDENT_HEADER = struct.Struct('<IH')
+# runlist_offset
+NON_RESIDENT_HEADER = struct.Struct('<H')
+# created, modified, changed and accessed times
+TIMES = struct.Struct('<QQQQ')
+# mft_parent_reference, then the times, then at 0x40 filename_length and
+# filename_type
+FILENAME = struct.Struct('<QQQQQ')
+
+DWORD = struct.Struct('<I')
+
+# the header fields taken as columns by read_headers, with their offsets
+HEADER_COLUMNS = [('magic', '<u4', 0x00),
+                  ('lsn', '<u8', 0x08),
+                  ('sequence_number', '<u2', 0x10),
+                  ('link_count', '<u2', 0x12),
+                  ('flags', '<u2', 0x16),
+                  ('base_mft_record', '<u8', 0x20),
+                  ('mft_record_number', '<u4', 0x2c)]
+
+# the size of the fields of the attribute headers, which indxparse reads
+# whether they're used or not
+NON_RESIDENT_HEADER_SIZE = 0x40
+RESIDENT_HEADER_SIZE = 0x18
+STANDARD_INFORMATION_SIZE = 0x30
+FILENAME_SIZE = 0x42
+
+
+class UnsupportedRecord(Exception):
+    """
+    Raised for records the decoder leaves to :class:`MFTRecord`, e.g. those
+    with fields out of bounds.
+    """
+    pass
+
+
+class StandardInformation:
+    """
+    Times of a standard information attribute.
+    """
+    __slots__ = ['_times']
+
+    def __init__(self, value):
+        """
+        :param value: the value of the attribute.
+        """
+
+        if len(value) < STANDARD_INFORMATION_SIZE:
+            raise UnsupportedRecord
+
+        self._times = TIMES.unpack_from(value)
+
+    def filetimes(self):
+        """Get the created, modified, changed and accessed times as FILETIME
+        integers."""
+
+        return self._times
+
+    def created_time(self):
+        return parse_filetime(self._times[0])
+
+    def modified_time(self):
+        return parse_filetime(self._times[1])
+
+    def changed_time(self):
+        return parse_filetime(self._times[2])
+
+    def accessed_time(self):
+        return parse_filetime(self._times[3])
+
+
+class FilenameAttribute:
+    """
+    A file name attribute.
+    """
+    __slots__ = ['_fields', '_filename_type', '_filename']
+
+    def __init__(self, value):
+        """
+        :param value: the value of the attribute.
+        """
+
+        self._fields = FILENAME.unpack_from(value)
+        self._filename_type = value[0x41]
+        self._filename = value[FILENAME_SIZE:
+                               FILENAME_SIZE + 2 * value[0x40]].decode('utf16')
+
+    def filetimes(self):
+        """Get the created, modified, changed and accessed times as FILETIME
+        integers."""
+
+        return self._fields[1:]
+
+    def mft_parent_reference(self):
+        return self._fields[0]
+
+    def created_time(self):
+        return parse_filetime(self._fields[1])
+
+    def modified_time(self):
+        return parse_filetime(self._fields[2])
+
+    def changed_time(self):
+        return parse_filetime(self._fields[3])
+
+    def accessed_time(self):
+        return parse_filetime(self._fields[4])
+
+    def filename_type(self):
+        return self._filename_type
+
+    def filename(self):
+        return self._filename
+
+
+class Runlist:
+    """
+    Runlist of a non-resident attribute, decoded when iterated over.
+    """
+    __slots__ = ['_buf', '_offset']
+
+    def __init__(self, buf, offset):
+        """
+        :param buf: the record.
+        :param offset: offset of the runlist in the record.
+        """
+
+        self._buf = buf
+        self._offset = offset
+
+    def runs(self, length=None):
+        """Iterate over the runs as (volume offset, length) tuples, see
+        :meth:`indxparse.MFT.Runlist.runs`.
+
+        :param length: optional, the runs end this many bytes after the start
+                       of the runlist.
+        """
+
+        buf, n = self._buf, len(self._buf)
+        offset = self._offset
+        last_offset = 0
+        while True:
+            if offset >= n:
+                raise OverrunBufferException(offset, n)
+
+            header = buf[offset]
+            length_length, offset_length = header & 0x0f, header >> 4
+            start = offset + 1 + length_length
+            end = start + offset_length
+            if (length_length and start > n) or (offset_length and end > n):
+                raise OverrunBufferException(offset, n)
+
+            if (not header or (length and offset >= self._offset + length) or
+                    not length_length or not offset_length):
+                break
+
+            run_length = int.from_bytes(buf[offset + 1:start], 'little')
+            last_offset += int.from_bytes(buf[start:end], 'little',
+                                          signed=True)
+            offset = end
+
+            yield last_offset, run_length
+
+
+class DataAttribute:
+    """
+    The unnamed data attribute of a record.
+    """
+    __slots__ = ['_non_resident', '_runlist']
+
+    def __init__(self, non_resident, runlist):
+        """
+        :param non_resident: the non-resident flag of the attribute.
+        :param runlist: the :class:`Runlist`, `None` if resident.
+        """
+
+        self._non_resident = non_resident
+        self._runlist = runlist
+
+    def non_resident(self):
+        return self._non_resident
+
+    def runlist(self):
+        if self._runlist is None:
+            raise AttributeError('resident attributes have no runlist')
+
+        return self._runlist
+
+
+class Record:
+    """
+    An MFT record, decoded at once by :func:`decode_record`.
+    """
+    __slots__ = ['inode', '_header', '_standard_information',
+                 '_filename_information', '_data_attribute']
+
+    def __init__(self, buf, inode=None, fixed=False):
+        """
+        :param buf: the record as a `bytearray`, fixups are applied in place.
+        :param inode: optional, the number of the record.
+        :param fixed: optional, true if the fixups were applied already, see
+                      :func:`apply_fixups`.
+        """
+
+        header = self._header = RECORD_HEADER.unpack_from(buf)
+        self.inode = inode or header[13]
+
+        if not fixed:
+            _fixup(buf, header[2], header[1])
+
+        self._standard_information = None
+        self._filename_information = None
+        self._data_attribute = None
+
+        _decode_attributes(self, buf, header[6], header[8])
+
+    def magic(self):
+        return self._header[0]
+
+    def lsn(self):
+        return self._header[3]
+
+    def sequence_number(self):
+        return self._header[4]
+
+    def link_count(self):
+        return self._header[5]
+
+    def flags(self):
+        return self._header[7]
+
+    def bytes_in_use(self):
+        return self._header[8]
+
+    def base_mft_record(self):
+        return self._header[10]
+
+    def mft_record_number(self):
+        return self._header[13]
+
+    def is_directory(self):
+        return self._header[7] & MFT_RECORD_FLAGS.MFT_RECORD_IS_DIRECTORY
+
+    def is_active(self):
+        return self._header[7] & MFT_RECORD_FLAGS.MFT_RECORD_IN_USE
+
+    def standard_information(self):
+        return self._standard_information
+
+    def filename_information(self):
+        return self._filename_information
+
+    def data_attribute(self):
+        return self._data_attribute
+
+
+def _fixup(buf, count, value_offset):
+    """Apply the fixups of a record in place, see :meth:`FixupBlock.fixup`.
+
+    :param buf: the record.
+    :param count: number of the fixups, plus one.
+    :param value_offset: offset of the fixup value, which the fixups follow.
+    """
+
+    if (value_offset + 2 * max(count, 1) > len(buf) or
+            FixupBlock.sector_size * (count - 1) > len(buf)):
+        raise UnsupportedRecord
+
+    value = buf[value_offset:value_offset + 2]
+    for i in range(count - 1):
+        offset = FixupBlock.sector_size * (i + 1) - 2
+        if buf[offset:offset + 2] != value:
+            logging.warning('Bad fixup at %s', hex(offset))
+            continue
+
+        fixup = value_offset + 2 + 2 * i
+        buf[offset:offset + 2] = buf[fixup:fixup + 2]
+
+
+def apply_fixups(records, sector_size, rows=None):
+    """Apply the fixups of many MFT or INDX records at once, in place. As
+    with :meth:`FixupBlock.fixup`, a sector whose check value doesn't match
+    the one of its record is left as it is. No warning is logged, the records
+    with such sectors are returned instead, along with the records whose
+    update sequence array is out of bounds, which are left as they are.
+
+    :param records: the records, a (n, record size) `numpy.uint8` array.
+    :param sector_size: the size of the sectors.
+    :param rows: optional, the indices of the records to apply the fixups of,
+                 all of them by default.
+
+    returns the sorted indices of the records with bad fixups.
+    """
+
+    if rows is None:
+        rows = np.arange(len(records))
+    rows = np.asarray(rows, dtype=np.intp)
+    size = records.shape[1]
+
+    usa_offset = (records[rows, 4].astype(np.int64) |
+                  records[rows, 5].astype(np.int64) << 8)
+    usa_count = (records[rows, 6].astype(np.int64) |
+                 records[rows, 7].astype(np.int64) << 8)
+
+    bad = ~((usa_offset + 2 * np.maximum(usa_count, 1) <= size) &
+            (sector_size * (usa_count - 1) <= size))
+
+    # records are almost always laid out alike, so there are few groups
+    layouts = np.unique(np.stack([usa_offset[~bad], usa_count[~bad]]),
+                        axis=1)
+    for offset, count in layouts.T.tolist():
+        positions = np.flatnonzero(~bad & (usa_offset == offset) &
+                                   (usa_count == count))
+        group = rows[positions]
+        value = records[group, offset:offset + 2]
+
+        for i in range(count - 1):
+            end = sector_size * (i + 1)
+            match = (records[group, end - 2:end] == value).all(axis=1)
+            bad[positions[~match]] = True
+
+            fixed = group[match]
+            fixup = offset + 2 + 2 * i
+            records[fixed, end - 2:end] = records[fixed, fixup:fixup + 2]
+
+    return np.sort(rows[bad])
+
+
+class _FixedMFTRecord(MFTRecord):
+    """
+    :class:`MFTRecord` of a buffer whose fixups were applied already.
+    """
+    def fixup(self, num_fixups, fixup_value_offset):
+        pass
+
+
+def _decode_attributes(record, buf, offset, bytes_in_use):
+    """Walk the attributes of a record, keeping the first standard
+    information, the most complete file name (see
+    :meth:`MFTRecord.filename_information`) and the first unnamed data
+    attribute.
+
+    :param record: the :class:`Record`.
+    :param buf: the record.
+    :param offset: offset of the first attribute.
+    :param bytes_in_use: size of the record in use.
+    """
+
+    si_found = win32_name = False
+    n = len(buf)
+
+    while True:
+        type_ = DWORD.unpack_from(buf, offset)[0]
+        if type_ == 0 or type_ == 0xffffffff:
+            break
+        size = DWORD.unpack_from(buf, offset + 4)[0]
+        if offset + size > bytes_in_use:
+            break
+
+        non_resident, name_length, name_offset = \
+            ATTRIBUTE_HEADER.unpack_from(buf, offset)[2:5]
+
+        value = None
+        if non_resident > 0:
+            if offset + NON_RESIDENT_HEADER_SIZE > n:
+                raise UnsupportedRecord
+        else:
+            if offset + RESIDENT_HEADER_SIZE > n:
+                raise UnsupportedRecord
+
+            value_length, value_offset = \
+                RESIDENT_HEADER.unpack_from(buf, offset + 0x10)
+            if value_length:
+                start = offset + value_offset
+                if start + value_length > n:
+                    raise UnsupportedRecord
+                value = bytes(buf[start:start + value_length])
+
+        if type_ == ATTR_TYPE.STANDARD_INFORMATION and not si_found:
+            si_found = True
+            if non_resident == 0:
+                if value is None:
+                    raise UnsupportedRecord
+                record._standard_information = StandardInformation(value)
+        elif type_ == ATTR_TYPE.FILENAME_INFORMATION and not win32_name:
+            # non-resident or too short file names are skipped
+            if value is not None and len(value) >= FILENAME_SIZE:
+                fn = FilenameAttribute(value)
+                record._filename_information = fn
+                # Win32 and Win32 & DOS names are taken at once
+                win32_name = fn.filename_type() in (0x0001, 0x0003)
+        elif type_ == ATTR_TYPE.DATA and record._data_attribute is None:
+            start = offset + name_offset
+            name = bytes(buf[start:start + 2 * name_length]).decode('utf16')
+            if name == '':
+                runlist = None
+                if non_resident > 0:
+                    runlist = Runlist(buf, offset + NON_RESIDENT_HEADER.
+                                      unpack_from(buf, offset + 0x20)[0])
+                record._data_attribute = DataAttribute(non_resident,
+                                                       runlist)
+
+        if size == 0:
+            # indxparse would read the same attribute over and over
+            break
+        offset += size
+
+
+def decode_record(buf, inode=None, fixed=False):
+    """Decode an MFT record, returns a :class:`Record`. Records out of the
+    ordinary, e.g. with fields out of bounds, are decoded by
+    :class:`MFTRecord` instead, which behaves as it always did with them.
+
+    :param buf: the record.
+    :param inode: optional, the number of the record.
+    :param fixed: optional, true if the fixups were applied already, see
+                  :func:`apply_fixups`.
+    """
+
+    try:
+        return Record(bytearray(buf), inode, fixed)
+    except (UnsupportedRecord, struct.error, IndexError, UnicodeDecodeError):
+        cls = _FixedMFTRecord if fixed else MFTRecord
+        return cls(array.array('B', bytes(buf)), 0, False, inode=inode)
+
+
+class RecordEnumerator(MFTEnumerator):
+    """
+    :class:`MFTEnumerator` decoding records with :func:`decode_record`.
+    """
+    def get_record(self, record_num):
+        if self._record_cache.exists(record_num):
+            self._record_cache.touch(record_num)
+
+            return self._record_cache.get(record_num)
+
+        start = (record_num * self._parent.bytes_per_mft_record
+                 + self._parent.mft_abs_pos)
+        self._stream.seek(start)
+        record_buf = self._stream.read()
+
+        if len(record_buf) < 4 or \
+                DWORD.unpack_from(record_buf)[0] != MAGIC_FILE:
+            raise InvalidRecordException
+
+        record = decode_record(record_buf, inode=record_num)
+        self._record_cache.insert(record_num, record)
+
+        return record
+
+
+def read_headers(buf, record_size):
+    """Get the headers of consecutive MFT records as a NumPy structured
+    array, with a column per field of :data:`HEADER_COLUMNS`. The headers are
+    viewed in place, i.e. without copying `buf`.
+
+    :param buf: the records, a buffer of a multiple of `record_size` bytes.
+    :param record_size: size of the records.
+    """
+
+    names, formats, offsets = zip(*HEADER_COLUMNS)
+    dtype = np.dtype({'names': names, 'formats': formats,
+                      'offsets': offsets, 'itemsize': record_size})
+
+    return np.frombuffer(buf, dtype=dtype, count=len(buf) // record_size)
+
+
+def mft_extents(partition, stream, max_length=16 * 1024 * 1024):
+    """Get the extents of the $MFT of a partition along the data runs of its
+    first record, as (absolute offset, length) tuples, up to the last whole
+    record. Only the first record is read.
+
+    :param partition: the :class:`NTFS` partition.
+    :param stream: the stream of the partition, read with `read_at`.
+    :param max_length: optional, the runs are cut into extents of at most this
+                       many bytes.
+    """
+
+    record_size = partition.bytes_per_mft_record
+    first = decode_record(stream.read_at(partition.mft_abs_pos, record_size),
+                          inode=0)
+
+    cluster_list = []
+    data_attr = first.data_attribute()
+    if data_attr and data_attr.non_resident() > 0:
+        cluster_list = partition.runs_to_cluster_list(
+            data_attr.runlist().runs()
+        )
+    if not cluster_list:
+        # only the first record is known
+        lcn = int(partition.abs_b2lcn(partition.mft_abs_pos))
+        cluster_list = [[lcn, lcn]]
+
+    extents = []
+    rest = (sum(end - start + 1 for start, end in cluster_list) *
+            partition.bytes_per_cluster)
+    rest -= rest % record_size
+    for start, end in cluster_list:
+        offset = partition.abs_lcn2b(start)
+        end_offset = min(partition.abs_lcn2b(end + 1), offset + rest)
+        rest -= end_offset - offset
+        while offset < end_offset:
+            length = min(max_length, end_offset - offset)
+            extents.append((offset, length))
+            offset += length
+
+    return extents
+
+
+class BulkRecordEnumerator(RecordEnumerator):
+    """
+    :class:`RecordEnumerator` reading the whole $MFT at once, along the data
+    runs of its first record, rather than record by record. Records whose
+    magic is not FILE are skipped by their header alone, e.g. the free ones
+    never used, and the fixups of the others are applied at once, the records
+    with bad fixups being kept in `bad_fixups`.
+    """
+    def __init__(self, parent, stream,
+                 record_cache=None, path_cache=None):
+        """
+        :param parent: the :class:`NTFS` partition.
+        :param stream: the stream of the partition, read with `read_at`.
+        :param record_cache: optional, the cache of the decoded records.
+        :param path_cache: optional, the cache of the paths of the records.
+        """
+
+        super(BulkRecordEnumerator, self).__init__(parent, stream,
+                                                   record_cache, path_cache)
+
+        self._records = None
+        self.headers = None
+        self.bad_fixups = None
+
+    def load(self):
+        """Read the $MFT and its headers, unless already done."""
+
+        if self._records is not None:
+            return
+
+        parent = self._parent
+        record_size = parent.bytes_per_mft_record
+
+        extents = mft_extents(parent, self._stream)
+        records = np.zeros(sum(length for _, length in extents),
+                           dtype=np.uint8)
+        # the records past the end of the image are left zeroed
+        self._stream.read_extents(extents, out=records)
+
+        self.headers = read_headers(records, record_size)
+        records = records.reshape(-1, record_size)
+        self.bad_fixups = apply_fixups(
+            records, parent.bytes_per_sector,
+            np.flatnonzero(self.headers['magic'] == MAGIC_FILE)
+        )
+        if len(self.bad_fixups):
+            parent.logger.warning('%d MFT record(s) with bad fixups, '
+                                  'the first is %d', len(self.bad_fixups),
+                                  self.bad_fixups[0])
+        self._records = records
+
+    def _decode(self, record_num):
+        """Decode a record of the $MFT, which must have been read.
+
+        :param record_num: the number of the record.
+        """
+
+        if not (0 <= record_num < len(self.headers) and
+                self.headers['magic'][record_num] == MAGIC_FILE):
+            raise InvalidRecordException
+
+        return decode_record(self._records[record_num], inode=record_num,
+                             fixed=True)
+
+    def get_record(self, record_num):
+        if self._record_cache.exists(record_num):
+            self._record_cache.touch(record_num)
+
+            return self._record_cache.get(record_num)
+
+        self.load()
+        record = self._decode(record_num)
+        self._record_cache.insert(record_num, record)
+
+        return record
+
+    def _valid(self):
+        """Get the mask of the records whose magic is FILE."""
+
+        self.load()
+
+        return self.headers['magic'] == MAGIC_FILE
+
+    def _record_numbers(self, valid):
+        """Get the numbers of the records to enumerate.
+
+        :param valid: the mask of the records whose magic is FILE.
+        """
+
+        valid = valid.copy()
+        # the records reserved after the system files are skipped, as by
+        # MFTEnumerator
+        valid[12:16] = False
+
+        return np.flatnonzero(valid).tolist()
+
+    def enumerate_records(self):
+        for record_num in self._record_numbers(self._valid()):
+            yield self.get_record(record_num)
+
+    def enumerate_paths(self):
+        """Enumerate the records along with their paths. All the records are
+        decoded first, then their paths are resolved at once by
+        :func:`resolve_paths`, from the numbers of the records rather than the
+        ones in their headers.
+        """
+
+        valid = self._valid()
+
+        records, filenames = {}, {}
+        for record_num in np.flatnonzero(valid).tolist():
+            record = records[record_num] = self._decode(record_num)
+            fn = record.filename_information()
+            if fn:
+                filenames[record_num] = (fn.filename(),
+                                         fn.mft_parent_reference())
+
+        paths = resolve_paths(self.headers['sequence_number'], valid,
+                              filenames)
+        for record_num in self._record_numbers(valid):
+            # the records are let go of once enumerated
+            yield records.pop(record_num), paths[record_num]
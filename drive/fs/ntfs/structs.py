@@ -6,18 +6,24 @@
     This module implements the structs used when parsing NTFS partition and class
     :class:`NTFS`.
 """
+from array import array
 import datetime
 from functools import partial
 
 from construct import Struct, Bytes, String, ULInt16, ULInt8, ULInt64, SLInt8,\
     Magic, Value
+import numpy as np
 from pandas import DataFrame
 
 from drive.fs import Partition
+from drive.fs.cluster_index import ClusterIndex
 from .misc import StrictlyUnused, Unused
 from .indxparse.MFT import MFTEnumerator, FixupBlock
+from .parallel import INT64_MAX, ParallelRecordEnumerator, stream_opener
+from .records import RecordEnumerator, BulkRecordEnumerator
 from drive.keys import *
 from misc import MAGIC_END_SECTION
+from stream import PrefetchStream, as_bytes_stream
 from stream.auxiliary import MFTStream
 
 
@@ -87,16 +93,42 @@ class NTFS(Partition):
                     'is_directory', 'is_deleted',
                     'id']
 
-    def __init__(self, stream, preceding_bytes, ui_handler=None):
+    def __init__(self, stream, preceding_bytes, ui_handler=None,
+                 prefetch=False, fast_decoder=True, bulk=False, workers=1,
+                 stream_opener=None):
         """
         :param stream: the stream to parse.
         :param preceding_bytes: bytes preceding this partition.
+        :param prefetch: if true, the MFT is read ahead in background while
+                         being parsed.
+        :param fast_decoder: optional, if false, the MFT records are decoded
+                             by :mod:`indxparse` rather than by
+                             :func:`decode_record`, which gives the same
+                             values faster.
+        :param bulk: optional, if true, the whole MFT is read into memory at
+                     once along its data runs, see
+                     :class:`BulkRecordEnumerator`, which implies the fast
+                     decoder.
+        :param workers: optional, number of processes decoding the MFT, see
+                        :class:`ParallelRecordEnumerator`, which reads the
+                        whole MFT as with `bulk`.
+        :param stream_opener: optional, callable opening the image in the
+                              processes, which has to be picklable, by
+                              default :func:`stream_opener` of `stream`.
         """
 
         super(NTFS, self).__init__(self.type, stream, preceding_bytes,
-                                   lambda s: NTFSBootSector.parse_stream(s),
+                                   lambda s: NTFSBootSector.parse_stream(
+                                       as_bytes_stream(s)
+                                   ),
                                    ui_handler=ui_handler)
 
+        self.prefetch = prefetch
+        self.fast_decoder = fast_decoder
+        self.bulk = bulk
+        self.workers = workers
+        self.stream_opener = stream_opener
+
         self.bytes_per_sector = self.boot_sector[k_bytes_per_sector]
         FixupBlock.set_sector_size(self.bytes_per_sector)
 
@@ -111,6 +143,9 @@ class NTFS(Partition):
 
         self.mft_abs_pos = self.abs_lcn2b(
             self.boot_sector[k_cluster_number_of_MFT_start])
+        # data runs of the non-resident data of the entries, deleted or not,
+        # as rows of (id, first cluster, last cluster), see cluster_index
+        self.data_runs = np.zeros((0, 3), dtype=np.int64)
         # stream.seek(mft_abs_pos, os.SEEK_SET)
         self.logger.info('stream jumped to %s and ready to read MFT records',
                          hex(self.mft_abs_pos))
@@ -136,13 +171,55 @@ class NTFS(Partition):
     def __iter__(self):
         """Implement iterator protocol for pythonicness."""
 
-        mft_stream = MFTStream(self.stream,
-                               self,
-                               self.abs_lcn2b,
-                               self.mft_abs_pos,
-                               self.bytes_per_mft_record)
-        mft_enumerator = MFTEnumerator(self,
-                                       mft_stream)
+        # flat rather than a list per entry, as there's a run or so for
+        # every entry
+        runs = array('q')
+
+        stream = PrefetchStream(self.stream) if self.prefetch else self.stream
+        try:
+            for entry in self._iter_records(stream, runs):
+                yield entry
+        finally:
+            if self.prefetch:
+                stream.stop()
+
+            self.data_runs = np.frombuffer(runs, dtype=np.int64).reshape(-1, 3)
+
+    def _iter_records(self, stream, runs):
+        """Parse the MFT records from the given stream.
+
+        :param stream: the stream to read the MFT from.
+        :param runs: `array` the data runs of the entries are appended to,
+                     see :attr:`data_runs`.
+        """
+
+        opener = None
+        if self.workers > 1:
+            opener = self.stream_opener or stream_opener(self.stream)
+            if opener is None:
+                self.logger.warning('no way to open the image in other '
+                                    'processes, the MFT is decoded in this '
+                                    'one')
+
+        if opener is not None:
+            mft_stream = None
+            mft_enumerator = ParallelRecordEnumerator(self, stream, opener,
+                                                      self.workers)
+        elif self.bulk or self.workers > 1:
+            mft_stream = None
+            mft_enumerator = BulkRecordEnumerator(self, stream)
+        else:
+            mft_stream = MFTStream(stream,
+                                   self,
+                                   self.abs_lcn2b,
+                                   self.mft_abs_pos,
+                                   self.bytes_per_mft_record)
+            enumerator = (RecordEnumerator if self.fast_decoder
+                          else MFTEnumerator)
+            mft_enumerator = enumerator(self, mft_stream)
+        # the default of the times, datetimes being immutable
+        epoch = datetime.datetime.utcfromtimestamp(0)
+
         for id_, (record, record_path) in enumerate(
                 mft_enumerator.enumerate_paths()
         ):
@@ -150,9 +227,10 @@ class NTFS(Partition):
             fn = record.filename_information()
 
             if record_path.endswith('$MFT'):
-                mft_stream.set_data_runs(
-                    record.data_attribute().runlist().runs()
-                )
+                if mft_stream is not None:
+                    mft_stream.set_data_runs(
+                        record.data_attribute().runlist().runs()
+                    )
                 continue
 
             if not (record.is_active() or fn):
@@ -167,16 +245,26 @@ class NTFS(Partition):
             else:
                 is_directory = False
 
+            # the data runs of every entry are kept for the cluster index,
+            # only the ones of deleted entries are in the rows
+            data_cluster_list = []
+            data_attr = record.data_attribute()
+            if data_attr and data_attr.non_resident() > 0:
+                data_cluster_list = self.runs_to_cluster_list(
+                    data_attr.runlist().runs()
+                )
+                for start, end in data_cluster_list:
+                    # runs of corrupt records may not even fit
+                    if abs(start) <= INT64_MAX and abs(end) <= INT64_MAX:
+                        runs.extend((id_ - 1, start, end))
+
             if record.is_active():
                 is_deleted = False
             else:
                 is_deleted = True
 
-                data_attr = record.data_attribute()
                 if data_attr and data_attr.non_resident() > 0:
-                    cluster_list = self.runs_to_cluster_list(
-                        data_attr.runlist().runs()
-                    )
+                    cluster_list = data_cluster_list
                     if cluster_list:
                         first_cluster = cluster_list[0][0]
                     else:
@@ -185,20 +273,20 @@ class NTFS(Partition):
                             self.mft_abs_pos
                         ) // self.bytes_per_cluster
 
-            si_create_time = datetime.datetime.utcfromtimestamp(0)
-            si_modify_time = datetime.datetime.utcfromtimestamp(0)
-            si_access_time = datetime.datetime.utcfromtimestamp(0)
-            si_mft_time = datetime.datetime.utcfromtimestamp(0)
+            si_create_time = epoch
+            si_modify_time = epoch
+            si_access_time = epoch
+            si_mft_time = epoch
             if si:
                 si_create_time = si.created_time()
                 si_modify_time = si.modified_time()
                 si_access_time = si.accessed_time()
                 si_mft_time = si.changed_time()
 
-            fn_create_time = datetime.datetime.utcfromtimestamp(0)
-            fn_modify_time = datetime.datetime.utcfromtimestamp(0)
-            fn_access_time = datetime.datetime.utcfromtimestamp(0)
-            fn_mft_time = datetime.datetime.utcfromtimestamp(0)
+            fn_create_time = epoch
+            fn_modify_time = epoch
+            fn_access_time = epoch
+            fn_mft_time = epoch
             if fn:
                 fn_create_time = fn.created_time()
                 fn_modify_time = fn.modified_time()
@@ -234,6 +322,31 @@ class NTFS(Partition):
 
         return self.lcn2b(lcn) + self.preceding_bytes
 
+    def abs_b2lcn(self, offset):
+        """Convert absolute offset to logical cluster number, the reverse of
+        :meth:`abs_lcn2b`.
+
+        :param offset: the offset, a scalar or an array, e.g. a sector number
+                       times :attr:`bytes_per_sector`.
+        """
+
+        return ((np.asarray(offset, dtype=np.int64) - self.preceding_bytes) //
+                self.bytes_per_cluster)
+
+    def cluster_index(self, entries):
+        """Get the :class:`ClusterIndex` of the data runs of the entries, to
+        look up which entries own a cluster, see also :meth:`abs_b2lcn`. The
+        runs are the ones of :attr:`data_runs`, i.e. of the entries in use
+        too, not only of the deleted ones as in the `cluster_list` column.
+
+        :param entries: entries of this partition, see :meth:`get_entries`.
+        """
+
+        runs = self.data_runs[np.isin(self.data_runs[:, 0],
+                                      entries['id'].dropna().astype(np.int64))]
+
+        return ClusterIndex(runs[:, 0], runs[:, 1], runs[:, 2])
+
     def get_entries(self):
         entries = self.get_mft_records()
 
@@ -242,3 +355,22 @@ class NTFS(Partition):
                          else [(None,) * len(self.__mft_attr__)],
                          index=map(lambda x: x[-1], entries),
                          columns=self.__mft_attr__)
+
+    def iter_entry_batches(self, batch_size=64 * 1024):
+        batch, count = [], 0
+        for entry in self:
+            batch.append(entry)
+            if len(batch) == batch_size:
+                count += len(batch)
+                yield DataFrame(batch,
+                                index=map(lambda x: x[-1], batch),
+                                columns=self.__mft_attr__)
+                batch = []
+
+        if batch:
+            count += len(batch)
+            yield DataFrame(batch,
+                            index=map(lambda x: x[-1], batch),
+                            columns=self.__mft_attr__)
+
+        self.logger.info('read %s mft record(s)' % count)
@@ -1,7 +1,11 @@
 # encoding: utf-8
 import os
 
-import pywintypes
+try:
+    import pywintypes
+except ImportError:
+    # not on windows, see stream.LinuxBlockDeviceStream for linux devices
+    pywintypes = None
 
 from .boot_sector.ebr import get_ext_partition_entries
 from .fs.fat32.structs import FAT32BootSector
@@ -9,10 +13,13 @@ from .fs.ntfs.structs import NTFSBootSector
 from .types import registry
 from .keys import k_PartitionEntries, k_partition_type, k_ExtendedPartition
 from .boot_sector import ClassicalMBR
-from stream import WindowsPhysicalDriveStream
+from stream import WindowsPhysicalDriveStream, as_bytes_stream
 
 
 def discover_physical_drives(rng=range(16)):
+    if WindowsPhysicalDriveStream is None:
+        return []
+
     available_drives = []
     for i in rng:
         try:
@@ -25,14 +32,16 @@ def discover_physical_drives(rng=range(16)):
 
 
 def get_partition_table(stream):
-    type_ = stream.read(0xa)[3:]
+    bytes_stream = as_bytes_stream(stream)
+
+    type_ = bytes_stream.read(0xa)[3:]
     stream.seek(0, os.SEEK_SET)
     if b'NTFS' in type_:
-        yield NTFSBootSector.parse_stream(stream)
+        yield NTFSBootSector.parse_stream(bytes_stream)
     elif b'MSDOS' in type_:
-        yield FAT32BootSector.parse_stream(stream)
+        yield FAT32BootSector.parse_stream(bytes_stream)
     else:
-        mbr = ClassicalMBR.parse_stream(stream)
+        mbr = ClassicalMBR.parse_stream(bytes_stream)
         for entry in mbr[k_PartitionEntries]:
             if entry[k_partition_type] == k_ExtendedPartition:
                 for sub_entry in get_ext_partition_entries(entry, stream):
@@ -9,7 +9,8 @@ from drive.utils import discover_physical_drives, get_partition_table, \
     get_partition_obj
 from ..misc import AsyncTaskMixin, human_readable, error_box, new_button, \
     warning_box
-from stream import ImageStream, WindowsPhysicalDriveStream
+from stream import ImageStream, SplitImageStream, CompressedImageStream, \
+    InstrumentedStream, WindowsPhysicalDriveStream
 from ..widgets import ColumnListView
 from drive.keys import *
 
@@ -91,9 +92,19 @@ class PartitionsDialog(QDialog, AsyncTaskMixin):
                 error_box(self, '路径不存在。')
                 return
 
-            self._current_stream = ImageStream(le_image_path.text())
-            self._stream_type = ImageStream
-            self._stream_arg = le_image_path.text()
+            if SplitImageStream.is_first_segment(path):
+                self._current_stream = SplitImageStream.from_first_segment(
+                    path
+                )
+                self._stream_type = SplitImageStream
+            elif CompressedImageStream.is_compressed_image(path):
+                self._current_stream = CompressedImageStream(path)
+                self._stream_type = CompressedImageStream
+            else:
+                self._current_stream = ImageStream(path)
+                self._stream_type = ImageStream
+            self._current_stream = InstrumentedStream(self._current_stream)
+            self._stream_arg = path
 
             self._load_partitions()
 
@@ -157,7 +168,9 @@ class PartitionsDialog(QDialog, AsyncTaskMixin):
             self._current_stream.close()
 
         arg = current.text().lstrip(r'\\.\PhysicalDrive\ ')
-        self._current_stream = WindowsPhysicalDriveStream(arg)
+        self._current_stream = InstrumentedStream(
+            WindowsPhysicalDriveStream(arg)
+        )
         self._stream_type = WindowsPhysicalDriveStream
         self._stream_arg = arg
 
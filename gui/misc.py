@@ -177,7 +177,7 @@ def boolean_item(b, checkable=False):
 
 
 def filter_empty_cluster_list(e):
-    return e[e.cluster_list.map(lambda x: bool(x))]
+    return e[e.cluster_count > 0]
 
 
 class SortableStandardItemModel(QStandardItemModel):
@@ -139,6 +139,11 @@ class BaseSubWindow(QMainWindow, AsyncTaskMixin):
                     _1f - _1, _xf - _x, _2f - _2, _3f - _3, _4f - _4, _5f - _5
                 ))
 
+                io_report = self.partition.io_report()
+                if io_report:
+                    print('I/O statistics of the drive so far:\n%s' %
+                          io_report)
+
         def _target():
             return self.normalize_entries(self.partition.get_entries())
 
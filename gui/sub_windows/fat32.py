@@ -28,6 +28,7 @@ class FAT32SubWindow(BaseSubWindow):
 
     def plot_partition(self):
         figure = plot_fat32(filter_empty_cluster_list(self.entries),
+                            self.partition.extents,
                             log_info=False,
                             logger=self.logger,
                             plot_first_cluster=self.settings.plot_first_cluster,
@@ -38,13 +39,16 @@ class FAT32SubWindow(BaseSubWindow):
 
     @staticmethod
     def _validate_points_by_first_clusters(entries,
+                                           extents,
                                            value_domain,
                                            rect_size,
                                            threshold):
 
         return validate_clusters([entries.id.tolist()],
-                                 [list(zip(first_clusters_of_fat32(entries),
-                                           last_clusters_of_fat32(entries)))],
+                                 [list(zip(first_clusters_of_fat32(entries,
+                                                                   extents),
+                                           last_clusters_of_fat32(entries,
+                                                                  extents)))],
                                  [value_domain],
                                  [rect_size],
                                  [threshold])
@@ -52,6 +56,7 @@ class FAT32SubWindow(BaseSubWindow):
     def validate_first_clusters_with_settings(self):
         return self._validate_points_by_first_clusters(
             filter_empty_cluster_list(self.entries),
+            self.partition.extents,
             (self.settings.cluster_plot_value_domain_min,
              self.settings.cluster_plot_value_domain_max),
             (self.settings.cluster_plot_rect_size_width,
@@ -226,15 +231,10 @@ class FAT32SubWindow(BaseSubWindow):
         return _
 
     def gen_file_row_data(self, row, count):
-        last_cluster = 0
-        if len(row.cluster_list) > 0:
-            if len(row.cluster_list[-1]) > 0:
-                last_cluster = row.cluster_list[-1][-1]
-
         return [count, False, row.abnormal,
                 row.id,
                 row.is_deleted,
-                row.full_path, row.first_cluster, last_cluster,
+                row.full_path, row.first_cluster, row.last_cluster,
                 row.create_time, row.modify_time, row.access_date,
                 row.conclusions,
                 row.abnormal_src if 'abnormal_src' in row else [],
@@ -7,8 +7,9 @@ import numpy as np
 extensions = [Extension('stats.speedup.alg',
                         ['stats/speedup/alg.pyx'],
                         include_dirs=[np.get_include()]),
-              Extension('drive.fs.fat32.speedup._op',
-                        ['drive/fs/fat32/speedup/_op.pyx'])]
+              Extension('drive.fs.fat32.speedup._walker',
+                        ['drive/fs/fat32/speedup/_walker.pyx'],
+                        include_dirs=[np.get_include()])]
 
 setup(
     name='createfile',
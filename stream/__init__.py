@@ -1,7 +1,28 @@
 # encoding: utf-8
 
+from stream.cached_stream import CachedStream
+from stream.compressed_img_stream import CompressedImageStream, \
+    compress_image
 from stream.img_stream import ImageStream
-from stream.windows_drive import WindowsPhysicalDriveStream
+from stream.instrumented_stream import InstrumentedStream
+from stream.linux_drive import LinuxBlockDeviceStream
+from stream.prefetch_stream import PrefetchStream
+from stream.read_only_stream import as_bytes_stream
+from stream.split_img_stream import SplitImageStream
+
+try:
+    from stream.windows_drive import WindowsPhysicalDriveStream
+except ImportError:
+    # win32file is only available on windows
+    WindowsPhysicalDriveStream = None
 
 __all__ = ['WindowsPhysicalDriveStream',
-           'ImageStream']
+           'LinuxBlockDeviceStream',
+           'ImageStream',
+           'SplitImageStream',
+           'CompressedImageStream',
+           'CachedStream',
+           'PrefetchStream',
+           'InstrumentedStream',
+           'as_bytes_stream',
+           'compress_image']
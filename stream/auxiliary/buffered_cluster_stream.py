@@ -6,7 +6,6 @@
     This module implements BufferedClusterStream used in FDT discovery.
 """
 from io import BytesIO
-from itertools import chain
 import os
 
 from stream.read_only_stream import ReadOnlyStream
@@ -35,20 +34,23 @@ class BufferedClusterStream(ReadOnlyStream):
         self._stream = origin_stream
         self._stream.set_default_read_buffer_size(bytes_per_cluster)
 
-        self.clusters = chain.from_iterable(map(lambda args: range(args[0],
-                                                                   args[1] + 1),
-                                                cluster_list))
         self.bytes_per_cluster = bytes_per_cluster
 
         self._abs_c2b = abs_c2b
 
+        # each cluster run is fetched as a whole, and nearby runs are merged
+        # into the same read
+        self.runs = iter(origin_stream.read_extents(
+            [(abs_c2b(start), (end - start + 1) * bytes_per_cluster)
+             for start, end in cluster_list]
+        ))
+
         self._buffer = BytesIO()
 
     def _load_next_cluster(self):
-        """Loads the next cluster to buffer."""
+        """Loads the next cluster run to buffer."""
 
-        self._stream.seek(self._abs_c2b(next(self.clusters)), os.SEEK_SET)
-        self._buffer = BytesIO(self._stream.read(size=self.bytes_per_cluster))
+        self._buffer = BytesIO(next(self.runs))
 
     def read(self, size=None):
         size = size or self.bytes_per_cluster
@@ -0,0 +1,129 @@
+# encoding: utf-8
+"""
+    stream.cached_stream
+    ~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :class:`CachedStream`, an LRU block cache which can
+    be put in front of any :class:`ReadOnlyStream`.
+"""
+from collections import OrderedDict
+import os
+
+from stream.read_only_stream import ReadOnlyStream
+
+
+class CachedStream(ReadOnlyStream):
+    """
+    Stream which caches fixed-size aligned blocks of the origin stream, so that
+    repeated reads of the same sectors don't hit the device again.
+    """
+    def __init__(self, origin_stream,
+                 block_size=64 * 1024,
+                 cache_size=64 * 1024 * 1024):
+        """
+        :param origin_stream: the origin stream.
+        :param block_size: optional, size of the cached blocks, blocks are
+                           aligned to multiples of this size.
+        :param cache_size: optional, byte budget of the cache.
+        """
+
+        super(CachedStream, self).__init__()
+
+        self._stream = origin_stream
+        self.zero_copy = origin_stream.zero_copy
+
+        self.block_size = block_size
+        self.max_blocks = max(1, cache_size // block_size)
+
+        self._blocks = OrderedDict()
+        self._pos = origin_stream.tell()
+
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def _get_block(self, index):
+        """Get the block with given index, from the cache if possible.
+
+        :param index: index of the block, i.e. offset // block_size.
+        """
+
+        if index in self._blocks:
+            self.hits += 1
+            self._blocks.move_to_end(index)
+
+            return self._blocks[index]
+
+        self.misses += 1
+
+        self._stream.seek(index * self.block_size, os.SEEK_SET)
+        block = self._stream.read(self.block_size)
+        if not block:
+            # beyond the end of the origin stream, nothing to cache
+            return block
+
+        self._blocks[index] = block
+        if len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+            self.evictions += 1
+
+        return block
+
+    def read(self, size=None):
+        size = size or self.default_read_buffer_size
+
+        start, end = self._pos, self._pos + size
+
+        chunks = []
+        while start < end:
+            index, offset = divmod(start, self.block_size)
+            block = self._get_block(index)
+
+            chunk = block[offset:offset + end - start]
+            if not chunk:
+                # end of the origin stream
+                break
+
+            chunks.append(chunk)
+            start += len(chunk)
+
+            if len(block) < self.block_size:
+                break
+
+        self._pos = start
+
+        if len(chunks) == 1:
+            return chunks[0]
+
+        return b''.join(chunks)
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos += self._pos
+        elif whence == os.SEEK_END:
+            self._stream.seek(0, os.SEEK_END)
+            pos += self._stream.tell()
+
+        if pos < 0:
+            raise ValueError('Negative seek position %d' % pos)
+
+        self._pos = pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._blocks.clear()
+        self._stream.close()
+
+    def clear(self):
+        """Drop all the cached blocks, counters are kept."""
+
+        self._blocks.clear()
+
+    def stats(self):
+        """Get the cache counters as a dict."""
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'blocks': len(self._blocks),
+                'bytes': sum(map(len, self._blocks.values()))}
@@ -0,0 +1,302 @@
+# encoding: utf-8
+"""
+    stream.compressed_img_stream
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements a seekable compressed image format,
+    :class:`CompressedImageStream` which streams it, and
+    :func:`compress_image` which converts raw images into it.
+
+    The image is cut into chunks of fixed size which are compressed one by
+    one, so any of them can be decompressed without touching the others. The
+    layout of the file is::
+
+        header | chunk 0 | chunk 1 | ... | chunk n - 1 | index
+
+    where the index holds n + 1 little-endian 64-bit offsets, chunk i being
+    stored between the i-th and the (i + 1)-th of them.
+"""
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import lzma
+import os
+import struct
+import threading
+import zlib
+
+from stream.read_only_stream import ReadOnlyStream
+
+
+MAGIC = b'CFCI'
+VERSION = 1
+
+# magic, version, codec, chunk size, image size, chunk count, index offset
+_header = struct.Struct('<4sBB2xIQQQ')
+
+CODECS = {'zlib': 0, 'lzma': 1}
+
+
+def _compress(codec, level, data):
+    """Compress a chunk.
+
+    :param codec: name of the codec, see :data:`CODECS`.
+    :param level: compression level, `None` for the default of the codec.
+    :param data: the chunk.
+    """
+
+    if codec == 'zlib':
+        return zlib.compress(data, -1 if level is None else level)
+    if codec == 'lzma':
+        return lzma.compress(data, preset=level)
+
+    raise ValueError('Unknown codec %s' % codec)
+
+
+def _decompress(codec, data):
+    """Decompress a chunk.
+
+    :param codec: name of the codec, see :data:`CODECS`.
+    :param data: the compressed chunk.
+    """
+
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'lzma':
+        return lzma.decompress(data, format=lzma.FORMAT_XZ)
+
+    raise ValueError('Unknown codec %s' % codec)
+
+
+def compress_image(img_path, out_path,
+                   codec='zlib',
+                   level=None,
+                   chunk_size=1024 * 1024,
+                   workers=None):
+    """Convert a raw image into the compressed image format.
+
+    Chunks are compressed on a pool of threads, both `zlib` and `lzma` release
+    the GIL while compressing, so all the cores are kept busy. Only a bounded
+    number of chunks are in flight, thus images of any size can be converted.
+
+    :param img_path: path of the raw image.
+    :param out_path: path of the compressed image to write.
+    :param codec: optional, `zlib` or `lzma`.
+    :param level: optional, compression level of the codec.
+    :param chunk_size: optional, size of the chunks, the unit of random access.
+    :param workers: optional, number of compressing threads, defaults to the
+                    number of CPUs.
+    """
+
+    if codec not in CODECS:
+        raise ValueError('Unknown codec %s' % codec)
+
+    workers = workers or os.cpu_count() or 1
+
+    offsets, image_size = [], 0
+    with open(img_path, 'rb') as img, open(out_path, 'wb') as out, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        # the header is written again once the index is known
+        out.write(b'\0' * _header.size)
+
+        in_flight = deque()
+
+        def write_oldest():
+            offsets.append(out.tell())
+            out.write(in_flight.popleft().result())
+
+        while True:
+            data = img.read(chunk_size)
+            if not data:
+                break
+            image_size += len(data)
+
+            in_flight.append(executor.submit(_compress, codec, level, data))
+            if len(in_flight) >= workers * 2:
+                write_oldest()
+
+        while in_flight:
+            write_oldest()
+
+        index_offset = out.tell()
+        offsets.append(index_offset)
+        out.write(struct.pack('<%dQ' % len(offsets), *offsets))
+
+        out.seek(0, os.SEEK_SET)
+        out.write(_header.pack(MAGIC, VERSION, CODECS[codec], chunk_size,
+                               image_size, len(offsets) - 1, index_offset))
+
+
+class CompressedImageStream(ReadOnlyStream):
+    """
+    Stream streaming an image in the compressed image format, see
+    :func:`compress_image`. Decompressed chunks are kept in an LRU cache, so
+    the parsers reading around the same place decompress every chunk once.
+    """
+    def __init__(self, img_path, cache_size=64 * 1024 * 1024):
+        """
+        :param img_path: path of the compressed image.
+        :param cache_size: optional, byte budget of the decompressed chunks
+                           cache.
+        """
+
+        super(CompressedImageStream, self).__init__()
+
+        self.img_path = img_path
+        self.img = open(img_path, 'rb')
+
+        magic, version, codec, self.chunk_size, self.size, chunk_count, \
+            index_offset = _header.unpack(self.img.read(_header.size))
+        if magic != MAGIC or version != VERSION:
+            self.img.close()
+            raise ValueError('%s is not a compressed image' % img_path)
+        codecs = {v: k for k, v in CODECS.items()}
+        if codec not in codecs:
+            # e.g. written by a newer version, or corrupt
+            self.img.close()
+            raise ValueError('%s uses unknown codec %d' % (img_path, codec))
+        self.codec = codecs[codec]
+
+        self.img.seek(index_offset, os.SEEK_SET)
+        index = self.img.read((chunk_count + 1) * 8)
+        if (len(index) < (chunk_count + 1) * 8 or
+                self.size > chunk_count * self.chunk_size):
+            self.img.close()
+            raise ValueError('%s is truncated or corrupt' % img_path)
+        self._offsets = struct.unpack('<%dQ' % (chunk_count + 1), index)
+
+        self.max_chunks = max(1, cache_size // self.chunk_size)
+        self._chunks = OrderedDict()
+        # guards _chunks, and reads where os.pread isn't available
+        self._lock = threading.Lock()
+
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+        self._pos = 0
+
+    @staticmethod
+    def is_compressed_image(path):
+        """Tests if the file is in the compressed image format.
+
+        :param path: path of the file to test.
+        """
+
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+
+    def _read_raw(self, offset, size):
+        """Read from the compressed file itself.
+
+        :param offset: absolute offset in the file.
+        :param size: size to read.
+        """
+
+        if hasattr(os, 'pread'):
+            return os.pread(self.img.fileno(), size, offset)
+
+        with self._lock:
+            self.img.seek(offset, os.SEEK_SET)
+            return self.img.read(size)
+
+    def _get_chunk(self, index):
+        """Get the decompressed chunk with given index, from the cache if
+        possible.
+
+        :param index: index of the chunk.
+        """
+
+        with self._lock:
+            if index in self._chunks:
+                self.hits += 1
+                self._chunks.move_to_end(index)
+
+                return self._chunks[index]
+
+            self.misses += 1
+
+        # decompressing is left out of the lock, so that threads calling
+        # read_at decompress in parallel
+        start, end = self._offsets[index], self._offsets[index + 1]
+        chunk = _decompress(self.codec, self._read_raw(start, end - start))
+
+        with self._lock:
+            self._chunks[index] = chunk
+            if len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+                self.evictions += 1
+
+        return chunk
+
+    def read_at(self, offset, size):
+        start, end = offset, min(offset + size, self.size)
+
+        chunks = []
+        while start < end:
+            index, chunk_offset = divmod(start, self.chunk_size)
+            chunk = self._get_chunk(index)[chunk_offset:
+                                           chunk_offset + end - start]
+
+            if not chunk:
+                # the chunk is shorter than the header says
+                raise ValueError('%s is truncated or corrupt' %
+                                 self.img_path)
+
+            chunks.append(chunk)
+            start += len(chunk)
+
+        if len(chunks) == 1:
+            return chunks[0]
+
+        return b''.join(chunks)
+
+    def read(self, size=None):
+        size = size or self.default_read_buffer_size
+
+        buf = self.read_at(self._pos, size)
+        self._pos += len(buf)
+
+        return buf
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos += self._pos
+        elif whence == os.SEEK_END:
+            pos += self.size
+
+        if pos < 0:
+            raise ValueError('Negative seek position %d' % pos)
+
+        self._pos = pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._chunks.clear()
+        self.img.close()
+
+    def clear(self):
+        """Drop all the cached chunks, counters are kept."""
+
+        with self._lock:
+            self._chunks.clear()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Convert a raw image into the compressed image format.'
+    )
+    parser.add_argument('image')
+    parser.add_argument('output')
+    parser.add_argument('--codec', choices=sorted(CODECS), default='zlib')
+    parser.add_argument('--level', type=int)
+    parser.add_argument('--chunk-size', type=int, default=1024 * 1024)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    compress_image(args.image, args.output,
+                   codec=args.codec,
+                   level=args.level,
+                   chunk_size=args.chunk_size,
+                   workers=args.workers)
@@ -5,6 +5,7 @@
 
     This module implements :class:`ImageStream`.
 """
+import mmap
 import os
 
 from stream.read_only_stream import ReadOnlyStream
@@ -14,9 +15,12 @@ class ImageStream(ReadOnlyStream):
     """
     Stream streaming an image.
     """
-    def __init__(self, img_path):
+    def __init__(self, img_path, use_mmap=False):
         """
         :param img_path: path of the image.
+        :param use_mmap: optional, if true, the image is memory mapped and
+                         :meth:`read` returns `memoryview` slices over the
+                         mapping instead of freshly allocated bytes.
         """
 
         super(ImageStream, self).__init__()
@@ -24,16 +28,73 @@ class ImageStream(ReadOnlyStream):
         self.img_path = img_path
         self.img = open(img_path, 'rb')
 
+        # empty files can't be mapped, they're read as usual
+        if use_mmap and os.fstat(self.img.fileno()).st_size == 0:
+            use_mmap = False
+
+        self.use_mmap = use_mmap
+        self.zero_copy = use_mmap
+
+        self._mmap, self._view, self._pos = None, None, 0
+        if use_mmap:
+            self._mmap = mmap.mmap(self.img.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+
     def read(self, size=None):
         size = size or self.default_read_buffer_size
 
-        return self.img.read(size)
+        if not self.use_mmap:
+            return self.img.read(size)
+
+        start = self._pos
+        if start >= len(self._view):
+            # past the end the position is left alone, as with files
+            return self._view[:0]
+
+        self._pos = min(start + size, len(self._view))
+
+        return self._view[start:self._pos]
+
+    def read_at(self, offset, size):
+        if self.use_mmap:
+            return self._view[offset:offset + size]
+
+        if not hasattr(os, 'pread'):
+            # os.pread is not available on Windows
+            return super(ImageStream, self).read_at(offset, size)
+
+        return os.pread(self.img.fileno(), size, offset)
 
     def seek(self, pos, whence=os.SEEK_SET):
-        self.img.seek(pos, whence)
+        if not self.use_mmap:
+            self.img.seek(pos, whence)
+            return
+
+        if whence == os.SEEK_CUR:
+            pos += self._pos
+        elif whence == os.SEEK_END:
+            pos += len(self._view)
+
+        if pos < 0:
+            raise ValueError('Negative seek position %d' % pos)
+
+        self._pos = pos
 
     def close(self):
+        if self.use_mmap:
+            self._view.release()
+            try:
+                self._mmap.close()
+            except BufferError:
+                # slices handed out by read() are still alive, the mapping
+                # goes away together with the last of them
+                pass
+
         self.img.close()
 
     def tell(self):
-        return self.img.tell()
+        if not self.use_mmap:
+            return self.img.tell()
+
+        return self._pos
@@ -0,0 +1,165 @@
+# encoding: utf-8
+"""
+    stream.instrumented_stream
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :class:`InstrumentedStream`, which records what is
+    read from the stream it wraps, and :func:`format_io_stats`.
+"""
+import os
+import threading
+import time
+
+from stream.read_only_stream import ReadOnlyStream
+
+
+def _bucket(value):
+    """Get the power of two bucket of a value, i.e. the smallest power of two
+    not less than it.
+
+    :param value: a non-negative integer.
+    """
+
+    return 1 << max(0, int(value) - 1).bit_length()
+
+
+def _format_size(size):
+    """Format a size in bytes with a binary unit.
+
+    :param size: the size.
+    """
+
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if size < 1024:
+            break
+        size /= 1024
+
+    return '%d%s' % (size, unit)
+
+
+def format_io_stats(stats):
+    """Format the statistics of :meth:`InstrumentedStream.stats` as text.
+
+    :param stats: the statistics dict.
+    """
+
+    lines = [
+        'reads: %(reads)d, seeks: %(seeks)d, bytes read: %(bytes)d' % stats,
+        'sequential reads: %(sequential)d, random reads: %(random)d' % stats,
+        'time spent reading: %.3fs' % stats['read_time'],
+        'read sizes:'
+    ]
+    lines.extend('  <= %8s: %d' % (_format_size(size), count)
+                 for size, count in sorted(stats['read_sizes'].items()))
+
+    lines.append('read latencies:')
+    lines.extend('  <= %8sus: %d' % (us, count)
+                 for us, count in sorted(stats['latencies'].items()))
+
+    return '\n'.join(lines)
+
+
+class InstrumentedStream(ReadOnlyStream):
+    """
+    Stream which forwards everything to the origin stream and counts the
+    reads, seeks and bytes read, along with power of two histograms of the
+    read sizes and latencies. A read starting where the previous one ended is
+    counted as sequential, any other read as random.
+    """
+    def __init__(self, origin_stream):
+        """
+        :param origin_stream: the origin stream.
+        """
+
+        super(InstrumentedStream, self).__init__()
+
+        self._stream = origin_stream
+        self.zero_copy = origin_stream.zero_copy
+
+        # guards the counters, read_at may be called from multiple threads
+        self._stats_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset all the counters."""
+
+        with self._stats_lock:
+            self.reads, self.seeks, self.bytes_read = 0, 0, 0
+            self.sequential_reads, self.random_reads = 0, 0
+            self.read_time = 0.0
+            self.read_sizes = {}
+            self.latencies = {}
+
+            self._last_end = None
+
+    def _record(self, offset, size, elapsed):
+        """Record a read.
+
+        :param offset: offset the read started at.
+        :param size: size actually read.
+        :param elapsed: seconds the read took.
+        """
+
+        with self._stats_lock:
+            self.reads += 1
+            self.bytes_read += size
+            self.read_time += elapsed
+
+            if offset == self._last_end:
+                self.sequential_reads += 1
+            else:
+                self.random_reads += 1
+            self._last_end = offset + size
+
+            size = _bucket(size)
+            self.read_sizes[size] = self.read_sizes.get(size, 0) + 1
+
+            us = _bucket(elapsed * 1e6)
+            self.latencies[us] = self.latencies.get(us, 0) + 1
+
+    def read(self, size=None):
+        size = size or self.default_read_buffer_size
+
+        offset = self._stream.tell()
+        start = time.perf_counter()
+        buf = self._stream.read(size)
+        self._record(offset, len(buf), time.perf_counter() - start)
+
+        return buf
+
+    def read_at(self, offset, size):
+        start = time.perf_counter()
+        buf = self._stream.read_at(offset, size)
+        self._record(offset, len(buf), time.perf_counter() - start)
+
+        return buf
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        with self._stats_lock:
+            self.seeks += 1
+
+        self._stream.seek(pos, whence)
+
+    def tell(self):
+        return self._stream.tell()
+
+    def close(self):
+        self._stream.close()
+
+    def stats(self):
+        """Get the counters as a dict, see :func:`format_io_stats`."""
+
+        with self._stats_lock:
+            return {'reads': self.reads,
+                    'seeks': self.seeks,
+                    'bytes': self.bytes_read,
+                    'sequential': self.sequential_reads,
+                    'random': self.random_reads,
+                    'read_time': self.read_time,
+                    'read_sizes': dict(self.read_sizes),
+                    'latencies': dict(self.latencies)}
+
+    def report(self):
+        """Get the counters formatted as text."""
+
+        return format_io_stats(self.stats())
@@ -0,0 +1,189 @@
+# encoding: utf-8
+"""
+    stream.linux_drive
+    ~~~~~~~~~~~~~~~~~~
+
+    This module implements :class:`LinuxBlockDeviceStream`.
+"""
+import errno
+import fcntl
+import logging
+import mmap
+import os
+import stat
+import struct
+import threading
+
+from stream.read_only_stream import ReadOnlyStream
+
+
+BLKSSZGET = 0x1268
+
+
+class LinuxBlockDeviceStream(ReadOnlyStream):
+    """
+    Stream that reads from linux block devices (e.g. `/dev/sdb`, loop devices)
+    or raw files. Every read is a positional read, thus :meth:`read_at` can be
+    called from multiple threads at once.
+
+    With `direct` set, the device is opened with `O_DIRECT` so that one-pass
+    scans of large drives bypass the page cache. Reads are then widened to
+    sector boundaries and go through page-aligned buffers, as `O_DIRECT`
+    requires.
+    """
+    DEFAULT_ALIGNMENT = 4096
+
+    def __init__(self, path, direct=False, request_size=1024 * 1024):
+        """
+        :param path: path of the device to open.
+        :param direct: optional, if true, try to bypass the page cache with
+                       `O_DIRECT`, falls back to buffered I/O when it's not
+                       supported.
+        :param request_size: optional, size of the requests issued to the
+                             device in direct mode.
+        """
+
+        super(LinuxBlockDeviceStream, self).__init__()
+
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+
+        self.direct = direct and hasattr(os, 'O_DIRECT')
+        self._fd = self._open()
+        # descriptors given up when falling back, other threads may still be
+        # reading from them, so they are closed in close()
+        self._stale_fds = []
+
+        self.alignment = self._get_alignment()
+        # request size has to be a multiple of the alignment too
+        self.request_size = max(self.alignment,
+                                request_size // self.alignment
+                                * self.alignment)
+
+        # aligned buffers are per thread, see read_at
+        self._local = threading.local()
+
+        # lseek works for block devices where os.stat reports 0 size
+        self.size = os.lseek(self._fd, 0, os.SEEK_END)
+        self._pos = 0
+
+    def _open(self):
+        """Open the device, with `O_DIRECT` if possible."""
+
+        if self.direct:
+            try:
+                return os.open(self.path, os.O_RDONLY | os.O_DIRECT)
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                self._fall_back('O_DIRECT is not supported by %s' % self.path)
+
+        return os.open(self.path, os.O_RDONLY)
+
+    def _fall_back(self, reason):
+        """Give up direct I/O.
+
+        :param reason: reason to log.
+        """
+
+        self.logger.warning('%s, falling back to buffered I/O', reason)
+        self.direct = False
+
+    def _get_alignment(self):
+        """Get the logical sector size of the device, which direct I/O has to be
+        aligned to."""
+
+        if stat.S_ISBLK(os.fstat(self._fd).st_mode):
+            try:
+                buf = fcntl.ioctl(self._fd, BLKSSZGET, struct.pack('I', 0))
+                return struct.unpack('I', buf)[0]
+            except OSError:
+                pass
+
+        return self.DEFAULT_ALIGNMENT
+
+    def _aligned_buffer(self):
+        """Get the aligned buffer of current thread, anonymous mappings are
+        always page aligned."""
+
+        buf = getattr(self._local, 'buf', None)
+        if buf is None:
+            buf = self._local.buf = mmap.mmap(-1, self.request_size)
+
+        return buf
+
+    def _read_direct(self, offset, size):
+        """Read with `O_DIRECT`, the range read is widened to the sector
+        boundaries and cut back afterwards.
+
+        :param offset: absolute offset to read from.
+        :param size: size to read.
+        """
+
+        start = offset // self.alignment * self.alignment
+        end = -(-(offset + size) // self.alignment) * self.alignment
+
+        view = memoryview(self._aligned_buffer())
+        result = bytearray()
+
+        pos = start
+        while pos < end:
+            length = min(self.request_size, end - pos)
+            n = os.preadv(self._fd, [view[:length]], pos)
+
+            lo = max(offset, pos) - pos
+            hi = min(offset + size, pos + n) - pos
+            if hi > lo:
+                result += view[lo:hi]
+
+            if n < length:
+                # end of the device
+                break
+            pos += n
+
+        return bytes(result)
+
+    def read(self, size=None):
+        size = size or self.default_read_buffer_size
+
+        buf = self.read_at(self._pos, size)
+        self._pos += len(buf)
+
+        return buf
+
+    def read_at(self, offset, size):
+        if not self.direct:
+            return os.pread(self._fd, size, offset)
+
+        try:
+            return self._read_direct(offset, size)
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+
+        # some file systems accept O_DIRECT on open but not on read
+        with self._read_at_lock:
+            if self.direct:
+                self._fall_back('direct read from %s failed' % self.path)
+                self._stale_fds.append(self._fd)
+                self._fd = os.open(self.path, os.O_RDONLY)
+
+        return os.pread(self._fd, size, offset)
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos += self._pos
+        elif whence == os.SEEK_END:
+            pos += self.size
+
+        if pos < 0:
+            raise ValueError('Negative seek position %d' % pos)
+
+        self._pos = pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        for fd in self._stale_fds + [self._fd]:
+            os.close(fd)
@@ -0,0 +1,211 @@
+# encoding: utf-8
+"""
+    stream.prefetch_stream
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :class:`PrefetchStream` which reads ahead on a
+    background thread when the stream is being read sequentially.
+"""
+import os
+import queue
+import threading
+
+from stream.read_only_stream import ReadOnlyStream
+
+
+class PrefetchStream(ReadOnlyStream):
+    """
+    Stream which detects sequential access and keeps a window of the upcoming
+    blocks of the origin stream loading in background, so that I/O overlaps
+    with parsing instead of alternating with it.
+    """
+    def __init__(self, origin_stream,
+                 block_size=1024 * 1024,
+                 window=4,
+                 sequential_threshold=2):
+        """
+        :param origin_stream: the origin stream.
+        :param block_size: optional, size of the blocks to read ahead.
+        :param window: optional, number of blocks to keep ahead of the current
+                       position.
+        :param sequential_threshold: optional, number of consecutive sequential
+                                     reads before read-ahead kicks in.
+        """
+
+        super(PrefetchStream, self).__init__()
+
+        self._stream = origin_stream
+        self.zero_copy = origin_stream.zero_copy
+
+        self.block_size = block_size
+        self.window = window
+        self.sequential_threshold = sequential_threshold
+
+        # the origin stream has only one cursor, so every seek/read pair on it
+        # is done with this lock held
+        self._io_lock = threading.Lock()
+        # guards _blocks and _pending
+        self._cond = threading.Condition()
+        self._blocks = {}
+        self._pending = set()
+
+        self._pos = self._last_end = origin_stream.tell()
+        self._sequential = 0
+
+        # (index, block) of the block last read from, small reads inside it
+        # are served without touching the locks
+        self._current = (None, b'')
+
+        self.hits, self.misses, self.prefetched = 0, 0, 0
+
+        self._tasks = queue.Queue()
+        self._worker = threading.Thread(target=self._prefetch, daemon=True)
+        self._worker.start()
+
+    def _read_block(self, index):
+        """Read a block from the origin stream.
+
+        :param index: index of the block.
+        """
+
+        with self._io_lock:
+            self._stream.seek(index * self.block_size, os.SEEK_SET)
+            return self._stream.read(self.block_size)
+
+    def _prefetch(self):
+        """Body of the background thread."""
+
+        while True:
+            index = self._tasks.get()
+            if index is None:
+                return
+
+            try:
+                block = self._read_block(index)
+            except Exception:
+                # leave it to the foreground read to raise
+                block = None
+
+            with self._cond:
+                self._pending.discard(index)
+                if block is not None:
+                    self._blocks[index] = block
+                    self.prefetched += 1
+                self._cond.notify_all()
+
+    def _get_block(self, index):
+        """Get the block with given index, waiting for it if it's being read
+        ahead.
+
+        :param index: index of the block.
+        """
+
+        with self._cond:
+            while index in self._pending:
+                self._cond.wait()
+
+            if index in self._blocks:
+                self.hits += 1
+                return self._blocks[index]
+
+        self.misses += 1
+        block = self._read_block(index)
+
+        with self._cond:
+            self._blocks[index] = block
+
+        return block
+
+    def _schedule(self, index):
+        """Trim the blocks out of the window and schedule the missing ones.
+
+        :param index: index of the block of current position.
+        """
+
+        last = index + self.window
+        with self._cond:
+            for i in [i for i in self._blocks if not index <= i <= last]:
+                del self._blocks[i]
+
+            if self._sequential < self.sequential_threshold:
+                return
+
+            for i in range(index + 1, last + 1):
+                if i not in self._blocks and i not in self._pending:
+                    self._pending.add(i)
+                    self._tasks.put(i)
+
+    def read(self, size=None):
+        size = size or self.default_read_buffer_size
+
+        if self._pos == self._last_end:
+            self._sequential += 1
+        else:
+            self._sequential = 0
+
+        start, end = self._pos, self._pos + size
+
+        index, offset = divmod(start, self.block_size)
+        current_index, current_block = self._current
+        if index == current_index and offset + size <= len(current_block):
+            self._pos = self._last_end = end
+            return current_block[offset:offset + size]
+
+        chunks = []
+        while start < end:
+            index, offset = divmod(start, self.block_size)
+            block = self._get_block(index)
+
+            chunk = block[offset:offset + end - start]
+            if not chunk:
+                break
+
+            chunks.append(chunk)
+            start += len(chunk)
+            self._current = (index, block)
+
+            if len(block) < self.block_size:
+                break
+
+        self._pos = self._last_end = start
+        self._schedule(start // self.block_size)
+
+        if len(chunks) == 1:
+            return chunks[0]
+
+        return b''.join(chunks)
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos += self._pos
+        elif whence == os.SEEK_END:
+            with self._io_lock:
+                self._stream.seek(0, os.SEEK_END)
+                pos += self._stream.tell()
+
+        if pos < 0:
+            raise ValueError('Negative seek position %d' % pos)
+
+        self._pos = pos
+
+    def tell(self):
+        return self._pos
+
+    def stop(self):
+        """Stop reading ahead and hand the origin stream back, positioned at
+        the current position of this stream."""
+
+        if self._worker.is_alive():
+            self._tasks.put(None)
+            self._worker.join()
+
+        with self._cond:
+            self._blocks.clear()
+            self._pending.clear()
+        self._current = (None, b'')
+
+        self._stream.seek(self._pos, os.SEEK_SET)
+
+    def close(self):
+        self.stop()
+        self._stream.close()
@@ -3,18 +3,56 @@
     stream.read_only_stream
     ~~~~~~~~~~~~~~~~~
 
-    This module implements the abstract class :class:`ReadOnlyStream`.
+    This module implements the abstract class :class:`ReadOnlyStream`,
+    :func:`coalesce_extents` and :func:`as_bytes_stream`.
 """
 import os
+import threading
+
+
+def coalesce_extents(extents, max_gap=4096, max_read_size=16 * 1024 * 1024):
+    """Merge adjacent and nearby extents into large reads.
+
+    :param extents: list of (offset, length) tuples, in any order.
+    :param max_gap: optional, extents no further than this apart are merged,
+                    the bytes in between are read and thrown away.
+    :param max_read_size: optional, merged reads don't grow beyond this size,
+                          a single extent larger than it is still read whole.
+
+    returns a list of (start, end, indices), where indices are the positions
+    of the extents in the given list covered by the read [start, end).
+    """
+
+    reads = []
+    for i in sorted(range(len(extents)), key=lambda i: extents[i][0]):
+        offset, length = extents[i]
+        end = offset + length
+
+        if reads:
+            start, last_end, indices = reads[-1]
+            if (offset <= last_end + max_gap and
+                    max(end, last_end) - start <= max_read_size):
+                reads[-1] = (start, max(end, last_end), indices)
+                indices.append(i)
+                continue
+
+        reads.append((offset, end, [i]))
+
+    return reads
 
 
 class ReadOnlyStream:
     """
     Abstract class for read-only streams.
     """
+    # if true, read() may return `memoryview` objects rather than bytes
+    zero_copy = False
+
     def __init__(self):
         self.default_read_buffer_size = 1024 * 4
 
+        self._read_at_lock = threading.Lock()
+
     def set_default_read_buffer_size(self, size):
         """Set default read buffer size.
 
@@ -33,6 +71,74 @@ class ReadOnlyStream:
 
         raise NotImplementedError
 
+    def read_at(self, offset, size):
+        """Read specified size at the given absolute offset, without moving
+        the position of the stream, so that it can be called from multiple
+        threads at once.
+
+        Streams which can do positional reads (i.e. `os.pread`) override this,
+        the fallback here seeks, reads and seeks back, which only serializes
+        the callers of this method.
+
+        :param offset: absolute offset to read from.
+        :param size: size to read.
+        """
+
+        with self._read_at_lock:
+            pos = self.tell()
+            try:
+                self.seek(offset, os.SEEK_SET)
+                return self.read(size)
+            finally:
+                self.seek(pos, os.SEEK_SET)
+
+    def read_extents(self, extents,
+                     max_gap=4096, max_read_size=16 * 1024 * 1024,
+                     out=None):
+        """Read a list of extents with as few reads as possible, see
+        :func:`coalesce_extents`. The position of the stream is not moved.
+
+        :param extents: list of (offset, length) tuples.
+        :param max_gap: optional, see :func:`coalesce_extents`.
+        :param max_read_size: optional, see :func:`coalesce_extents`.
+        :param out: optional, a writable buffer (e.g. `bytearray`) into which
+                    the extents are put one after another in the given order,
+                    it has to be at least the total length of the extents.
+
+        returns a list of `memoryview`, one per extent in the given order, which
+        are shorter than requested if the stream ends early.
+        """
+
+        views = [None] * len(extents)
+
+        if out is not None:
+            out = memoryview(out)
+            out_offsets, total = [], 0
+            for _, length in extents:
+                out_offsets.append(total)
+                total += length
+
+            if len(out) < total:
+                raise ValueError('Buffer of %d bytes is too small for %d '
+                                 'bytes of extents' % (len(out), total))
+
+        for start, end, indices in coalesce_extents(extents,
+                                                    max_gap, max_read_size):
+            buf = memoryview(self.read_at(start, end - start))
+
+            for i in indices:
+                offset, length = extents[i]
+                view = buf[offset - start:offset - start + length]
+
+                if out is not None:
+                    out_offset = out_offsets[i]
+                    out[out_offset:out_offset + len(view)] = view
+                    view = out[out_offset:out_offset + len(view)]
+
+                views[i] = view
+
+        return views
+
     def seek(self, pos, whence=os.SEEK_SET):
         """Seek to a specified position.
 
@@ -62,3 +168,37 @@ class ReadOnlyStream:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
+
+
+class _BytesStream:
+    """
+    Proxy which copies what the origin stream reads into bytes.
+    """
+    def __init__(self, stream):
+        """
+        :param stream: the origin stream.
+        """
+
+        self._stream = stream
+
+    def read(self, size=None):
+        return bytes(self._stream.read(size))
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        self._stream.seek(pos, whence)
+
+    def tell(self):
+        return self._stream.tell()
+
+
+def as_bytes_stream(stream):
+    """Make sure reading the stream gives bytes, used before handing zero-copy
+    streams to parsers (e.g. `construct`) which can't deal with `memoryview`.
+
+    :param stream: the stream to wrap.
+    """
+
+    if not getattr(stream, 'zero_copy', False):
+        return stream
+
+    return _BytesStream(stream)
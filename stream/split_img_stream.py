@@ -0,0 +1,186 @@
+# encoding: utf-8
+"""
+    stream.split_img_stream
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements :class:`SplitImageStream`, which streams split raw
+    images (e.g. `image.001`, `image.002`, ...) as one image.
+"""
+from bisect import bisect_right
+from itertools import accumulate
+import os
+import threading
+
+from stream.read_only_stream import ReadOnlyStream
+
+
+class SplitImageStream(ReadOnlyStream):
+    """
+    Stream streaming a raw image split into several segments. The segments are
+    opened lazily, and a global offset is mapped to its segment with a binary
+    search over the starting offsets of the segments.
+    """
+    def __init__(self, segment_paths):
+        """
+        :param segment_paths: paths of the segments, in order.
+        """
+
+        super(SplitImageStream, self).__init__()
+
+        self.segment_paths = list(segment_paths)
+        if not self.segment_paths:
+            raise ValueError('No segment given')
+
+        self._sizes = [os.path.getsize(p) for p in self.segment_paths]
+        self._starts = [0] + list(accumulate(self._sizes))[:-1]
+        self.size = sum(self._sizes)
+
+        self._files = [None] * len(self.segment_paths)
+        # guards lazy opening, and reads where os.pread isn't available
+        self._lock = threading.Lock()
+
+        self._pos = 0
+
+    @staticmethod
+    def is_first_segment(path):
+        """Tests if the path looks like the first segment of a split image,
+        i.e. it has an extension like `.001`.
+
+        :param path: path to test.
+        """
+
+        ext = os.path.splitext(path)[1][1:]
+
+        return ext.isdigit() and int(ext) == 1
+
+    @classmethod
+    def from_first_segment(cls, path):
+        """Create the stream from the first segment, the following segments are
+        found by counting up the extension until a segment is missing.
+
+        :param path: path of the first segment, e.g. `image.001`.
+        """
+
+        if not cls.is_first_segment(path):
+            raise ValueError('%s is not the first segment of a split '
+                             'image' % path)
+
+        base, ext = os.path.splitext(path)
+        width = len(ext) - 1
+
+        paths = []
+        while True:
+            segment_path = '%s.%0*d' % (base, width, len(paths) + 1)
+            if not os.path.exists(segment_path):
+                break
+            paths.append(segment_path)
+
+        return cls(paths)
+
+    def _segment(self, i):
+        """Get the file of the i-th segment, opening it on first use.
+
+        :param i: index of the segment.
+        """
+
+        f = self._files[i]
+        if f is None:
+            with self._lock:
+                if self._files[i] is None:
+                    self._files[i] = open(self.segment_paths[i], 'rb')
+                f = self._files[i]
+
+        return f
+
+    def _read_segment(self, i, offset, size):
+        """Read from a segment at the given offset relative to the segment.
+
+        :param i: index of the segment.
+        :param offset: offset relative to the start of the segment.
+        :param size: size to read.
+        """
+
+        f = self._segment(i)
+        if hasattr(os, 'pread'):
+            return os.pread(f.fileno(), size, offset)
+
+        with self._lock:
+            f.seek(offset, os.SEEK_SET)
+            return f.read(size)
+
+    def _read_segment_into(self, i, offset, view):
+        """Same as :meth:`_read_segment`, but reads into the given buffer.
+
+        :param i: index of the segment.
+        :param offset: offset relative to the start of the segment.
+        :param view: a writable `memoryview` to read into.
+        """
+
+        f = self._segment(i)
+        if hasattr(os, 'preadv'):
+            return os.preadv(f.fileno(), [view], offset)
+
+        with self._lock:
+            f.seek(offset, os.SEEK_SET)
+            return f.readinto(view)
+
+    def read_at(self, offset, size):
+        size = min(size, self.size - offset)
+        if size <= 0:
+            return b''
+
+        i = bisect_right(self._starts, offset) - 1
+        offset -= self._starts[i]
+
+        if offset + size <= self._sizes[i]:
+            # the common case, which needs no buffer of our own
+            return self._read_segment(i, offset, size)
+
+        # the read crosses segment boundaries, every segment reads right into
+        # its part of the result
+        buf = bytearray(size)
+        view = memoryview(buf)
+
+        done = 0
+        while done < size:
+            length = min(size - done, self._sizes[i] - offset)
+            n = self._read_segment_into(i, offset, view[done:done + length])
+
+            done += n
+            if n < length:
+                # the segment is shorter than it was
+                break
+
+            i, offset = i + 1, 0
+
+        view.release()
+
+        # bytes like the reads within a segment, whatever the read crosses
+        return bytes(buf[:done]) if done < size else bytes(buf)
+
+    def read(self, size=None):
+        size = size or self.default_read_buffer_size
+
+        buf = self.read_at(self._pos, size)
+        self._pos += len(buf)
+
+        return buf
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos += self._pos
+        elif whence == os.SEEK_END:
+            pos += self.size
+
+        if pos < 0:
+            raise ValueError('Negative seek position %d' % pos)
+
+        self._pos = pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        for f in self._files:
+            if f is not None:
+                f.close()
@@ -0,0 +1,44 @@
+# encoding: utf-8
+from attest import Tests
+import numpy as np
+
+from drive.fs.cluster_index import ClusterIndex
+
+
+index = Tests()
+
+
+@index.context
+def build_index():
+    # entry 1 is fragmented, entry 3 shares clusters with entries 1 and 2
+    yield ClusterIndex.from_cluster_lists(
+        [1, 2, 3, 4],
+        [[[10, 19], [40, 44]], [[20, 29]], [[18, 21]], []]
+    )
+
+
+@index.test
+def test_lookup(c):
+    clusters = [9, 10, 17, 18, 21, 22, 30, 44, 45]
+    assert c.lookup(clusters).tolist() == [-1, 1, 1, 1, 2, 2, -1, 1, -1]
+    assert c.lookup(np.array(40)) == 1
+
+    assert c.owners(19) == [1, 3] and c.owners(20) == [2, 3]
+    assert c.owners(22) == [2] and c.owners(35) == [] and c.owners(0) == []
+
+
+@index.test
+def test_lookup_range(c):
+    assert c.lookup_range(0, 9) == []
+    assert c.lookup_range(0, 10) == [1]
+    assert c.lookup_range(22, 40) == [1, 2]
+    assert c.lookup_range(19, 19) == [1, 3]
+    assert c.lookup_range(45, 100) == []
+
+    empty = ClusterIndex([], [], [])
+    assert empty.lookup([0, 5]).tolist() == [-1, -1]
+    assert empty.lookup_range(0, 5) == [] and empty.owners(3) == []
+
+
+if __name__ == '__main__':
+    index.main()
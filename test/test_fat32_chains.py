@@ -0,0 +1,162 @@
+# encoding: utf-8
+import os
+from struct import unpack
+import tempfile
+
+from attest import Tests
+import numpy as np
+from pandas import DataFrame
+
+from drive.fs.fat32.chains import resolve_chains, BAD_CLUSTER
+from drive.fs.fat32.compare import compare_fats
+from drive.fs.fat32.extents import ExtentTable
+from drive.fs.fat32.structs import FAT32
+from stream import ImageStream
+from test.utils.fat32_image import FAT32Image
+
+
+chains = Tests()
+
+EOC = 0x0fffffff
+
+
+def make_fat():
+    fat = np.zeros(40, dtype=np.uint32)
+    fat[0], fat[1] = 0x0ffffff8, EOC
+
+    # plain chain
+    fat[2], fat[3], fat[4] = 3, 4, EOC
+    # chain pointing backwards
+    fat[10], fat[6], fat[7], fat[5] = 6, 7, 5, EOC
+    # two chains sharing their tails
+    fat[12], fat[13], fat[15], fat[20], fat[21] = 13, 20, 20, 21, EOC
+    # a loop nothing runs into
+    fat[25], fat[26], fat[24] = 26, 24, 25
+    # a chain running into a loop
+    fat[30], fat[31], fat[32], fat[33] = 31, 32, 33, 31
+    # out of the FAT, bad cluster, pointing to a free cluster
+    fat[35], fat[36], fat[37] = 99, BAD_CLUSTER, 38
+
+    return fat
+
+
+@chains.context
+def build_fat():
+    yield resolve_chains(make_fat())
+
+
+@chains.test
+def test_chains(c):
+    assert c.to_dict() == {
+        2: [[2, 4]],
+        10: [[10, 10], [6, 7], [5, 5]],
+        12: [[12, 13], [20, 21]],
+        15: [[15, 15], [20, 21]],
+        24: [[24, 26]],
+        30: [[30, 33]],
+        35: [[35, 35]],
+        37: [[37, 37]]
+    }
+    assert 10 in c and 6 not in c
+    assert c[12] == [[12, 13], [20, 21]]
+
+
+@chains.test
+def test_problems(c):
+    assert c.loops == [24, 30]
+    assert c.cross_links == {20: [12, 15]}
+    assert c.invalid.tolist() == [35, 37]
+    assert c.bad.tolist() == [36]
+    assert c.orphan_heads([2, 10, 12]).tolist() == [15, 24, 30, 35, 37]
+
+
+@chains.test
+def test_extent_table(c):
+    # entry 3 doesn't start at a chain, entry 4 shares its chain with entry 1
+    t = ExtentTable.from_chains(c, [0, 1, 2, 3, 4], [2, 10, 12, 6, 10])
+
+    assert t.runs(1) == [[10, 10], [6, 7], [5, 5]]
+    assert t.runs(3) == []
+    assert t.first_clusters().tolist() == [2, 10, 12, 0, 10]
+    assert t.last_clusters().tolist() == [4, 5, 21, 0, 5]
+    assert t.min_clusters().tolist() == [2, 5, 12, 0, 5]
+    assert t.max_clusters().tolist() == [4, 10, 21, 0, 10]
+    assert t.cluster_counts().tolist() == [3, 4, 4, 0, 4]
+    assert t.fragment_counts().tolist() == [1, 3, 2, 0, 3]
+    assert t.avg_clusters().tolist() == [3., 7., 16.5, 0., 7.]
+
+    t = t.take([4, 3, 2])
+    assert t.ids.tolist() == [4, 3, 2]
+    assert t.runs(2) == [[12, 13], [20, 21]]
+    assert t.cluster_counts().tolist() == [4, 0, 4]
+
+    t = ExtentTable.concat([ExtentTable.from_chains(c, [7], [30]), t])
+    assert t.ids.tolist() == [7, 4, 3, 2]
+    assert t.runs(7) == [[30, 33]] and t.runs(2) == [[12, 13], [20, 21]]
+    assert t.fragment_counts().tolist() == [1, 3, 0, 2]
+
+
+@chains.test
+def test_compare_fats(c):
+    fat1 = make_fat()
+    assert not compare_fats(fat1, fat1.copy(), c)
+
+    # the plain chain is cut short and sent into the backward one, a new
+    # chain is allocated
+    fat2 = fat1.copy()
+    fat2[3], fat2[39] = 5, EOC
+
+    d = compare_fats(fat1, fat2, c)
+    assert d.clusters.tolist() == [3, 39]
+    assert d.items1.tolist() == [4, 0] and d.items2.tolist() == [5, EOC]
+    assert d.chains.tolist() == [2, 4, 39]
+
+    entries = DataFrame({'first_cluster': [2., 10., None, 39.]})
+    assert d.files(entries).index.tolist() == [0, 3]
+
+
+@chains.test
+def test_load_fat():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+
+    try:
+        image = FAT32Image(path, {'DIR': {'F%d.TXT' % i: None
+                                          for i in range(20)}})
+        # the reserved high 4 bits are set on every item, free ones included
+        n = image.bytes_per_fat // 4
+        high = np.random.RandomState(0).randint(0, 16, n).tolist()
+        image.fat = [(item | h << 28) for item, h in
+                     zip(image.fat + [0] * (n - len(image.fat)), high)]
+        image.write_fat()
+
+        with ImageStream(path) as s:
+            p = FAT32(s, 0, ui_handler=lambda *args: None)
+
+            # items are split across the reads, and the last read is short
+            read_size = 1002
+            assert p.bytes_per_fat % read_size
+
+            s.seek(p.fat_abs_pos)
+            fat = p.load_fat(read_size)
+            assert s.tell() == p.fat_abs_pos + p.bytes_per_fat
+
+            s.seek(p.fat_abs_pos)
+            items = [unpack('<I', s.read(4))[0] & p._fat_item_mask
+                     for _ in range(n)]
+
+            assert fat.dtype == np.uint32 and fat.tolist() == items
+
+            s.seek(p.fat_abs_pos)
+            c, number_of_eoc = p.get_fat()
+            assert c.to_dict() == resolve_chains(
+                np.array(items, dtype=np.uint32)
+            ).to_dict()
+            assert c[3] == [[3, 4]] and c[5] == [[5, 5]]
+            assert number_of_eoc == sum(map(p._is_eoc, items[2:])) == 22
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    chains.main()
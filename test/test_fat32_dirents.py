@@ -0,0 +1,113 @@
+# encoding: utf-8
+from datetime import datetime, timedelta
+import logging
+import struct
+
+from attest import Tests
+
+from drive.fs.fat32.dirents import DirectoryRecords, assemble_names
+from drive.fs.fat32.speedup import lfn_checksum
+from drive.fs.fat32.speedup.walker import walk_directory
+from drive.fs.fat32.timestamps import decode_timestamps
+
+
+dirents = Tests()
+
+
+def short_entry(name, attribute=0x20, first_cluster=0, length=0):
+    return struct.pack('<11sBBBHHHHHHHI', name, attribute, 0, 0, 0, 0, 0,
+                       first_cluster >> 16, 0, 0, first_cluster & 0xffff,
+                       length)
+
+
+def lfn_entry(seq_number, chars, checksum):
+    chars = chars.encode('utf-16-le').ljust(26, b'\xff')
+    return b''.join((bytes([seq_number]), chars[:10], b'\x0f\x00',
+                     bytes([checksum]), chars[10:22], b'\x00\x00',
+                     chars[22:]))
+
+
+@dirents.context
+def build_records():
+    checksum = lfn_checksum(b'ALONGF~1TXT')
+    buf = b''.join((
+        short_entry(b'.          ', 0x10, 5),
+        lfn_entry(0x42, 'ame.txt\x00', checksum),
+        lfn_entry(0x01, 'a long file n', checksum),
+        short_entry(b'ALONGF~1TXT', first_cluster=0x12345, length=100),
+        b'\x00' * 32,
+        short_entry(b'\xe5EADME  MD '),
+        lfn_entry(0xe5, 'gone\x00', 0x22),
+        short_entry(b'\xe5ONE       ', 0x10, 7),
+        short_entry(b'SUB        ', 0x10, 9),
+        lfn_entry(0x01, 'broken', 0x33),
+        short_entry(b'LOST       '),
+        b'\x01' * 16
+    ))
+
+    yield DirectoryRecords(buf)
+
+
+@dirents.test
+def test_columns(r):
+    assert len(r) == 11
+    assert r.blank.tolist() == [False] * 4 + [True] + [False] * 6
+    assert r.lfn.nonzero()[0].tolist() == [1, 2, 6, 9]
+    assert r.deleted.nonzero()[0].tolist() == [5, 6, 7]
+    assert r.is_directory.nonzero()[0].tolist() == [0, 7, 8]
+    assert r.first_cluster[3] == 0x12345 and r.file_length[3] == 100
+
+
+@dirents.test
+def test_names(r):
+    indices, names, undecodable = assemble_names(r, logging.getLogger())
+    # the entry after the LFN entry with a wrong checksum is dropped
+    assert indices == [0, 3, 5, 7, 8]
+    assert names == ['.', 'a long file name.txt', '(deleted) eadme.md',
+                     '(deleted) gone', 'sub']
+    assert undecodable == []
+
+
+@dirents.test
+def test_checksum(r):
+    buf = b''.join((
+        lfn_entry(0x41, 'stale.txt\x00', lfn_checksum(b'STALE   TXT')),
+        short_entry(b'OTHER   TXT'),
+        lfn_entry(0x41, 'fresh.txt\x00', lfn_checksum(b'FRESH   TXT')),
+        short_entry(b'FRESH   TXT'),
+    ))
+
+    r = DirectoryRecords(buf)
+    indices, names, _ = assemble_names(r, logging.getLogger())
+    # a long filename not matching the 8.3 name after it isn't taken
+    assert indices == [1, 3]
+    assert names == ['other.txt', 'fresh.txt']
+
+    # the compiled walker, if built, gives the same as the Python one
+    from drive.fs.fat32 import speedup
+    for expected, got in zip(walk_directory(r.raw),
+                             speedup.walk_directory(r.raw)):
+        assert (expected == got if isinstance(expected, dict) else
+                expected.tolist() == got.tolist())
+
+
+@dirents.test
+def test_timestamps(r):
+    # 2016-02-29, 2015-02-29, 2016-13-01, 2016-01-00
+    dates = [(36 << 9) | (2 << 5) | 29, (35 << 9) | (2 << 5) | 29,
+             (36 << 9) | (13 << 5) | 1, (36 << 9) | (1 << 5)]
+    # 23:59:58, 24:00:00, 12:60:00, 00:00:00
+    times = [(23 << 11) | (59 << 5) | 29, 24 << 11, (12 << 11) | (60 << 5), 0]
+
+    values, invalid = decode_timestamps(dates, times, [199, 0, 0, 0])
+    assert invalid.tolist() == [False, True, True, True]
+    assert values.tolist() == [datetime(2016, 2, 29, 23, 59, 59, 990000),
+                               None, None, None]
+
+    values, invalid = decode_timestamps(dates[:1],
+                                        tz_offset=timedelta(hours=-8))
+    assert values.tolist() == [datetime(2016, 2, 28, 16)]
+
+
+if __name__ == '__main__':
+    dirents.main()
@@ -0,0 +1,164 @@
+# encoding: utf-8
+import gc
+import os
+import tempfile
+
+from attest import Tests
+from pandas import concat
+
+from drive.fs.fat32.structs import FAT32, FAT32DirectoryTableEntry
+from stream import ImageStream
+from test.utils.fat32_image import FAT32Image, EOC
+
+
+tree = Tests()
+
+
+def make_tree():
+    # levels of directories of different sizes, some spanning clusters
+    return {'D%d' % d: dict({'S%d' % s: {'F%d.TXT' % f: None
+                                         for f in range(s * 7)}
+                             for s in range(d + 1)},
+                            **{'F%d.DAT' % f: None for f in range(d * 5)})
+            for d in range(6)}
+
+
+def count_reads(p):
+    # the directories read, in order
+    reads = []
+    read_directory = p._read_directory
+
+    def _read_directory(dir_name, cluster_list):
+        reads.append(dir_name)
+        return read_directory(dir_name, cluster_list)
+
+    p._read_directory = _read_directory
+
+    return reads
+
+
+@tree.context
+def build_image():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+
+    try:
+        image = FAT32Image(path, make_tree(), sectors_per_fat=4)
+
+        def open_partition(s, workers=1):
+            s.seek(0)
+            return FAT32(s, 0, ui_handler=lambda *args: None,
+                         workers=workers)
+
+        yield image, open_partition
+    finally:
+        os.remove(path)
+
+
+@tree.test
+def test_workers(image, open_partition):
+    with ImageStream(image.path) as s:
+        serial = open_partition(s).get_fdt()
+        parallel = open_partition(s, workers=4).get_fdt()
+
+    assert len(serial) == 6 + 21 + 7 * 35 + 5 * 15
+    assert serial['id'].tolist() == list(range(len(serial)))
+    assert parallel['id'].tolist() == serial['id'].tolist()
+    assert parallel.index.tolist() == serial.index.tolist()
+    assert parallel.equals(serial)
+
+
+@tree.test
+def test_lazy(image, open_partition):
+    with ImageStream(image.path) as s:
+        p = open_partition(s)
+        reads = count_reads(p)
+
+        t = p.directory_tree()
+        assert reads == []
+
+        t.root.children()
+        assert reads == ['/']
+
+        node = t.find('/d3/s2')
+        assert reads == ['/', '/d3'] and not node.is_read
+
+        assert len(node.entries) == 14 and len(node.list()) == 14
+        t.find('/d3/s2').children()
+        assert reads == ['/', '/d3', '/d3/s2']
+
+        # the FAT is followed on disk until then
+        assert not p.fat_loaded
+
+
+@tree.test
+def test_refresh(image, open_partition):
+    first_cluster = image.directories['/d5']
+
+    with ImageStream(image.path) as s:
+        p = open_partition(s)
+        reads = count_reads(p)
+
+        t = p.directory_tree()
+        node = t.find('/d5')
+        assert len(node.entries) == 31
+        assert node.cluster_list == [[first_cluster, first_cluster + 1]]
+
+        # the directory is cut to its first cluster, which is seen once the
+        # FAT is read
+        image.fat[first_cluster] = EOC
+        image.write_fat()
+        assert len(t.find('/d5').entries) == 31
+
+        p.read_fats()
+        assert not node.is_read
+
+        # the root is kept as its cluster list is the same, and so is the
+        # node of the directory
+        assert t.find('/d5') is node
+        assert reads == ['/', '/d5']
+
+        assert node.cluster_list == [[first_cluster, first_cluster]]
+        assert len(node.entries) == 16 and node.is_read
+        assert reads == ['/', '/d5', '/d5']
+
+
+def live_entries():
+    gc.collect()
+    return sum(isinstance(o, FAT32DirectoryTableEntry)
+               for o in gc.get_objects())
+
+
+@tree.test
+def test_batches_memory(image, open_partition):
+    with ImageStream(image.path) as s:
+        p = open_partition(s)
+        p.read_fats()
+
+        # browsed before the walk, which keeps it
+        t = p.directory_tree()
+        node = t.find('/d4')
+        assert len(node.entries) == 25 and live_entries() == 6 + 25
+
+        counts, batches = [], []
+        for batch in t.iter_batches(batch_size=16):
+            counts.append(live_entries())
+            batches.append(batch)
+
+        fdt = open_partition(s).get_fdt()
+
+    # the walk holds at most the window of directories being read, 4
+    # directories of at most 35 entries, the directories browsed aside
+    assert len(fdt) == 347 and len(batches) == 22
+    assert max(counts) <= 6 + 25 + 4 * 35
+    assert live_entries() == 6 + 25
+    assert node.is_read and t.root.is_read
+    assert [n.path for n in t.walk()] == (['/'] +
+                                          ['/d%d' % d for d in range(6)] +
+                                          ['/d4/s%d' % d for d in range(5)])
+
+    assert concat(batches).equals(fdt)
+
+
+if __name__ == '__main__':
+    tree.main()
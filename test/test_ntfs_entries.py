@@ -0,0 +1,92 @@
+# encoding: utf-8
+import os
+import tempfile
+
+from attest import Tests
+import numpy as np
+from pandas import concat
+
+from drive.fs.ntfs.structs import NTFS
+from stream import ImageStream
+from test.utils.ntfs_image import NTFSImage
+
+
+entries = Tests()
+
+
+def make_files():
+    files = []
+    for d in range(3):
+        files.append(('dir %d' % d, None, True, False, None))
+        parent = len(files) - 1
+        for f in range(20):
+            runs = [(100 + 50 * parent + f, 1)] if f % 3 else None
+            files.append(('file %d.txt' % f, parent, False, f % 4 == 1,
+                          runs))
+
+    return files
+
+
+@entries.context
+def build_image():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+
+    try:
+        image = NTFSImage(path, make_files())
+
+        def open_partition(s, **kwargs):
+            s.seek(0)
+            return NTFS(s, 0, ui_handler=lambda *args: None, **kwargs)
+
+        yield image, open_partition
+    finally:
+        os.remove(path)
+
+
+@entries.test
+def test_batches(image, open_partition):
+    with ImageStream(image.path) as s:
+        df = open_partition(s).get_entries()
+        batches = list(open_partition(s).iter_entry_batches(batch_size=16))
+
+    # the system files but $MFT, and the files
+    assert len(df) == 11 + 63
+    assert [len(batch) for batch in batches] == [16] * 4 + [10]
+
+    for batch in batches:
+        assert batch.columns.tolist() == NTFS.__mft_attr__
+        assert batch.dtypes.equals(df.dtypes)
+
+    assert concat(batches).equals(df)
+
+
+@entries.test
+def test_cluster_index(image, open_partition):
+    for kwargs in ({}, {'bulk': True}, {'workers': 2}):
+        with ImageStream(image.path) as s:
+            p = open_partition(s, **kwargs)
+            df = p.get_entries()
+
+        ids = df.set_index('full_path')['id']
+        index = p.cluster_index(df)
+
+        # a run per file with clusters, in flat columns
+        assert p.data_runs.dtype == np.int64
+        assert p.data_runs.shape == (3 * 13, 3)
+
+        # files in use, and a deleted one
+        live, deleted = ids['/dir 0/file 2.txt'], ids['/dir 0/file 5.txt']
+        assert not df.loc[live, 'is_deleted'] and df.loc[live,
+                                                          'cluster_list'] == []
+        assert df.loc[deleted, 'is_deleted']
+
+        assert index.lookup([102, 105]).tolist() == [live, deleted]
+        assert index.owners(100 + 50 * 42 + 8) == [ids['/dir 2/file 8.txt']]
+        # resident data, and directories, have no clusters
+        assert index.lookup([103, 100]).tolist() == [-1, -1]
+        assert len(index.lookup_range(0, 10000)) == 3 * 13
+
+
+if __name__ == '__main__':
+    entries.main()
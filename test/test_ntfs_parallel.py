@@ -0,0 +1,128 @@
+# encoding: utf-8
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import os
+import tempfile
+
+from attest import Tests
+import numpy as np
+
+from stream import ImageStream, PrefetchStream
+from drive.fs.ntfs.parallel import ParallelRecordEnumerator, \
+    RECORD_COLUMNS, stream_opener, _slice_extents, _allocate, _fill, \
+    _release
+from drive.fs.ntfs.records import BulkRecordEnumerator
+from drive.fs.ntfs.structs import NTFS
+from test.utils.ntfs_image import NTFSImage
+
+
+parallel = Tests()
+
+
+@parallel.test
+def test_slice_extents():
+    extents = [(1000, 100), (5000, 50), (200, 100)]
+    assert _slice_extents(extents, 0, 250) == extents
+    assert _slice_extents(extents, 90, 160) == [(1090, 10), (5000, 50),
+                                                (200, 10)]
+    assert _slice_extents(extents, 100, 150) == [(5000, 50)]
+    assert _slice_extents(extents, 250, 300) == []
+
+
+@parallel.test
+def test_blocks():
+    columns = {}
+    for key, dtype, shape in RECORD_COLUMNS:
+        items = np.arange(3 * int(np.prod(shape))) % 3
+        columns[key] = items.astype(dtype).reshape((3,) + shape)
+
+    # the block is made and freed here, and filled by another process
+    shm, layout = _allocate(3)
+    name = shm.name
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        executor.submit(_fill, name, layout, columns).result()
+    shared = _release(shm, layout)
+
+    assert sorted(shared) == sorted(columns)
+    for key, column in columns.items():
+        assert shared[key].dtype == column.dtype
+        assert np.array_equal(shared[key], column)
+
+    try:
+        SharedMemory(name=name)
+    except FileNotFoundError:
+        pass
+    else:
+        raise AssertionError('the block is not freed')
+
+
+@parallel.test
+def test_enumerate_paths():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+
+    files = [('dir', None, True, False, None)]
+    files.extend(('file %d' % i, 0, False, i % 3 == 0,
+                  [(200 + 3 * i, 2), (100 + i, 1)] if i % 2 else None)
+                 for i in range(100))
+
+    try:
+        NTFSImage(path, files)
+
+        with ImageStream(path) as s:
+            p = NTFS(s, 0, ui_handler=lambda *args: None)
+
+            expected = list(BulkRecordEnumerator(p, s).enumerate_paths())
+            enumerator = ParallelRecordEnumerator(p, s, stream_opener(s), 2)
+            records = list(enumerator.enumerate_paths())
+    finally:
+        os.remove(path)
+
+    assert len(records) == len(expected) == 12 + 1 + 100
+    assert len(enumerator.bad_fixups) == 0
+    assert records[-1][1] == 'dir/file 99'
+
+    for (record, record_path), (other, other_path) in zip(records,
+                                                          expected):
+        assert record_path == other_path
+        for method in ('lsn', 'sequence_number', 'flags', 'is_directory',
+                       'is_active'):
+            assert getattr(record, method)() == getattr(other, method)()
+
+        for attr, other_attr in ((record.standard_information(),
+                                  other.standard_information()),
+                                 (record.filename_information(),
+                                  other.filename_information())):
+            for method in ('created_time', 'modified_time', 'changed_time',
+                           'accessed_time'):
+                assert getattr(attr, method)() == \
+                    getattr(other_attr, method)()
+
+        data, other_data = record.data_attribute(), other.data_attribute()
+        assert (data is None) == (other_data is None)
+        if data is not None:
+            assert data.non_resident() == other_data.non_resident()
+            if data.non_resident():
+                assert list(map(tuple, data.runlist().runs())) == \
+                    list(other_data.runlist().runs())
+
+
+@parallel.test
+def test_stream_opener():
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b'0123456789')
+
+    try:
+        with ImageStream(path) as s:
+            opener = stream_opener(PrefetchStream(s))
+            with opener() as reopened:
+                assert reopened.read_at(2, 3) == b'234'
+
+        assert stream_opener(object()) is None
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    parallel.main()
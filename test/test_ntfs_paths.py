@@ -0,0 +1,58 @@
+# encoding: utf-8
+import os
+
+from attest import Tests
+import numpy as np
+
+from drive.fs.ntfs.paths import resolve_paths
+
+
+paths = Tests()
+
+
+def reference(parent, sequence_number=1):
+    return parent | sequence_number << 48
+
+
+@paths.test
+def test_resolve_paths():
+    # records 6 and 7 are in a cycle, which record 8 leads to
+    sequence_numbers = np.array([1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1,
+                                 1, 1, 1, 1, 1, 1, 1, 2])
+    valid = np.ones(20, dtype=bool)
+    valid[18] = False
+    filenames = {
+        0: ('$MFT', reference(5)),
+        5: ('.', reference(5)),
+        6: ('a', reference(7)),
+        7: ('b', reference(6)),
+        8: ('c', reference(6)),
+        9: ('self', reference(9)),
+        16: ('dir', reference(5)),
+        17: ('file', reference(16)),
+        # an invalid parent, another sequence number, out of the MFT
+        1: ('x', reference(18)),
+        2: ('y', reference(19)),
+        3: ('z', reference(1000)),
+        19: ('deep', reference(17)),
+    }
+
+    result = resolve_paths(sequence_numbers, valid, filenames)
+    assert result[0] == '$MFT' and result[5] == ''
+    assert result[16] == 'dir'
+    assert result[17] == os.path.join('dir', 'file')
+    assert result[19] == os.path.join('dir', 'file', 'deep')
+
+    assert result[4] == '??' and result[18] is None
+    assert result[1] == os.path.join('$ORPHAN', 'x')
+    assert result[2] == os.path.join('$ORPHAN', 'y')
+    assert result[3] == os.path.join('$ORPHAN', 'z')
+
+    assert result[6] == os.path.join('<CYCLE>', 'b', 'a')
+    assert result[7] == os.path.join('<CYCLE>', 'a', 'b')
+    assert result[8] == os.path.join('<CYCLE>', 'b', 'a', 'c')
+    assert result[9] == os.path.join('<CYCLE>', 'self')
+
+
+if __name__ == '__main__':
+    paths.main()
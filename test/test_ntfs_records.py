@@ -0,0 +1,159 @@
+# encoding: utf-8
+import array
+import struct
+
+from attest import Tests
+import numpy as np
+
+from drive.fs.ntfs.indxparse.BinaryParser import OverrunBufferException
+from drive.fs.ntfs.indxparse.MFT import MFTRecord
+from drive.fs.ntfs.records import Record, decode_record, read_headers, \
+    apply_fixups
+
+
+records = Tests()
+
+TIME = 131000000000000000
+
+
+def attribute(type_, value):
+    size = 0x18 + len(value) + (-len(value)) % 8
+    return struct.pack('<IIBBHHHIHBB', type_, size, 0, 0, 0x18, 0, 0,
+                       len(value), 0x18, 0, 0) + \
+        value.ljust(size - 0x18, b'\0')
+
+
+def filename(name, type_):
+    return struct.pack('<QQQQQQQIIBB', 5 | 5 << 48, TIME, TIME + 1, TIME + 2,
+                       TIME + 3, 0, 0, 0x20, 0, len(name), type_) + \
+        name.encode('utf-16-le')
+
+
+def runlist_attribute():
+    # two runs, the second one 0x10 clusters before the first
+    runlist = b'\x21\x03\x00\x10\x11\x02\xf0\x00'
+    return struct.pack('<IIBBHHHQQHB5sQQQ', 0x80, 0x48, 1, 0, 0x40, 0, 0, 0,
+                       4, 0x40, 0, b'', 0x5000, 0x5000, 0x5000) + runlist
+
+
+def record(attributes, bad_fixup=False):
+    body = b''.join(attributes) + b'\xff\xff\xff\xff'
+    header = struct.pack('<IHHQHHHHIIQHHI', 0x454c4946, 0x30, 3, 42, 7, 1,
+                         0x38, 1, 0x38 + len(body), 1024, 0, 3, 0, 64)
+    buf = bytearray((header + b'\0' * 8 + body).ljust(1024, b'\0'))
+    buf[0x30:0x32] = b'\x01\x02'
+    for i, end in enumerate((510, 1022)):
+        buf[0x32 + 2 * i:0x34 + 2 * i] = buf[end:end + 2]
+        buf[end:end + 2] = b'\x34\x12' if bad_fixup and i else b'\x01\x02'
+
+    return bytes(buf)
+
+
+def same_as_indxparse(buf):
+    new = decode_record(buf, inode=64)
+    old = MFTRecord(array.array('B', buf), 0, False, inode=64)
+    assert isinstance(new, Record)
+
+    for method in ('magic', 'lsn', 'sequence_number', 'flags',
+                   'is_directory', 'is_active', 'mft_record_number'):
+        assert getattr(new, method)() == getattr(old, method)()
+
+    for new_attr, old_attr in ((new.standard_information(),
+                                old.standard_information()),
+                               (new.filename_information(),
+                                old.filename_information())):
+        assert (new_attr is None) == (old_attr is None)
+        if new_attr is None:
+            continue
+        for method in ('created_time', 'modified_time', 'changed_time',
+                       'accessed_time'):
+            assert getattr(new_attr, method)() == getattr(old_attr, method)()
+
+    if old.filename_information() is not None:
+        for method in ('filename', 'filename_type', 'mft_parent_reference'):
+            assert getattr(new.filename_information(), method)() == \
+                getattr(old.filename_information(), method)()
+
+    new_data, old_data = new.data_attribute(), old.data_attribute()
+    assert (new_data is None) == (old_data is None)
+    if new_data is not None and new_data.non_resident():
+        assert list(new_data.runlist().runs()) == \
+            list(old_data.runlist().runs())
+
+    return new
+
+
+@records.test
+def test_decode():
+    si = attribute(0x10, struct.pack('<QQQQ', TIME, TIME, TIME, TIME) +
+                   b'\0' * 0x28)
+    buf = record([si, attribute(0x30, filename('FILE~1.TXT', 2)),
+                  attribute(0x30, filename('file name.txt', 1)),
+                  runlist_attribute()])
+    r = same_as_indxparse(buf)
+    assert r.filename_information().filename() == 'file name.txt'
+    assert list(r.data_attribute().runlist().runs()) == [(0x1000, 3),
+                                                        (0x0ff0, 2)]
+
+    # the DOS name is kept if there's no Win32 one
+    r = same_as_indxparse(record([si, attribute(0x30,
+                                                filename('FILE~1.TXT', 2)),
+                                  attribute(0x80, b'resident')],
+                                 bad_fixup=True))
+    assert r.filename_information().filename() == 'FILE~1.TXT'
+    assert not r.data_attribute().non_resident()
+
+
+@records.test
+def test_fallback():
+    # the header claims more fixups than the record holds, which is left to
+    # indxparse, and so raises as it always did
+    buf = bytearray(record([]))
+    buf[6:8] = struct.pack('<H', 0x400)
+    try:
+        decode_record(bytes(buf))
+    except OverrunBufferException:
+        pass
+    else:
+        assert False
+
+    # a file name too short is skipped, as with indxparse
+    buf = record([attribute(0x30, filename('a', 1)[:0x30])])
+    assert same_as_indxparse(buf).filename_information() is None
+
+
+@records.test
+def test_read_headers():
+    buf = record([]) + b'\0' * 1024 + record([])
+    headers = read_headers(buf, 1024)
+
+    assert len(headers) == 3
+    assert headers['magic'].tolist() == [0x454c4946, 0, 0x454c4946]
+    assert headers['lsn'][0] == 42 and headers['sequence_number'][2] == 7
+    assert headers['flags'][0] == 1 and headers['link_count'][0] == 1
+    assert headers['mft_record_number'].tolist() == [64, 0, 64]
+
+
+@records.test
+def test_apply_fixups():
+    bufs = [record([]), record([], bad_fixup=True), record([])]
+    broken = bytearray(bufs[2])
+    broken[6:8] = struct.pack('<H', 0x400)
+    bufs[2] = bytes(broken)
+
+    records_ = np.frombuffer(b''.join(bufs), dtype=np.uint8).reshape(3, 1024)
+    records_ = records_.copy()
+    assert apply_fixups(records_, 512).tolist() == [1, 2]
+
+    # the same bytes as fixed one by one, the broken record is left as is
+    for i in (0, 1):
+        r = decode_record(bufs[i])
+        fixed = decode_record(records_[i], fixed=True)
+        assert fixed.lsn() == r.lsn()
+        assert records_[i, 510:512].tolist() == [0, 0]
+    assert records_[1, 1022:1024].tolist() == [0x34, 0x12]
+    assert records_[2].tobytes() == bufs[2]
+
+
+if __name__ == '__main__':
+    records.main()
@@ -0,0 +1,360 @@
+# encoding: utf-8
+from concurrent.futures import ThreadPoolExecutor
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+
+from attest import Tests
+from stream import ImageStream, CachedStream, PrefetchStream, \
+    LinuxBlockDeviceStream, SplitImageStream, CompressedImageStream, \
+    InstrumentedStream, as_bytes_stream, compress_image
+from stream.read_only_stream import coalesce_extents
+
+
+stream = Tests()
+
+IMAGE_SIZE = 64 * 1024
+
+
+@stream.context
+def build_image():
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(bytes(i & 0xff for i in range(IMAGE_SIZE)))
+
+    yield path
+
+    os.remove(path)
+
+
+@stream.test
+def test_image_stream_mmap(path):
+    with ImageStream(path) as plain, ImageStream(path, use_mmap=True) as s:
+        for pos, size in [(0, 512), (511, 3), (IMAGE_SIZE - 2, 16)]:
+            plain.seek(pos)
+            s.seek(pos)
+            buf = s.read(size)
+
+            assert isinstance(buf, memoryview)
+            assert bytes(buf) == plain.read(size)
+            assert s.tell() == plain.tell()
+
+        s.seek(-4, os.SEEK_END)
+        s.seek(2, os.SEEK_CUR)
+        assert s.tell() == IMAGE_SIZE - 2
+
+        # reads past the end leave the position where it was sought to
+        for pos in [IMAGE_SIZE, IMAGE_SIZE + 100]:
+            plain.seek(pos)
+            s.seek(pos)
+            assert bytes(s.read(16)) == plain.read(16) == b''
+            assert s.tell() == plain.tell() == pos
+
+
+@stream.test
+def test_image_stream_mmap_empty():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        with ImageStream(path, use_mmap=True) as s:
+            assert not s.use_mmap and not s.zero_copy
+            assert s.read(16) == b'' and s.read_at(0, 16) == b''
+    finally:
+        os.remove(path)
+
+
+@stream.test
+def test_as_bytes_stream(path):
+    with ImageStream(path, use_mmap=True) as s:
+        s.seek(3)
+        buf = as_bytes_stream(s).read(8)
+
+        assert isinstance(buf, bytes)
+        assert buf == bytes(range(3, 11))
+        assert s.tell() == 11
+
+
+@stream.test
+def test_cached_stream(path):
+    with ImageStream(path) as plain, CachedStream(ImageStream(path),
+                                                  block_size=4096,
+                                                  cache_size=3 * 4096) as s:
+        for pos, size in [(100, 10), (4000, 200), (4090, 8200),
+                          (100, 10), (IMAGE_SIZE - 10, 100)]:
+            plain.seek(pos)
+            s.seek(pos)
+
+            assert s.read(size) == plain.read(size)
+            assert s.tell() == plain.tell()
+
+        stats = s.stats()
+        assert stats['hits'] == 3
+        assert stats['misses'] == 7
+        assert stats['evictions'] == 3
+        assert stats['blocks'] == 3
+
+
+@stream.test
+def test_prefetch_stream(path):
+    with ImageStream(path) as plain, PrefetchStream(ImageStream(path),
+                                                    block_size=4096,
+                                                    window=2) as s:
+        s.seek(1000)
+        plain.seek(1000)
+        while True:
+            buf = s.read(1000)
+            assert buf == plain.read(1000)
+            if not buf:
+                break
+
+        assert s.prefetched > 0
+        assert s.hits > s.misses
+
+        s.seek(10)
+        plain.seek(10)
+        assert s.read(20) == plain.read(20)
+
+        s.stop()
+        assert s._stream.tell() == 30
+
+
+@stream.test
+def test_read_at(path):
+    expected = lambda offset: bytes(i & 0xff
+                                    for i in range(offset, offset + 100))
+    offsets = range(0, IMAGE_SIZE - 100, 997)
+
+    for s in [ImageStream(path),
+              ImageStream(path, use_mmap=True),
+              LinuxBlockDeviceStream(path),
+              LinuxBlockDeviceStream(path, direct=True, request_size=8192),
+              CachedStream(ImageStream(path), block_size=4096)]:
+        with s:
+            s.seek(123)
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(lambda o: s.read_at(o, 100),
+                                            offsets))
+
+            assert [bytes(r) for r in results] == list(map(expected, offsets))
+            assert s.tell() == 123
+
+
+def _supports_direct_io(path):
+    """Tell whether the file system of a file can do `O_DIRECT` reads."""
+
+    if not hasattr(os, 'O_DIRECT'):
+        return False
+
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+    except OSError:
+        return False
+
+    try:
+        os.preadv(fd, [mmap.mmap(-1, 4096)], 0)
+        return True
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+
+@stream.test
+def test_linux_block_device_direct(path):
+    direct = _supports_direct_io(path)
+
+    with LinuxBlockDeviceStream(path, direct=True, request_size=8192) as s:
+        # unaligned reads, one of them across requests
+        for offset, size in [(1, 100), (4000, 10000), (IMAGE_SIZE - 7, 20)]:
+            assert s.read_at(offset, size) == \
+                bytes(i & 0xff for i in range(offset,
+                                              min(offset + size,
+                                                  IMAGE_SIZE)))
+
+        # the direct path was taken, rather than falling back silently
+        assert s.direct == direct
+        flags = fcntl.fcntl(s._fd, fcntl.F_GETFL)
+        assert bool(flags & getattr(os, 'O_DIRECT', 0)) == direct
+        assert (getattr(s._local, 'buf', None) is not None) == direct
+        if direct:
+            assert s.request_size % s.alignment == 0
+
+
+@stream.test
+def test_read_extents(path):
+    extents = [(8192, 100), (0, 512), (512, 512), (5000, 10),
+               (IMAGE_SIZE - 10, 100)]
+
+    with ImageStream(path) as s:
+        expected = [s.read_at(o, l) for o, l in extents]
+
+        assert [bytes(v) for v in s.read_extents(extents)] == expected
+
+        out = bytearray(sum(l for _, l in extents))
+        views = s.read_extents(extents, max_gap=0, out=out)
+        assert [bytes(v) for v in views] == expected
+        assert bytes(out[100:612]) == expected[1]
+
+    assert coalesce_extents(extents, max_gap=4096) == [
+        (0, 8292, [1, 2, 3, 0]), (IMAGE_SIZE - 10, IMAGE_SIZE + 90, [4])
+    ]
+    assert coalesce_extents(extents, max_gap=4096, max_read_size=8192) == [
+        (0, 5010, [1, 2, 3]), (8192, 8292, [0]),
+        (IMAGE_SIZE - 10, IMAGE_SIZE + 90, [4])
+    ]
+    assert coalesce_extents(extents, max_gap=0) == [
+        (0, 1024, [1, 2]), (5000, 5010, [3]), (8192, 8292, [0]),
+        (IMAGE_SIZE - 10, IMAGE_SIZE + 90, [4])
+    ]
+
+
+@stream.test
+def test_split_image_stream(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    base = path + '.split'
+    sizes = [1000, 1, 4096, 30000, IMAGE_SIZE - 35097]
+    segments = []
+    for i, size in enumerate(sizes):
+        segments.append('%s.%03d' % (base, i + 1))
+        with open(segments[-1], 'wb') as f:
+            f.write(data[sum(sizes[:i]):sum(sizes[:i + 1])])
+
+    try:
+        with SplitImageStream.from_first_segment(segments[0]) as s:
+            assert s.segment_paths == segments
+            assert s.size == IMAGE_SIZE
+
+            for offset, size in [(0, 10), (990, 20), (999, 4100),
+                                 (1001, 4096), (0, IMAGE_SIZE + 10),
+                                 (IMAGE_SIZE - 5, 10), (IMAGE_SIZE, 10)]:
+                buf = s.read_at(offset, size)
+                # bytes, whether the read crosses segments or not
+                assert type(buf) is bytes
+                assert buf == data[offset:offset + size]
+
+            s.seek(995)
+            buf = s.read(10)
+            assert type(buf) is bytes and buf == data[995:1005]
+            assert s.tell() == 1005
+            assert {buf: 1}[data[995:1005]] == 1
+    finally:
+        for segment in segments:
+            os.remove(segment)
+
+
+@stream.test
+def test_compressed_image_stream(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    for codec in ['zlib', 'lzma']:
+        compressed = '%s.%s' % (path, codec)
+        compress_image(path, compressed, codec=codec, chunk_size=3000,
+                       workers=2)
+
+        try:
+            assert CompressedImageStream.is_compressed_image(compressed)
+            assert not CompressedImageStream.is_compressed_image(path)
+
+            with CompressedImageStream(compressed, cache_size=6000) as s:
+                assert s.size == IMAGE_SIZE
+
+                for offset, size in [(0, 10), (2990, 20), (2999, 6002),
+                                     (IMAGE_SIZE - 5, 10), (IMAGE_SIZE, 10)]:
+                    assert bytes(s.read_at(offset, size)) == \
+                        data[offset:offset + size]
+                assert s.evictions > 0
+
+                s.seek(-4, os.SEEK_END)
+                assert bytes(s.read()) == data[-4:]
+                assert s.tell() == IMAGE_SIZE
+        finally:
+            os.remove(compressed)
+
+    # unknown codecs, asked for or read from the header
+    compressed = path + '.bad'
+    try:
+        compress_image(path, compressed, codec='bz2')
+    except ValueError as e:
+        assert 'bz2' in str(e)
+    else:
+        assert False
+
+    compress_image(path, compressed, chunk_size=3000)
+    try:
+        with open(compressed, 'r+b') as f:
+            f.seek(5)
+            f.write(b'\x7f')
+
+        try:
+            CompressedImageStream(compressed)
+        except ValueError as e:
+            assert 'codec 127' in str(e)
+        else:
+            assert False
+    finally:
+        os.remove(compressed)
+
+    # truncated or corrupt images, whose header claims more than the chunks
+    # hold, the index being cut or the chunks decompressing short
+    fd, raw = tempfile.mkstemp()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data[:3000])
+
+    try:
+        for chunk_size, header_chunk_size, size, truncate in [
+            (1024 * 1024, 1024 * 1024, 3072, False),
+            (1000, 4000, 3000, False),
+            (1000, 1000, 3001, False),
+            (1000, 1000, 3000, True),
+        ]:
+            compress_image(raw, compressed, chunk_size=chunk_size)
+            with open(compressed, 'r+b') as f:
+                f.seek(8)
+                f.write(struct.pack('<IQ', header_chunk_size, size))
+                if truncate:
+                    f.truncate(os.fstat(f.fileno()).st_size - 1)
+
+            try:
+                with CompressedImageStream(compressed) as s:
+                    s.read_at(2950, 100)
+            except ValueError as e:
+                assert 'truncated or corrupt' in str(e)
+            else:
+                assert False
+    finally:
+        os.remove(raw)
+        os.remove(compressed)
+
+
+@stream.test
+def test_instrumented_stream(path):
+    with InstrumentedStream(ImageStream(path)) as s:
+        s.read(512)
+        s.read(512)
+        s.seek(4096)
+        s.read(3)
+        s.read_at(0, 100)
+        s.seek(IMAGE_SIZE)
+        assert s.read(10) == b''
+
+        stats = s.stats()
+        assert stats['reads'] == 5
+        assert stats['seeks'] == 2
+        assert stats['bytes'] == 1127
+        assert stats['sequential'] == 1
+        assert stats['random'] == 4
+        assert stats['read_sizes'] == {1: 1, 4: 1, 128: 1, 512: 2}
+        assert sum(stats['latencies'].values()) == 5
+        assert 'reads: 5, seeks: 2' in s.report()
+
+        s.reset()
+        assert s.stats()['reads'] == 0
+
+
+if __name__ == '__main__':
+    stream.main()
@@ -0,0 +1,103 @@
+# encoding: utf-8
+import struct
+
+BYTES_PER_SECTOR = 512
+RESERVED_SECTORS = 32
+ROOT_CLUSTER = 2
+EOC = 0x0fffffff
+
+# 2025-01-01 12:00:00
+DATE, TIME = 0x5a21, 0x6000
+
+
+def short_entry(name, attribute=0x20, first_cluster=0, length=0):
+    base, _, extension = name.partition('.')
+    name = base.ljust(8) + extension.ljust(3)
+    return struct.pack('<11sBBBHHHHHHHI', name.encode('ascii'),
+                       attribute, 0, 0, TIME, DATE, DATE,
+                       first_cluster >> 16, TIME, DATE,
+                       first_cluster & 0xffff, length)
+
+
+class FAT32Image:
+    """
+    A small FAT32 image written from scratch, one sector per cluster. The
+    directories are given as nested dicts of their entries, the files being
+    `None`, e.g. `{'DIR': {'FILE.TXT': None}}`, and every file takes a
+    cluster. The names are read back in lower case.
+    """
+    def __init__(self, path, tree, sectors_per_fat=8):
+        """
+        :param path: path of the image, which is overwritten.
+        :param tree: the entries of the root directory.
+        :param sectors_per_fat: optional, size of each of the two FATs.
+        """
+
+        self.path = path
+        self.bytes_per_fat = sectors_per_fat * BYTES_PER_SECTOR
+        self.fat_offset = RESERVED_SECTORS * BYTES_PER_SECTOR
+        self.data_offset = self.fat_offset + 2 * self.bytes_per_fat
+
+        number_of_sectors = (RESERVED_SECTORS + 2 * sectors_per_fat +
+                             self.bytes_per_fat // 4 - 2)
+
+        with open(path, 'wb') as f:
+            f.truncate(number_of_sectors * BYTES_PER_SECTOR)
+
+            f.write(struct.pack('<3s8sHBHBHHBHHHIIIHHIHH12xBxBI11s8s',
+                                b'\xeb\x58\x90', b'MSWIN4.1',
+                                BYTES_PER_SECTOR, 1, RESERVED_SECTORS, 2,
+                                0, 0, 0xf8, 0, 63, 255, 0,
+                                number_of_sectors, sectors_per_fat, 0, 0,
+                                ROOT_CLUSTER, 1, 6, 0x80, 0x29, 0x1234,
+                                b'NO NAME    ', b'FAT32   ').ljust(510,
+                                                                   b'\0'))
+            f.write(b'\x55\xaa')
+            f.write(b'RRaA'.ljust(510, b'\0') + b'\x55\xaa')
+
+        self.fat = [0x0ffffff8, EOC]
+        # first clusters of the directories by path, e.g. /dir
+        self.directories = {}
+        self._write_directory('/', tree)
+
+        self.write_fat()
+
+    def _allocate(self, count):
+        first = len(self.fat)
+        self.fat.extend(range(first + 1, first + count))
+        self.fat.append(EOC)
+
+        return first
+
+    def _write_directory(self, path, tree):
+        first_cluster = self._allocate(max(1, -(-len(tree) // 16)))
+        self.directories[path] = first_cluster
+
+        entries = []
+        for name, subtree in tree.items():
+            if subtree is None:
+                entries.append(short_entry(name, 0x20, self._allocate(1),
+                                           BYTES_PER_SECTOR))
+            else:
+                cluster = self._write_directory(
+                    path.rstrip('/') + '/' + name.lower(), subtree
+                )
+                entries.append(short_entry(name, 0x10, cluster))
+
+        self.write_cluster(first_cluster, b''.join(entries))
+
+        return first_cluster
+
+    def write_cluster(self, cluster, data):
+        with open(self.path, 'r+b') as f:
+            f.seek(self.data_offset + (cluster - 2) * BYTES_PER_SECTOR)
+            f.write(data)
+
+    def write_fat(self):
+        """Write both FATs out of :attr:`fat`."""
+
+        items = struct.pack('<%dI' % len(self.fat), *self.fat)
+        with open(self.path, 'r+b') as f:
+            for i in range(2):
+                f.seek(self.fat_offset + i * self.bytes_per_fat)
+                f.write(items)
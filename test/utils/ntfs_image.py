@@ -0,0 +1,144 @@
+# encoding: utf-8
+import struct
+
+BYTES_PER_SECTOR = 512
+SECTORS_PER_CLUSTER = 8
+BYTES_PER_CLUSTER = BYTES_PER_SECTOR * SECTORS_PER_CLUSTER
+RECORD_SIZE = 1024
+MFT_LCN = 4
+ROOT = 5
+
+TIME = 131000000000000000
+
+SYSTEM_FILES = ['$MFT', '$MFTMirr', '$LogFile', '$Volume', '$AttrDef', '.',
+                '$Bitmap', '$Boot', '$BadClus', '$Secure', '$UpCase',
+                '$Extend']
+
+
+def attribute(type_, value):
+    size = 0x18 + len(value) + (-len(value)) % 8
+    return struct.pack('<IIBBHHHIHBB', type_, size, 0, 0, 0x18, 0, 0,
+                       len(value), 0x18, 0, 0) + \
+        value.ljust(size - 0x18, b'\0')
+
+
+def runlist(runs):
+    """Encode data runs given as (absolute LCN, length) tuples."""
+
+    out, previous = [], 0
+    for lcn, length in runs:
+        length = length.to_bytes(8, 'little').rstrip(b'\0')
+        n = 1
+        while not -(1 << 8 * n - 1) <= lcn - previous < 1 << 8 * n - 1:
+            n += 1
+        offset = (lcn - previous).to_bytes(n, 'little', signed=True)
+        out.append(bytes([n << 4 | len(length)]) + length + offset)
+        previous = lcn
+
+    return b''.join(out) + b'\0'
+
+
+def data_attribute(runs):
+    encoded = runlist(runs)
+    size = 0x40 + len(encoded) + (-len(encoded)) % 8
+    total = sum(length for _, length in runs)
+    return struct.pack('<IIBBHHHQQHB5sQQQ', 0x80, size, 1, 0, 0x40, 0, 0, 0,
+                       max(total - 1, 0), 0x40, 0, b'',
+                       total * BYTES_PER_CLUSTER, total * BYTES_PER_CLUSTER,
+                       total * BYTES_PER_CLUSTER) + \
+        encoded.ljust(size - 0x40, b'\0')
+
+
+def standard_information():
+    return attribute(0x10, struct.pack('<QQQQI', TIME, TIME + 1, TIME + 2,
+                                       TIME + 3, 0x20) + b'\0' * 0x24)
+
+
+def filename(name, parent, sequence_number):
+    return attribute(0x30, struct.pack('<QQQQQQQIIBB',
+                                       parent | sequence_number << 48, TIME,
+                                       TIME, TIME, TIME, 0, 0, 0x20, 0,
+                                       len(name), 1) +
+                     name.encode('utf-16-le'))
+
+
+def record(number, sequence_number, flags, attributes):
+    body = b''.join(attributes) + b'\xff\xff\xff\xff'
+    header = struct.pack('<IHHQHHHHIIQHHI', 0x454c4946, 0x30, 3, number,
+                         sequence_number, 1, 0x38, flags, 0x38 + len(body),
+                         RECORD_SIZE, 0, 3, 0, number)
+    buf = bytearray((header + b'\0' * 8 + body).ljust(RECORD_SIZE, b'\0'))
+    buf[0x30:0x32] = b'\x01\x00'
+    for i, end in enumerate((510, 1022)):
+        buf[0x32 + 2 * i:0x34 + 2 * i] = buf[end:end + 2]
+        buf[end:end + 2] = b'\x01\x00'
+
+    return bytes(buf)
+
+
+class NTFSImage:
+    """
+    A small NTFS image written from scratch, with an MFT of the system files
+    and of the given files, but no index nor bitmap.
+    """
+    def __init__(self, path, files, clusters=4096):
+        """
+        :param path: path of the image, which is overwritten.
+        :param files: (name, parent, is_directory, is_deleted, runs) tuples,
+                      `parent` being the index of the parent in `files` or
+                      `None` for the root, and `runs` the data runs as
+                      (absolute LCN, length) tuples, or `None` for resident
+                      data. The records are numbered from 16 in order, see
+                      :meth:`record_number`.
+        :param clusters: optional, size of the image.
+        """
+
+        self.path = path
+
+        count = 16 + len(files)
+        count += (-count) % (BYTES_PER_CLUSTER // RECORD_SIZE)
+        mft_runs = [(MFT_LCN, count * RECORD_SIZE // BYTES_PER_CLUSTER)]
+
+        records = []
+        for i, name in enumerate(SYSTEM_FILES):
+            attributes = [standard_information(), filename(name, ROOT, ROOT)]
+            if i == 0:
+                attributes.append(data_attribute(mft_runs))
+            records.append(record(i, ROOT if i == ROOT else 1,
+                                  3 if i == ROOT else 1, attributes))
+        records.extend([b'\0' * RECORD_SIZE] * (16 - len(records)))
+
+        for name, parent, is_directory, is_deleted, runs in files:
+            attributes = [standard_information(),
+                          filename(name, self.record_number(parent),
+                                   ROOT if parent is None else 1)]
+            if runs is not None:
+                attributes.append(data_attribute(runs))
+            else:
+                attributes.append(attribute(0x80, b'resident data'))
+            records.append(record(len(records), 1,
+                                  (not is_deleted) | is_directory << 1,
+                                  attributes))
+
+        with open(path, 'wb') as f:
+            f.truncate(clusters * BYTES_PER_CLUSTER)
+
+            f.write(struct.pack('<3s8sHBH5sB2s2s2s4s4s4sQQQb3sb3s8s4s',
+                                b'\xeb\x52\x90', b'NTFS    ',
+                                BYTES_PER_SECTOR, SECTORS_PER_CLUSTER, 0,
+                                b'', 0xf8, b'', b'', b'', b'', b'', b'',
+                                clusters * SECTORS_PER_CLUSTER - 1, MFT_LCN,
+                                2, -10, b'', 1, b'', b'12345678',
+                                b'').ljust(510, b'\0') + b'\x55\xaa')
+
+            f.seek(MFT_LCN * BYTES_PER_CLUSTER)
+            f.write(b''.join(records).ljust(count * RECORD_SIZE, b'\0'))
+
+    @staticmethod
+    def record_number(i):
+        """Get the record number of a file.
+
+        :param i: index of the file, `None` for the root.
+        """
+
+        return ROOT if i is None else 16 + i